@@ -0,0 +1,43 @@
+"""
+Compares the vectorized gen_data_sim1 against the per-sample loop it replaced.
+
+Run with: python benchmarks/bench_gen_data_sim1.py
+"""
+import time
+import numpy as np
+import tvc_benchmarker
+
+
+def gen_data_sim1_loop(params,mi=None):
+    # Reference copy of the per-sample AR(1) loop (tvc_benchmarker <= 1.0.2)
+    np.random.seed(params['randomseed'])
+    mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
+    x=np.zeros([2, params['n_samples']] + mi_num)
+    x = x.reshape([2,int(np.prod(x.shape)/2)])
+    for sim_it, mi_params in enumerate(mi_parameters):
+        d = dict(params)
+        for i in range(0,len(mi)):
+            d[mi[i]] = mi_params[i]
+        x_start = d['n_samples'] * sim_it
+        x_end = d['n_samples'] * (sim_it + 1)
+        w=np.random.multivariate_normal(d['mu'],d['sigma'],d['n_samples']).transpose()
+        x[:,x_start:x_end] = np.array(w)
+        for t in range(1,d['n_samples']):
+            x[:,(d['n_samples']*sim_it)+t]=d['alpha']*x[:,(d['n_samples']*sim_it)+t-1]+w[:,t]
+    return x
+
+
+def timeit(f,*args,**kwargs):
+    t0 = time.perf_counter()
+    out = f(*args,**kwargs)
+    return time.perf_counter()-t0, out
+
+
+if __name__ == '__main__':
+    print('n_samples   loop (s)   vectorized (s)   speedup   max abs diff')
+    for n_samples in [10**3, 10**4, 10**5, 10**6]:
+        params = {'mu':[0,0],'alpha':[0.2,0.5,0.8],'n_samples':n_samples,'sigma':[[1,0.5],[0.5,1]],'randomseed':2017}
+        t_loop, x_loop = timeit(gen_data_sim1_loop,dict(params),mi='alpha')
+        t_vec, df = timeit(tvc_benchmarker.gen_data_sim1,dict(params),mi='alpha')
+        diff = np.abs(df[['timeseries_1','timeseries_2']].values.transpose()-x_loop).max()
+        print('{:>9}   {:>8.3f}   {:>14.3f}   {:>7.1f}   {:.2e}'.format(n_samples,t_loop,t_vec,t_loop/t_vec,diff))
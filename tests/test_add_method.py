@@ -0,0 +1,53 @@
+import numpy as np
+import pandas as pd
+import pytest
+import tvc_benchmarker
+
+
+def data(n_nodes,n_configs=3,n_time=50):
+    rng = np.random.default_rng(0)
+    index = pd.MultiIndex.from_product([np.arange(n_configs)/10,np.arange(n_time)],names=['alpha','time'])
+    return pd.DataFrame(dict([('timeseries_' + str(n+1),rng.standard_normal(n_configs*n_time)) for n in range(n_nodes)]),index=index)
+
+
+def window_corr(ts,window=9):
+    # Sliding window correlation of the first two nodes (time is the last axis)
+    w = np.lib.stride_tricks.sliding_window_view(ts[...,:2,:],window,axis=-1)
+    w = w - w.mean(axis=-1,keepdims=True)
+    return (w[...,0,:,:]*w[...,1,:,:]).sum(-1)/np.sqrt((w[...,0,:,:]**2).sum(-1)*(w[...,1,:,:]**2).sum(-1))
+
+
+def test_batch_method_all_nodes():
+    x = data(3)
+    shapes = []
+    @tvc_benchmarker.batch_method(alignment=lambda p: int((p['window']-1)/2))
+    def batch(ts,window=9):
+        shapes.append(ts.shape)
+        return window_corr(ts,window)
+    def single(ts,window=9):
+        return window_corr(ts,window)
+    profile = []
+    out = tvc_benchmarker.calc_new_method(x,batch,{'name': None, 'params': {'window': 9}},profile=profile)
+    assert shapes == [(3,3,50)]
+    assert len(profile) == 1 and profile[0]['method'] == 'batch' and profile[0]['configurations'] == 3
+    # The same as calling the method one configuration at a time
+    expected = tvc_benchmarker.calc_new_method(x,single,{'name': 'single', 'params': {'window': 9}})
+    assert out.shape == (150,)
+    assert np.allclose(out,expected,rtol=0,atol=1e-12,equal_nan=True)
+    assert np.array_equal(np.isnan(out),np.isnan(expected))
+
+
+def test_batch_method_node_matrix():
+    x = data(2)
+    @tvc_benchmarker.batch_method(alignment=4)
+    def batch(ts):
+        r = window_corr(ts)
+        return np.broadcast_to(r[:,None,None,:],(r.shape[0],2,2,r.shape[1]))
+    out = tvc_benchmarker.calc_new_method(x,batch,{'name': 'batch', 'params': {}})
+    expected = tvc_benchmarker.calc_new_method(x,window_corr,{'name': 'single', 'params': {}})
+    assert np.allclose(out,expected,rtol=0,atol=1e-12,equal_nan=True)
+    @tvc_benchmarker.batch_method()
+    def wrong(ts):
+        return ts[:,0,0]
+    with pytest.raises(ValueError):
+        tvc_benchmarker.calc_new_method(x,wrong,{'name': 'wrong', 'params': {}})
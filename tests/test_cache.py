@@ -0,0 +1,48 @@
+import os
+import time
+import numpy as np
+import tvc_benchmarker
+
+
+def save_model(dat_dir,file_name,beta):
+    tvc_benchmarker.save_trace(os.path.join(dat_dir,file_name + '.trace'),{'beta': beta})
+    with open(os.path.join(dat_dir,file_name + '_traceplot.png'),'wb') as f:
+        f.write(b'png')
+
+
+def test_model_key():
+    x = np.arange(10.)
+    key = tvc_benchmarker.model_key(x,x,'conjugate_model',{'samples': 100})
+    assert key == tvc_benchmarker.model_key(x.astype(np.float32),list(x),'conjugate_model',{'samples': 100})
+    assert key != tvc_benchmarker.model_key(x,x,'conjugate_model',{'samples': 200})
+    assert key != tvc_benchmarker.model_key(x,x[::-1],'conjugate_model',{'samples': 100})
+
+
+def test_cache_round_trip(tmp_path):
+    cache_dir, dat_dir, out_dir = [str(tmp_path / d) for d in ['cache','dat','out']]
+    os.makedirs(dat_dir)
+    os.makedirs(out_dir)
+    save_model(dat_dir,'model',np.arange(5.))
+    assert not tvc_benchmarker.cache_get(cache_dir,'key',out_dir,'model')
+    tvc_benchmarker.cache_put(cache_dir,'key',dat_dir,'model')
+    assert tvc_benchmarker.cache_get(cache_dir,'key',out_dir,'copy')
+    assert np.array_equal(tvc_benchmarker.load_trace(os.path.join(out_dir,'copy.trace'))['beta'],np.arange(5.))
+    assert os.path.exists(os.path.join(out_dir,'copy_traceplot.png'))
+    # Not writable destination: a cache miss
+    assert not tvc_benchmarker.cache_get(cache_dir,'key',os.path.join(out_dir,'missing'),'copy')
+
+
+def test_cache_lru_eviction(tmp_path):
+    cache_dir, dat_dir = str(tmp_path / 'cache'), str(tmp_path / 'dat')
+    os.makedirs(dat_dir)
+    for i in range(3):
+        save_model(dat_dir,'model' + str(i),np.random.default_rng(i).standard_normal(10000))
+        tvc_benchmarker.cache_put(cache_dir,'key' + str(i),dat_dir,'model' + str(i),cache_size=2**30)
+        # Distinct last use times
+        os.utime(os.path.join(cache_dir,'key' + str(i)),(time.time()-100+i,time.time()-100+i))
+    # Reading key0 makes key1 the least recently used
+    assert tvc_benchmarker.cache_get(cache_dir,'key0',dat_dir,'read')
+    size = sum([os.path.getsize(os.path.join(root,f)) for root, _, files in os.walk(cache_dir) for f in files])
+    evicted = tvc_benchmarker.cache_evict(cache_dir,size-1)
+    assert evicted == ['key1']
+    assert sorted(os.listdir(cache_dir)) == ['key0','key2']
@@ -0,0 +1,60 @@
+import copy
+import numpy as np
+import tvc_benchmarker
+
+
+def test_sim4_chunks_sufficient_stats():
+    # sim-4 has list valued multi index parameters (state_length)
+    sim = copy.deepcopy(tvc_benchmarker.load_params('1.0')['simulation'][3])
+    sim['params']['n_samples'] = 600
+    dfc_params = {0: {'method': 'SW', 'name': 'SW-15', 'params': {'sw_window': 15}},
+                  1: {'method': 'JC', 'name': 'JC', 'params': {}},
+                  2: {'method': 'MTD', 'name': 'MTD', 'params': {'mtd_window': 7}}}
+    chunks = lambda: tvc_benchmarker.gen_data_chunks(sim,chunk_size=200)
+    stats = tvc_benchmarker.sufficient_stats(tvc_benchmarker.dfc_calc_chunks(chunks,dfc_params))
+    assert sorted(stats) == [((2,3,4,5,6),),((20,30,40,50,60),)]
+    for mi_params in stats:
+        assert sorted(stats[mi_params]) == ['JC','MTD','SW-15']
+        assert all([0 < s[0] <= 600 for s in stats[mi_params].values()])
+
+
+def test_chunks_equal_batch():
+    # Odd and even windows, and a chunk size that does not divide n_samples
+    sim = copy.deepcopy(tvc_benchmarker.load_params('1.0')['simulation'][1])
+    sim['params']['n_samples'] = 600
+    dfc_params = {0: {'method': 'SW', 'name': 'SW-15', 'params': {'sw_window': 15}},
+                  1: {'method': 'SW', 'name': 'SW-16', 'params': {'sw_window': 16}},
+                  2: {'method': 'TSW', 'name': 'TSW-15', 'params': {'sw_window': 15}},
+                  3: {'method': 'TSW', 'name': 'TSW-16', 'params': {'sw_window': 16}},
+                  4: {'method': 'JC', 'name': 'JC', 'params': {}},
+                  5: {'method': 'MTD', 'name': 'MTD-7', 'params': {'mtd_window': 7}},
+                  6: {'method': 'MTD', 'name': 'MTD-8', 'params': {'mtd_window': 8}}}
+    data = tvc_benchmarker.gen_data(sim)
+    config_index = tvc_benchmarker.ConfigIndex(data.index,sim['multi_index'])
+    dfc = tvc_benchmarker.dfc_calc_batch(data,dfc_params,mi=sim['multi_index'],config_index=config_index)
+    chunks = lambda: tvc_benchmarker.gen_data_chunks(sim,chunk_size=137)
+    n_chunks = 0
+    for mi_params, chunk in tvc_benchmarker.dfc_calc_chunks(chunks,dfc_params):
+        rows = config_index.slice(mi_params)
+        for name in dfc.columns:
+            batch = np.asarray(dfc[name])[rows][chunk['time']]
+            assert np.array_equal(np.isnan(chunk[name]),np.isnan(batch)), name
+            assert np.allclose(chunk[name],batch,rtol=0,atol=1e-12,equal_nan=True), name
+        n_chunks += 1
+    assert n_chunks == 5*len(config_index)
+
+
+def test_chunks_window_sweep():
+    sim = copy.deepcopy(tvc_benchmarker.load_params('1.0')['simulation'][1])
+    sim['params']['n_samples'] = 300
+    sim['params']['alpha'] = [0]
+    sim['params']['covar_sigma'] = [0.1]
+    dfc_params = {0: {'method': 'SW', 'name': 'SW', 'params': {'sw_window': [15,29]}},
+                  1: {'method': 'MTD', 'name': 'MTD', 'params': {'mtd_window': [7,8]}}}
+    data = tvc_benchmarker.gen_data(sim)
+    dfc = tvc_benchmarker.dfc_calc_batch(data,dfc_params,mi=sim['multi_index'])
+    chunks = list(tvc_benchmarker.dfc_calc_chunks(lambda: tvc_benchmarker.gen_data_chunks(sim,chunk_size=100),dfc_params))
+    assert list(dfc.columns) == ['SW-15','SW-29','MTD-7','MTD-8']
+    for name in dfc.columns:
+        chunked = np.concatenate([chunk[name] for mi_params, chunk in chunks])
+        assert np.allclose(chunked,np.asarray(dfc[name]),rtol=0,atol=1e-12,equal_nan=True), name
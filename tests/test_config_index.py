@@ -0,0 +1,44 @@
+import copy
+import numpy as np
+import pandas as pd
+import pytest
+import tvc_benchmarker
+
+
+def frame(alpha,n=5):
+    index = pd.MultiIndex.from_product([alpha,[0.1,0.2],np.arange(n)],names=['alpha','covar_sigma','time'])
+    return pd.DataFrame({'x': np.arange(len(index),dtype=float)},index=index)
+
+
+def test_unused_levels():
+    df = frame([0,0.5]).drop(0.5,level='alpha')
+    config_index = tvc_benchmarker.ConfigIndex(df.index)
+    assert len(config_index) == 2
+    assert np.array_equal(config_index.view(df,'x',(0,0.2)),np.arange(5,10))
+
+
+def test_unsorted_parameters():
+    df = frame([0.5,0])
+    config_index = tvc_benchmarker.ConfigIndex(df.index)
+    assert config_index.mi_parameters[0] == (0.5,0.1)
+    assert np.array_equal(config_index.view(df,'x',(0,0.1)),np.arange(10,15))
+    assert np.array_equal(config_index.array(df,'x')[2],np.arange(10,15))
+    sorted_index = tvc_benchmarker.ConfigIndex(df.sort_index().index)
+    assert np.array_equal(sorted_index.view(df.sort_index(),'x',(0,0.1)),np.arange(10,15))
+
+
+def test_not_contiguous():
+    df = frame([0,0.5]).sort_index(level='time')
+    with pytest.raises(ValueError,match='contiguous'):
+        tvc_benchmarker.ConfigIndex(df.index)
+
+
+def test_gen_data_unsorted_dfc():
+    sim = copy.deepcopy(tvc_benchmarker.load_params('1.0')['simulation'][1])
+    sim['params']['n_samples'] = 200
+    sim['params']['alpha'] = [0.5,0]
+    data = tvc_benchmarker.gen_data(sim)
+    dfc_params = {0: {'method': 'SW', 'name': 'SW-15', 'params': {'sw_window': 15}}}
+    dfc = tvc_benchmarker.dfc_calc_batch(data,dfc_params,mi=sim['multi_index'])
+    ref = tvc_benchmarker.dfc_calc_batch(data.sort_index(),dfc_params,mi=sim['multi_index'])
+    assert np.allclose(dfc.sort_index().values,ref.values,equal_nan=True)
@@ -0,0 +1,54 @@
+import copy
+import os
+import numpy as np
+import tvc_benchmarker
+
+
+def nig_posterior(x,y,m0,v0,a0,b0):
+    # Normal-Inverse-Gamma posterior of y = X @ coef + e, e ~ N(0, sigma**2), from the design matrix
+    X = np.stack([np.ones(len(x)),x],axis=1)
+    v0_inv = np.linalg.inv(v0)
+    vn = np.linalg.inv(v0_inv + X.T @ X)
+    mn = vn @ (v0_inv @ m0 + X.T @ y)
+    an = a0 + len(y)/2
+    bn = b0 + 0.5*(y @ y + m0 @ v0_inv @ m0 - mn @ np.linalg.inv(vn) @ mn)
+    return mn, vn, an, bn
+
+
+def test_conjugate_posterior_closed_form():
+    rng = np.random.default_rng(3)
+    x = rng.standard_normal(40)*2 + 1
+    y = 0.5*x + rng.standard_normal(40)
+    prior = {'alpha_mu': 0.2, 'beta_mu': -0.3, 'alpha_sd': 0.5, 'beta_sd': 2, 'sigma_sd': 1.5}
+    stats = np.array([len(x),x.sum(),y.sum(),(x*y).sum(),(x*x).sum(),(y*y).sum()])
+    posterior = tvc_benchmarker.conjugate_posterior(stats,**prior)
+    mn, vn, an, bn = nig_posterior(tvc_benchmarker.standerdize(x),tvc_benchmarker.standerdize(y),
+                                   np.array([prior['alpha_mu'],prior['beta_mu']]),np.diag([prior['alpha_sd'],prior['beta_sd']])**2,2,prior['sigma_sd']**2)
+    assert np.allclose(posterior['mean'],mn,rtol=1e-12)
+    assert np.allclose(posterior['cov'],vn,rtol=1e-12)
+    assert np.isclose(posterior['shape'],an,rtol=1e-12)
+    assert np.isclose(posterior['scale'],bn,rtol=1e-12)
+    # Draws: sigma**2 ~ IG(an, bn), coef | sigma**2 ~ N(mn, sigma**2 vn)
+    samples = tvc_benchmarker.conjugate_samples(posterior,samples=200000,randomseed=0)
+    assert np.isclose(np.mean(samples['sigma']**2),bn/(an-1),rtol=1e-2)
+    assert np.allclose([np.mean(samples['alpha']),np.mean(samples['beta'])],mn,atol=1e-2)
+    assert np.isclose(np.var(samples['beta']),vn[1,1]*bn/(an-1),rtol=2e-2)
+
+
+def test_conjugate_model_dfc_calc_waic(tmp_path):
+    sim = copy.deepcopy(tvc_benchmarker.load_params('1.0')['simulation'][1])
+    sim['params']['n_samples'] = 200
+    sim['params']['alpha'] = [0]
+    sim['params']['covar_sigma'] = [0.1]
+    dfc_params = {0: {'method': 'SW', 'name': 'SW-15', 'params': {'sw_window': 15}},
+                  1: {'method': 'JC', 'name': 'JC', 'params': {}}}
+    data = tvc_benchmarker.gen_data(sim)
+    dfc = tvc_benchmarker.dfc_calc_batch(data,dfc_params,mi=sim['multi_index']).dropna()
+    tvc_benchmarker.model_dfc(data,dfc,str(tmp_path),sim['name'],bayes_model='conjugate_model',mi=sim['multi_index'],model_params={'samples': 2000, 'randomseed': 1})
+    names = sorted([f for f in os.listdir(str(tmp_path)) if f.endswith('.trace')])
+    assert len(names) == 2
+    assert all([tvc_benchmarker.load_model(str(tmp_path),n).attrs['engine'] == 'conjugate' for n in names])
+    waic = tvc_benchmarker.calc_waic(dfc,str(tmp_path),str(tmp_path),file_prefix=sim['name'],mi=sim['multi_index'])
+    assert waic.shape == (2,3)
+    assert np.all(np.isfinite(waic))
+    assert len([f for f in os.listdir(str(tmp_path)) if 'waictable' in f]) == 1
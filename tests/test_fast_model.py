@@ -0,0 +1,32 @@
+import numpy as np
+import pytest
+import tvc_benchmarker
+import tvc_benchmarker.dfc_evaluate
+
+
+def data(n=500):
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal(n)
+    return x, 0.3*x + rng.standard_normal(n)
+
+
+def test_fast_model_laplace():
+    x, y = data()
+    trace, model = tvc_benchmarker.fast_model(x,y,samples=2000,randomseed=1)
+    assert model['engine'] == 'laplace'
+    assert model['diagnostics']['accepted']
+    assert len(trace['beta']) == 2000
+
+
+def test_fast_model_no_fallback_failed_diagnostics():
+    x, y = data()
+    trace, model = tvc_benchmarker.fast_model(x,y,samples=2000,randomseed=1,k_threshold=-1,fallback=False)
+    assert not model['diagnostics']['accepted']
+    assert len(trace['beta']) == 2000
+
+
+def test_fast_model_no_fallback_no_draws(monkeypatch):
+    x, y = data()
+    monkeypatch.setattr(tvc_benchmarker.dfc_evaluate,'laplace_fit',lambda stats,**priors: (np.zeros(3),np.diag(np.full(3,np.nan)),False))
+    with pytest.raises(ValueError,match='covariance is not finite'):
+        tvc_benchmarker.fast_model(x,y,samples=2000,fallback=False)
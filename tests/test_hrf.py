@@ -0,0 +1,20 @@
+import numpy as np
+import tvc_benchmarker
+
+
+def test_hrf_kernel_per_node_names():
+    params = {'n_samples': 200, 'hrf_onsets': [10,60,120], 'hrf_durations': 5}
+    mixed = tvc_benchmarker.get_data.hrf_mean(dict(params,hrf_kernel=['hrf_TR2','canonical']),2)
+    tr2 = tvc_benchmarker.get_data.hrf_mean(dict(params,hrf_kernel='hrf_TR2'),2)
+    canonical = tvc_benchmarker.get_data.hrf_mean(dict(params,hrf_kernel='canonical'),2)
+    assert mixed.shape == (2,200)
+    assert np.allclose(mixed[0],tr2[0])
+    assert np.allclose(mixed[1],canonical[1])
+
+
+def test_hrf_kernel_per_node_name_and_array():
+    params = {'n_samples': 200, 'hrf_onsets': [10,60,120], 'hrf_durations': 5}
+    kernel = [0.2,0.5,0.3]
+    mixed = tvc_benchmarker.get_data.hrf_mean(dict(params,hrf_kernel=['canonical',kernel]),2)
+    shared = tvc_benchmarker.get_data.hrf_mean(dict(params,hrf_kernel=kernel),2)
+    assert np.allclose(mixed[1],shared[1])
@@ -0,0 +1,27 @@
+import os
+import numpy as np
+from tvc_benchmarker.dfc_calc import jackknife_corrs, jc_variants
+
+# Reference correlations of teneto (derive, postpro 'no') for a fixed pair of time series
+REFERENCE = np.load(os.path.join(os.path.dirname(__file__),'data','jackknife_corrs.npz'))
+
+
+def test_jackknife_corrs_reference():
+    x = REFERENCE['x']
+    r = jackknife_corrs(x[0],x[1])
+    assert r.shape == (x.shape[1],)
+    # teneto reverses the sign of the leave-one-out correlation (as jc_variants)
+    assert np.allclose(-r,REFERENCE['jc'],rtol=0,atol=1e-12)
+    jc = jc_variants(x[:1],x[1:],[{}])[0][0]
+    assert np.allclose(jc,np.arctanh(REFERENCE['jc']),rtol=0,atol=1e-12)
+
+
+def test_jackknife_corrs_leave_one_out():
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal([3,50])
+    y = rng.standard_normal([3,50])
+    stacked = jackknife_corrs(x,y)
+    for i in range(3):
+        for t in [0,25,49]:
+            keep = np.arange(50) != t
+            assert np.isclose(stacked[i,t],np.corrcoef(x[i,keep],y[i,keep])[0,1],rtol=0,atol=1e-12)
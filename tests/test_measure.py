@@ -0,0 +1,41 @@
+import copy
+import numpy as np
+import tvc_benchmarker
+
+
+def test_measure_calls_once():
+    calls = []
+    def func(n):
+        calls.append(n)
+        return np.ones(n)
+    result, cost = tvc_benchmarker.measure(func,10**6)
+    assert len(calls) == 1
+    assert len(result) == 10**6
+    assert cost['peak_memory'] >= 8*10**6
+    assert cost['traced']
+
+
+def test_measure_untraced_timing():
+    calls = []
+    result, cost = tvc_benchmarker.measure(lambda: calls.append(1),untraced_timing=True)
+    assert len(calls) == 2
+    assert not cost['traced']
+
+
+def test_profile_methods_repeats(capsys):
+    sim = copy.deepcopy(tvc_benchmarker.load_params('1.0')['simulation'][1])
+    sim['params']['alpha'] = [0]
+    sim['params']['covar_sigma'] = [0.1,0.2]
+    dfc_params = {0: {'method': 'SW', 'name': 'SW-15', 'params': {'sw_window': 15}},
+                  1: {'method': 'JC', 'name': 'JC', 'params': {}}}
+    profile, costs = tvc_benchmarker.profile_methods(sim,dfc_params,n_samples=[200,400],repeats=2)
+    assert 'scaling fit is unreliable' in capsys.readouterr().out
+    assert len(profile) == 2*2*2*2
+    assert sorted(profile['repeat'].unique()) == [0,1]
+    # The fastest repeat is reported
+    for _, row in costs.iterrows():
+        m = profile[(profile['method'] == row['method']) & (profile['n_samples'] == 400)]
+        assert row['wall_time'] == m.groupby('repeat')['wall_time'].median().min()
+    assert list(costs['method']) == ['SW-15','JC']
+    tvc_benchmarker.profile_methods(sim,dfc_params,n_samples=[100,200,400],repeats=1)
+    assert 'WARNING' not in capsys.readouterr().out
@@ -0,0 +1,31 @@
+import os
+import numpy as np
+import pandas as pd
+import tvc_benchmarker
+from tvc_benchmarker.dfc_calc import mtds
+
+# Reference coupling of teneto (derive, postpro 'no') for a fixed pair of time series
+REFERENCE = np.load(os.path.join(os.path.dirname(__file__),'data','mtds.npz'))
+
+
+def test_mtds_reference():
+    x = REFERENCE['x']
+    windows = list(REFERENCE['windows'])
+    out = mtds(x[0],x[1],windows)
+    for window, r in zip(windows,out):
+        assert r.shape == (x.shape[1]-window,)
+        assert np.allclose(r,REFERENCE['mtd_' + str(window)],rtol=0,atol=1e-12), window
+
+
+def test_mtd_alignment():
+    # dfc_calc_batch places value i of mtds at time point i + alignment, with NaN elsewhere
+    x = REFERENCE['x']
+    n = x.shape[1]
+    data = pd.DataFrame({'timeseries_1': x[0], 'timeseries_2': x[1]})
+    for window in list(REFERENCE['windows']):
+        dfc_params = {0: {'method': 'MTD', 'name': 'MTD', 'params': {'mtd_window': int(window)}}}
+        dfc = np.asarray(tvc_benchmarker.dfc_calc_batch(data,dfc_params,mi=[])['MTD'])
+        start = tvc_benchmarker.dfc_methods['MTD']['alignment']({'mtd_window': int(window)})
+        assert dfc.shape == (n,)
+        assert np.all(np.isnan(dfc[:start])) and np.all(np.isnan(dfc[start+n-window:]))
+        assert np.allclose(dfc[start:start+n-window],REFERENCE['mtd_' + str(window)],rtol=0,atol=1e-12), window
@@ -0,0 +1,62 @@
+import copy
+import numpy as np
+import tvc_benchmarker
+
+DFC_PARAMS = {0: {'method': 'SW', 'name': 'SW', 'params': {'sw_window': [15,16]}},
+              1: {'method': 'TSW', 'name': 'TSW-15', 'params': {'sw_window': 15, 'taper_name': 'norm', 'taper_properties': [0,10]}},
+              2: {'method': 'JC', 'name': 'JC', 'params': {}},
+              3: {'method': 'MTD', 'name': 'MTD', 'params': {'mtd_window': [7,8]}}}
+
+
+def simulation(k,precision,n_samples=400):
+    sim = copy.deepcopy(tvc_benchmarker.load_params('1.0')['simulation'][k])
+    sim['params']['n_samples'] = n_samples
+    sim['params']['precision'] = precision
+    return sim
+
+
+def test_float32_generation():
+    for k in range(4):
+        data = {}
+        for precision in ['float64','float32']:
+            sim = simulation(k,precision)
+            data[precision] = tvc_benchmarker.gen_data(sim,output='array')
+            # The chunks are generated the same way
+            chunks = list(tvc_benchmarker.gen_data_chunks(sim,chunk_size=130))
+            configs = list(dict.fromkeys([c[0] for c in chunks]))
+            chunked = np.stack([np.concatenate([chunk['timeseries'] for config, chunk in chunks if config == c],axis=-1) for c in configs])
+            assert chunked.dtype == np.dtype(precision)
+            assert np.array_equal(chunked,data[precision]['timeseries'])
+        for key in ['timeseries','covariance_parameter','covariance_mean']:
+            if key in data['float32']:
+                assert data['float32'][key].dtype == np.float32
+                assert np.allclose(data['float32'][key],data['float64'][key],rtol=0,atol=1e-5)
+
+
+def test_float32_dfc():
+    dfc = {}
+    for precision in ['float64','float32']:
+        sim = simulation(1,precision)
+        data = tvc_benchmarker.gen_data(sim)
+        dfc[precision] = tvc_benchmarker.dfc_calc_batch(data,DFC_PARAMS,mi=sim['multi_index'])
+        assert all(dfc[precision].dtypes == np.dtype(precision))
+        # Chunked and batch DFC agree in either precision
+        config_index = tvc_benchmarker.ConfigIndex(data.index,sim['multi_index'])
+        for mi_params, chunk in tvc_benchmarker.dfc_calc_chunks(lambda: tvc_benchmarker.gen_data_chunks(sim,chunk_size=130),DFC_PARAMS):
+            rows = config_index.slice(mi_params)
+            for name in dfc[precision].columns:
+                assert chunk[name].dtype == np.dtype(precision)
+                batch = np.asarray(dfc[precision][name])[rows][chunk['time']]
+                assert np.allclose(chunk[name],batch,rtol=0,atol=1e-5,equal_nan=True), name
+    assert np.allclose(dfc['float32'].values,dfc['float64'].values,rtol=0,atol=1e-5,equal_nan=True)
+
+
+def test_precision_report():
+    sim = simulation(1,'float64')
+    sim['params']['alpha'] = [0]
+    sim['params']['covar_sigma'] = [0.1]
+    report = tvc_benchmarker.precision_report(sim,DFC_PARAMS)
+    assert len(report) == 6
+    assert np.all(np.abs(report['beta_difference']) < 1e-5)
+    assert np.all(np.abs(report['waic_difference']) < 1e-2)
+    assert np.array_equal(report['rank_float64'],report['rank_float32'])
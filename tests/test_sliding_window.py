@@ -0,0 +1,27 @@
+import os
+import numpy as np
+from tvc_benchmarker.dfc_calc import sliding_window_corr, sliding_window_corrs
+
+# Reference correlations of teneto (derive, postpro 'no') for a fixed pair of time series
+REFERENCE = np.load(os.path.join(os.path.dirname(__file__),'data','sliding_window_corrs.npz'))
+
+
+def test_sliding_window_corrs_reference():
+    x = REFERENCE['x']
+    windows = list(REFERENCE['windows'])
+    out = sliding_window_corrs(x[0],x[1],windows)
+    for window, r in zip(windows,out):
+        assert r.shape == (x.shape[1]-window+1,)
+        assert np.allclose(r,REFERENCE['sw_' + str(window)],rtol=0,atol=1e-12), window
+        assert np.allclose(sliding_window_corr(x[0],x[1],window),r,rtol=0,atol=0)
+
+
+def test_sliding_window_corrs_leading_axes():
+    # Several pairs at once give the same result as one pair at a time
+    rng = np.random.default_rng(0)
+    x = rng.standard_normal([3,100])
+    y = rng.standard_normal([3,100])
+    stacked = sliding_window_corrs(x,y,[10])[0]
+    for i in range(3):
+        assert np.allclose(stacked[i],sliding_window_corr(x[i],y[i],10),rtol=0,atol=1e-12)
+    assert sliding_window_corrs(x,y,[101])[0].shape == (3,0)
@@ -0,0 +1,76 @@
+import os
+import numpy as np
+import pytest
+import tvc_benchmarker
+
+
+def variables():
+    rng = np.random.default_rng(0)
+    return {'beta': rng.standard_normal(1000), 'loglik': rng.standard_normal([50,300]).astype(np.float32), 'n': np.array(3)}
+
+
+@pytest.mark.parametrize('compression',['zlib',None])
+def test_trace_round_trip(tmp_path,compression):
+    path = str(tmp_path / 'model.trace')
+    v = variables()
+    tvc_benchmarker.save_trace(path,v,attrs={'engine': 'conjugate'},compression=compression,chunk_size=1000)
+    trace = tvc_benchmarker.load_trace(path)
+    assert trace.version == tvc_benchmarker.trace.TRACE_VERSION
+    assert trace.attrs == {'engine': 'conjugate'}
+    assert sorted(trace.variables) == ['beta','loglik','n']
+    # Several chunks along the last axis
+    assert len(trace.meta['loglik']['chunks']) == 15
+    chunks = list(trace.chunks('loglik'))
+    assert all([c.shape[0] == 50 for c in chunks])
+    if compression is None:
+        assert all([isinstance(c,np.memmap) for c in chunks])
+    for key in v:
+        assert trace[key].dtype == v[key].dtype
+        assert np.array_equal(trace[key],v[key])
+    # Overwriting replaces the trace
+    tvc_benchmarker.save_trace(path,{'beta': np.zeros(3)},compression=compression)
+    assert tvc_benchmarker.load_trace(path).variables == ['beta']
+    assert [f for f in os.listdir(str(tmp_path)) if f.startswith('.')] == []
+
+
+def test_trace_lazy(tmp_path):
+    path = str(tmp_path / 'model.trace')
+    tvc_benchmarker.save_trace(path,variables(),chunk_size=1000)
+    trace = tvc_benchmarker.load_trace(path)
+    # Only the chunks of the variable that is read are opened
+    for chunk in trace.meta['loglik']['chunks']:
+        os.remove(os.path.join(path,chunk['file']))
+    assert np.array_equal(trace['beta'],variables()['beta'])
+    with pytest.raises(KeyError):
+        trace['alpha']
+
+
+def test_trace_version(tmp_path):
+    path = str(tmp_path / 'model.trace')
+    tvc_benchmarker.save_trace(path,{'beta': np.zeros(3)})
+    with open(os.path.join(path,'meta.json')) as f:
+        meta = f.read()
+    with open(os.path.join(path,'meta.json'),'w') as f:
+        f.write(meta.replace('"version": 1','"version": 99'))
+    with pytest.raises(ValueError):
+        tvc_benchmarker.load_trace(path)
+
+
+def test_model_trace_and_legacy_pickle(tmp_path):
+    rng = np.random.default_rng(1)
+    x = rng.standard_normal(500)
+    y = 0.3*x + rng.standard_normal(500)
+    tm = tvc_benchmarker.conjugate_model(x,y,samples=2000,randomseed=0)
+    tvc_benchmarker.save_model_trace(str(tmp_path),'model',tm,x,y,loglik_draws=500)
+    trace = tvc_benchmarker.load_model(str(tmp_path),'model')
+    assert isinstance(trace,tvc_benchmarker.Trace)
+    assert trace.attrs == {'engine': 'conjugate', 'chains': 1, 'n': 500}
+    assert trace['loglik'].shape == (500,500)
+    assert trace['loglik'].dtype == np.float32
+    assert np.array_equal(tvc_benchmarker.posterior_values(trace,'beta',burn=100),tm[0]['beta'])
+    assert np.allclose(tvc_benchmarker.model_waic(trace)[:2],tm[1]['waic'][:2],rtol=1e-2)
+    # Pickles of earlier versions
+    tvc_benchmarker.save_bayes_model(str(tmp_path),'legacy',tm)
+    legacy = tvc_benchmarker.load_model(str(tmp_path),'legacy')
+    assert np.array_equal(tvc_benchmarker.posterior_values(legacy,'beta'),tm[0]['beta'])
+    assert np.array_equal(tvc_benchmarker.model_waic(legacy),tm[1]['waic'])
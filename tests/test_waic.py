@@ -0,0 +1,49 @@
+import numpy as np
+import tvc_benchmarker
+
+# Reference values from arviz 0.23 (waic, loo with reff=1, compare; deviance scale) for the log likelihoods of loglik()
+REFERENCE = [[191.11051357967415, 32.66544238787123, 2.7707211359966513, 190.98458624497076, 32.535998966958175, 0.48788561300753547],
+             [196.91808540926596, 30.785902750037387, 2.4543789220662977, 197.46017343259643, 31.265419835420172, 0.9056632207591794],
+             [202.09013429080946, 23.364537364575675, 1.274894700149925, 202.0745243966434, 23.34501245511449, 0.22118790302047173]]
+DELTA = [[0.0, 0.0], [5.807571829591801, 4.858138750906035], [10.979620711135322, 11.298964346761698]]
+
+
+def loglik(samples=400,n=60):
+    # Three models of the same data, one time point an outlier (large Pareto k)
+    rng = np.random.default_rng(2024)
+    x = rng.standard_normal(n)
+    y = 0.5*x + rng.standard_normal(n)
+    y[0] += 6
+    out = []
+    for b, s in [(0.5,1.0),(0.2,1.1),(0.0,1.3)]:
+        beta = b + 0.05*rng.standard_normal(samples)
+        sigma = s*np.exp(0.05*rng.standard_normal(samples))
+        out.append(-0.5*np.log(2*np.pi*sigma[:,None]**2) - (y[None]-beta[:,None]*x[None])**2/(2*sigma[:,None]**2))
+    return np.stack(out)
+
+
+def test_waic_compare_reference():
+    ic = tvc_benchmarker.waic_compare(loglik())
+    computed = np.stack([ic['waic'],ic['waic_se'],ic['p_waic'],ic['loo'],ic['loo_se'],ic['pareto_k_max']],axis=1)
+    assert np.allclose(computed,REFERENCE,rtol=1e-10,atol=0)
+    assert np.allclose(np.stack([ic['delta_waic'],ic['delta_waic_se']],axis=1),DELTA,rtol=1e-10,atol=1e-12)
+    assert np.allclose(ic['pairwise_se'],ic['pairwise_se'].transpose())
+
+
+def test_waic_compare_chunks():
+    ll = loglik()
+    whole = tvc_benchmarker.waic_compare(ll)
+    chunked = tvc_benchmarker.waic_compare(iter([ll[:,:,i:i+7] for i in range(0,ll.shape[-1],7)]))
+    for key in whole:
+        assert np.allclose(whole[key],chunked[key],rtol=1e-12)
+    waic = tvc_benchmarker.waic_loglik(iter([ll[1,:,i:i+7] for i in range(0,ll.shape[-1],7)]))
+    assert np.allclose(waic,REFERENCE[1][:3],rtol=1e-10)
+
+
+def test_psis_weights():
+    ll = loglik()[1]
+    log_weights, pareto_k = tvc_benchmarker.psis_weights(-ll)
+    assert np.allclose(np.exp(log_weights).sum(axis=0),1)
+    assert np.isclose(pareto_k.max(),REFERENCE[1][5],rtol=1e-10)
+    pointwise = tvc_benchmarker.pointwise_ic(ll)
+    assert np.allclose(pointwise['pareto_k'],pareto_k)
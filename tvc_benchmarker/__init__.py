@@ -5,12 +5,15 @@
 __author__ = "William Hedley Thompson (wiheto)"
 __version__ = "1.0.2" #Peer reviewed version is 1.0
 #
-from tvc_benchmarker.get_data import gen_data_sim1,gen_data_sim2,gen_data_sim3,gen_data_sim4, load_data, gen_data
-from tvc_benchmarker.dfc_calc import dfc_calc
-from tvc_benchmarker.dfc_evaluate import bayes_model,save_bayes_model,load_bayes_model,calc_waic, model_dfc, trace_plot
-from tvc_benchmarker.misc import check_params,standerdize, square_axis, autocorr, panel_letters, get_discrete_colormap, multiindex_preproc, load_params
+from tvc_benchmarker.get_data import gen_data_sim1,gen_data_sim2,gen_data_sim3,gen_data_sim4, load_data, gen_data, gen_data_chunks
+from tvc_benchmarker.dfc_calc import dfc_calc, dfc_calc_chunks, dfc_calc_batch, dfc_calc_edges, dfc_methods
+from tvc_benchmarker.trace import save_trace, load_trace, Trace
+from tvc_benchmarker.cache import model_key, cache_get, cache_put, cache_evict
+from tvc_benchmarker.dfc_evaluate import bayes_model, regression_model, fast_model, log_posterior, laplace_fit, approximation_diagnostics, conjugate_model, conjugate_posterior, conjugate_samples, loglik_blocks, waic_loglik, pointwise_ic, psis_weights, pareto_tail_fit, compare_ic, waic_compare, loglik_chunks, waic_samples, model_waic, posterior_values, trace_samples, save_model_trace, load_model, save_bayes_model,load_bayes_model,calc_waic, model_dfc, trace_plot, sufficient_stats, suffstats_regression, precision_report
+from tvc_benchmarker.misc import check_params,standerdize, square_axis, autocorr, panel_letters, get_discrete_colormap, multiindex_preproc, load_params, config_rng, unit_seed, atomic_write, precision_dtype, config_blocks, process_map, limit_blas_threads, measure, shared_array, attach_shared, ConfigIndex
 from tvc_benchmarker.plot import plot_betadfc_distribution, plot_fluctuating_covariance, plot_method_correlation, plot_dfc_timeseries,plot_timeseries
-from tvc_benchmarker.add_method import calc_new_method
+from tvc_benchmarker.add_method import calc_new_method, batch_method
+from tvc_benchmarker.cost import profile_methods, scaling_fit
 from tvc_benchmarker.run import run_simulations
 from tvc_benchmarker.send_method import send_method
 import __main__
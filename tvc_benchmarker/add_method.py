@@ -1,8 +1,44 @@
 import numpy as np
 import tvc_benchmarker
 
-def calc_new_method(x,new_method,params_new_method=None,mi='alpha'):
+def batch_method(alignment=0):
+    """
+    Decorator declaring that a new method uses the batch calling convention of calc_new_method.
 
+    **Input**
+
+    :alignment: time point of the first output value. Integer, or function(params) of the method's parameters (as 'alignment' in tvc_benchmarker.dfc_methods). E.g. a centred window of length params['window'] has alignment lambda p: int((p['window']-1)/2).
+
+    The decorated function is called once, with an array of shape (configurations x nodes x time) of all timeseries_* columns (node 0 = timeseries_1) followed by its parameters. It must return an array of shape (configurations x time), the connectivity of timeseries_1 and timeseries_2, or (configurations x nodes x nodes x time), from which [:,0,1] is used. Value i of each configuration is placed at time point alignment + i, and time points without a value are NaN.
+
+    e.g.
+        @tvc_benchmarker.batch_method(alignment=lambda p: int((p['window']-1)/2))
+        def new_method(x,window=20):
+            ...
+    """
+    def declare(new_method):
+        new_method.batch = True
+        new_method.alignment = alignment
+        return new_method
+    return declare
+
+
+def calc_new_method(x,new_method,params_new_method=None,mi='alpha',config_index=None,profile=None):
+    """
+    Calculates a new DFC method for every configuration of x.
+
+    **Input**
+
+    :x: dataframe from gen_data.
+    :new_method: function. By default it is called once per configuration with a (2 x time) array of timeseries_1 and timeseries_2 followed by params_new_method['params'], and the output is padded with NaN (centred) to the length of the configuration. If it is declared with batch_method, it is called once for all configurations with a (configurations x nodes x time) array of all timeseries_* columns and its output is aligned as declared (see batch_method).
+    :params_new_method: dictionary with 'name' and 'params' (see run_simulations).
+    :config_index: (optional) tvc_benchmarker.ConfigIndex of x. Built from x.index if not given.
+    :profile: (optional) list. If given, the cost of each call of new_method is appended to it, as in tvc_benchmarker.dfc_calc_batch. A batch method is called once, and its record has the number of configurations and no multi index values.
+
+    **Returns**
+
+    :dfc_estimate: array with one value per row of x.
+    """
 
     if params_new_method['name'] == None:
         params_new_method['name'] = new_method.__name__
@@ -15,22 +51,49 @@ def calc_new_method(x,new_method,params_new_method=None,mi='alpha'):
     if x.index.names == ['time']:
         mi = []
 
-    params = {}
-    for m in mi:
-        params[m] = np.unique(x.index.get_level_values(m))
-    mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
+    if config_index is None:
+        config_index = tvc_benchmarker.ConfigIndex(x.index,mi)
 
 
-    dfc_estimate=[]
+    if getattr(new_method,'batch',False):
+        # Views of the time series, shape (configurations, time). All configurations must have the same length
+        n_nodes = len([c for c in x.columns if c.startswith('timeseries_')])
+        ts = np.stack([config_index.array(x,'timeseries_' + str(n+1)) for n in range(n_nodes)],axis=1)
+        if profile is None:
+            tmp = np.asarray(new_method(ts,**params_new_method['params']))
+        else:
+            tmp, cost = tvc_benchmarker.measure(new_method,ts,**params_new_method['params'])
+            tmp = np.asarray(tmp)
+            record = {'method': params_new_method['name'], 'n_samples': ts.shape[-1], 'configurations': ts.shape[0]}
+            record.update(cost)
+            profile.append(record)
+        if tmp.ndim == 4:
+            tmp = tmp[:,0,1]
+        if tmp.ndim != 2 or tmp.shape[0] != ts.shape[0]:
+            raise ValueError('a batch method must return an array of shape (configurations x time) or (configurations x nodes x nodes x time)')
+        alignment = new_method.alignment
+        start = alignment(params_new_method['params']) if callable(alignment) else int(alignment)
+        stop = min(start+tmp.shape[-1],ts.shape[-1])
+        dfc_estimate = np.zeros([ts.shape[0],ts.shape[-1]]) * np.nan
+        dfc_estimate[:,start:stop] = tmp[:,:stop-start]
+        return dfc_estimate.flatten()
 
-    for sim_it, mi_params in enumerate(mi_parameters):
+    dfc_estimate=[]
 
-        if mi_params == ():
-            mi_params = np.arange(0,len(x))
+    for sim_it, mi_params in enumerate(config_index.mi_parameters):
 
-        time_points = int(len(x.index.get_level_values('time'))/len(mi_parameters))
+        time_points = config_index.stop[sim_it] - config_index.start[sim_it]
 
-        tmp=np.array(new_method(np.array([x['timeseries_1'][mi_params],x['timeseries_2'][mi_params]]),**params_new_method['params']))
+        ts = np.array([config_index.view(x,'timeseries_1',mi_params),config_index.view(x,'timeseries_2',mi_params)])
+        if profile is None:
+            tmp=np.array(new_method(ts,**params_new_method['params']))
+        else:
+            tmp, cost = tvc_benchmarker.measure(new_method,ts,**params_new_method['params'])
+            tmp=np.array(tmp)
+            record = dict(zip(config_index.mi,mi_params))
+            record.update({'method': params_new_method['name'], 'n_samples': time_points, 'configurations': 1})
+            record.update(cost)
+            profile.append(record)
         # Fix the output in case it is no node,node,time (for full entire timeseries)
         if len(tmp)!=time_points:
             window=int((time_points-len(tmp))/2)
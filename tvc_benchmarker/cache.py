@@ -0,0 +1,111 @@
+import tvc_benchmarker
+import numpy as np
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+
+
+def model_key(x,y,bayes_model,model_params):
+    """
+    Content hash of one model fit: the data (x, y), the model function name, its parameters (priors and sampler settings, including randomseed) and the package version.
+
+    **Returns**
+
+    :key: hexadecimal sha256 string. Fits with the same key give the same posterior (up to sampler randomness if no randomseed is given).
+    """
+    h = hashlib.sha256()
+    h.update(json.dumps({'version': tvc_benchmarker.__version__, 'bayes_model': bayes_model, 'model_params': model_params},sort_keys=True,default=str).encode())
+    for v in [x,y]:
+        v = np.ascontiguousarray(np.asarray(v,dtype=float))
+        h.update(str(v.shape).encode())
+        h.update(v.tobytes())
+    return h.hexdigest()
+
+
+def cache_get(cache_dir,key,dat_dir,file_name):
+    """
+    Copies a cached model (trace and trace plot) to dat_dir/file_name, if the cache contains key.
+
+    **Returns**
+
+    :hit: True if the model was found. Its last use is then updated (see cache_evict).
+    """
+    entry = os.path.join(cache_dir,key)
+    if not os.path.isdir(entry):
+        return False
+    tmp = None
+    try:
+        # Copy to a temporary directory, then rename (as save_trace)
+        tmp = tempfile.mkdtemp(prefix='.' + file_name + '.trace.',dir=dat_dir)
+        shutil.rmtree(tmp)
+        shutil.copytree(os.path.join(entry,'model.trace'),tmp)
+        tvc_benchmarker.atomic_write(dat_dir + '/' + file_name + '_traceplot.png',lambda path: shutil.copyfile(os.path.join(entry,'traceplot.png'),path))
+    except (OSError, shutil.Error):
+        # Evicted by another process while copying, or dat_dir is not writable: a cache miss
+        if tmp is not None:
+            shutil.rmtree(tmp,ignore_errors=True)
+        return False
+    path = dat_dir + '/' + file_name + '.trace'
+    if os.path.exists(path):
+        shutil.rmtree(path)
+    os.rename(tmp,path)
+    now = time.time()
+    os.utime(entry,(now,now))
+    return True
+
+
+def cache_put(cache_dir,key,dat_dir,file_name,cache_size=2**30):
+    """
+    Adds the model saved as dat_dir/file_name (trace and trace plot) to the cache under key, then evicts least recently used models until the cache is at most cache_size bytes (see cache_evict).
+    """
+    os.makedirs(cache_dir,exist_ok=True)
+    entry = os.path.join(cache_dir,key)
+    if not os.path.isdir(entry):
+        tmp = tempfile.mkdtemp(prefix='.' + key + '.',dir=cache_dir)
+        try:
+            shutil.copytree(dat_dir + '/' + file_name + '.trace',os.path.join(tmp,'model.trace'))
+            shutil.copyfile(dat_dir + '/' + file_name + '_traceplot.png',os.path.join(tmp,'traceplot.png'))
+            os.rename(tmp,entry)
+        except OSError:
+            # Another process added the same key first
+            shutil.rmtree(tmp,ignore_errors=True)
+    cache_evict(cache_dir,cache_size)
+
+
+def cache_evict(cache_dir,cache_size=2**30):
+    """
+    Deletes the least recently used (added or read) models until the cache is at most cache_size bytes.
+
+    **Returns**
+
+    :evicted: list of the deleted keys.
+    """
+    entries = []
+    for key in os.listdir(cache_dir):
+        entry = os.path.join(cache_dir,key)
+        # Skip temporary directories of unfinished writes
+        if key.startswith('.') or not os.path.isdir(entry):
+            continue
+        size = 0
+        for root, _, files in os.walk(entry):
+            for f in files:
+                try:
+                    size += os.path.getsize(os.path.join(root,f))
+                except OSError:
+                    pass
+        try:
+            entries.append((os.path.getmtime(entry),size,key))
+        except OSError:
+            pass
+    total = sum([e[1] for e in entries])
+    evicted = []
+    for _, size, key in sorted(entries):
+        if total <= cache_size:
+            break
+        shutil.rmtree(os.path.join(cache_dir,key),ignore_errors=True)
+        total -= size
+        evicted.append(key)
+    return evicted
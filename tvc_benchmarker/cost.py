@@ -0,0 +1,99 @@
+import tvc_benchmarker
+import copy
+import numpy as np
+import pandas as pd
+import tabulate
+
+
+def profile_methods(simparams,dfc_params,n_samples=[1000,2000,4000,8000],repeats=3,new_method=None,params_new_method=None,save_dir=None,file_prefix=None):
+    """
+    Measures the computational cost of the DFC methods over a ladder of time series lengths.
+
+    **Input**
+
+    :simparams: simulation dictionary (as params['simulation'][i]). The simulation is generated once per value of n_samples.
+    :dfc_params: DFC methods (as params['dfc']). See dfc_calc_batch.
+    :n_samples: list of time series lengths. The scaling fit needs at least three lengths spanning a factor of 4 or more (e.g. the default) to be meaningful; a warning is printed otherwise.
+    :repeats: number of times every method is measured at each n_samples (on the same data). The fastest repeat is used, which removes most of the timing noise (e.g. other processes, first call caches).
+    :new_method: (optional) function or list of functions. See calc_new_method.
+    :params_new_method: (optional) parameters of the new methods (as in run_simulations).
+    :save_dir: (optional) where to save the tables (e.g. next to the WAIC tables of calc_waic).
+    :file_prefix: (optional) prefix of the saved tables.
+
+    **Returns**
+
+    :profile: dataframe with the cost of every method, configuration, n_samples and repeat (see the profile argument of dfc_calc_batch).
+    :costs: dataframe with one row per method: the median wall time, cpu time and peak memory per configuration (of the fastest repeat) at the largest n_samples, and the fit of wall time ~ coefficient * n_samples^exponent (see scaling_fit).
+
+    If save_dir is given, profile is saved as [file_prefix]_cost_profile.csv and costs as the markdown table [file_prefix]_costtable.md.
+    """
+    if file_prefix:
+        file_prefix += '_'
+    else:
+        file_prefix = ''
+    if new_method and not isinstance(new_method,list):
+        new_method = [new_method]
+    if params_new_method:
+        params_new_method = tvc_benchmarker.check_params(params_new_method,'dfc')
+
+    if len(np.unique(n_samples)) < 3 or max(n_samples) < 4*min(n_samples):
+        print('TVC BENCHMARKER WARNING: n_samples has fewer than three lengths or spans less than a factor of 4. The scaling fit is unreliable.')
+
+    profile = []
+    for n in n_samples:
+        sim = copy.deepcopy(simparams)
+        sim['params']['n_samples'] = n
+        data = tvc_benchmarker.gen_data(sim)
+        config_index = tvc_benchmarker.ConfigIndex(data.index,sim['multi_index'])
+        for repeat in range(repeats):
+            records = []
+            tvc_benchmarker.dfc_calc_batch(data,dfc_params,config_index=config_index,profile=records)
+            if new_method:
+                for i,nm in enumerate(new_method):
+                    tvc_benchmarker.calc_new_method(data,nm,params_new_method['dfc'][i],config_index=config_index,profile=records)
+            for record in records:
+                record['repeat'] = repeat
+            profile += records
+    profile = pd.DataFrame(profile)
+
+    # Cost per configuration (a batch method is called once for all configurations)
+    per_config = profile.copy()
+    for key in ['wall_time','cpu_time','peak_memory']:
+        per_config[key] = per_config[key]/per_config['configurations']
+    # Median over configurations, then the fastest repeat
+    median = per_config.groupby(['method','n_samples','repeat'],sort=False)[['wall_time','cpu_time','peak_memory']].median()
+    median = median.groupby(['method','n_samples'],sort=False).min().reset_index()
+    rows = []
+    for method, m in median.groupby('method',sort=False):
+        fit = scaling_fit(m['n_samples'].values,m['wall_time'].values)
+        largest = m.loc[m['n_samples'].idxmax()]
+        rows.append({'method': method, 'n_samples': int(largest['n_samples']), 'wall_time': largest['wall_time'], 'cpu_time': largest['cpu_time'],
+                     'peak_memory_mb': largest['peak_memory']/2**20, 'exponent': fit['exponent'], 'coefficient': fit['coefficient']})
+    costs = pd.DataFrame(rows)
+
+    if save_dir:
+        profile.to_csv(save_dir + '/' + file_prefix + 'cost_profile.csv',index=False)
+        mdtable = tabulate.tabulate(costs,headers='keys',tablefmt='simple',showindex=False)
+        with open(save_dir + '/' + file_prefix + 'costtable.md','w') as f:
+            f.write(mdtable)
+        print(mdtable)
+
+    return profile, costs
+
+
+def scaling_fit(n_samples,times):
+    """
+    Least squares fit of times = coefficient * n_samples^exponent (a straight line on log-log axes).
+
+    **Returns**
+
+    :fit: dictionary with exponent and coefficient. E.g. an exponent of 1 means linear scaling in n_samples, 2 quadratic. NaN if fewer than two distinct n_samples.
+    """
+    n_samples = np.asarray(n_samples,dtype=float)
+    times = np.asarray(times,dtype=float)
+    if len(np.unique(n_samples)) < 2:
+        return {'exponent': np.nan, 'coefficient': np.nan}
+    # Timer resolution: avoid log(0)
+    times = np.maximum(times,1e-9)
+    exponent, intercept = np.polyfit(np.log(n_samples),np.log(times),1)
+    return {'exponent': exponent, 'coefficient': np.exp(intercept)}
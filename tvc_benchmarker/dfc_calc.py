@@ -2,31 +2,47 @@ import teneto
 import tvc_benchmarker
 import numpy as np
 import pandas as pd
-def dfc_calc(data,methods=['SW','TSW','SD','JC','TD'],sw_window=63,taper_name='norm',taper_properties=[0,10],sd_distance='euclidean',mtd_window=7,mi='alpha',colind=None):
+import scipy.stats as sps
+import scipy.fft
+import itertools
+import os
+def dfc_calc(data,methods=['SW','TSW','SD','JC','MTD'],sw_window=63,taper_name='norm',taper_properties=[0,10],sd_distance='euclidean',mtd_window=7,mi='alpha',colind=None,config_index=None,jobs=1,out_dir=None,edge_block=None):
     """
     Required parameters for the various differnet methods:
 
     If method == 'SW'
-        sw_window = [Integer]
+        sw_window = [Integer or list]
             Length of sliding window
+        Calculated for all configurations at once with running sums (see sliding_window_corrs), so the cost does not depend on sw_window.
 
     If method == 'TSW'
-        sw_window = [Integer]
+        sw_window = [Integer or list]
             Length of sliding window
         taper_name = [string]
             Name of scipy.stats distribution used (see teneto.derive.derive for more information)
-        taper_properties = [list]
+        taper_properties = [list or list of lists]
             List of the different scipy.stats.[taper_name] properties. E.g. if taper_name = 'norm'; taper_properties = [0,10] with me the mean and standard deviation of the distribution.
+        Every combination of window and taper properties is calculated from one FFT of the time series and their products (see tapered_window_corrs).
+
+    A list of windows (or of taper properties) gives one column per variant, named e.g. SW-15, MTD-7, TSW-15 or TSW-15-0_10 (window 15, taper properties [0,10]; only when a list of taper properties is given). A single window gives the columns SW, TSW and MTD.
+    All methods are calculated in a single pass by dfc_calc_batch.
     If method == 'SD'
         sd_distance = [string]
             Distance funciton used to calculate the similarity between time-points. Can be any of the distances functions in scipy.spatial.distance.
     if method == 'JC'
         There are no parmaeters, have empty dictionary as parameter input.
+        Calculated in closed form for all configurations at once (see jackknife_corrs).
     if method == 'MTD'
-        mtd_window= [Integer]
+        mtd_window= [Integer or list]
             Length of window
+        Calculated for all configurations at once (see mtds).
 
     # mi='alpha'
+
+    config_index: (optional) tvc_benchmarker.ConfigIndex of data. Built from data.index and mi if not given.
+    jobs: number of processes (see dfc_calc_batch).
+
+    out_dir: (optional) if given, every pair of nodes of N-node data is calculated (N(N-1)/2 edges) and written to memory-mapped files in out_dir, edge_block edges at a time. Returns edges and a dictionary of (edges x time) arrays instead of a dataframe (see dfc_calc_edges).
     """
 
     # If data is a string, load precalcuated data
@@ -52,162 +68,629 @@ def dfc_calc(data,methods=['SW','TSW','SD','JC','TD'],sw_window=63,taper_name='n
         if isinstance(methods,str):
             methods = [methods]
 
-        if isinstance(mi,str):
-            mi = [mi]
-
-        dfc={}
-        params = {}
-        for m in mi:
-            params[m] = np.unique(data.index.get_level_values(m))
-        mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
-
-
-        #Sliding window
-        if 'SW' in methods:
-
-            dfc['SW'] = []
-
-            dfc_params={}
-            dfc_params['windowsize']=sw_window
-            dfc_params['method'] = 'slidingwindow'
-            dfc_params['dimord'] = 'node,time'
-            dfc_params['postpro'] = 'fisher'
-            dfc_params['report'] = 'no'
-
-            if mi_parameters[0]:
-                # Do this if there are multiple mi parameters
-                for sim_it, mi_params in enumerate(mi_parameters):
-                    ts1 = data['timeseries_1'][mi_params]
-                    ts2 = data['timeseries_2'][mi_params]
-                    connectivity = teneto.derive.derive(np.array([ts1,ts2]),dfc_params)[0,1,:]
-                    dfc['SW'].append(np.lib.pad(connectivity,int((sw_window-1)/2),mode='constant',constant_values=np.nan))
-            # Otherwise do this
-            else:
-                ts1 = data['timeseries_1']
-                ts2 = data['timeseries_2']
-                connectivity = teneto.derive.derive(np.array([ts1,ts2]),dfc_params)[0,1,:]
-                dfc['SW'].append(np.lib.pad(connectivity,int((sw_window-1)/2),mode='constant',constant_values=np.nan))
-            # Line up all appened arrays
-            dfc['SW'] = np.concatenate(dfc['SW'])
-
-
-        #Tapered sliding window
-        if 'TSW' in methods:
-
-            dfc['TSW'] = []
-
-            dfc_params={}
-            dfc_params['windowsize']=sw_window
-            dfc_params['distribution']=taper_name
-            dfc_params['distribution_params']=taper_properties
-            dfc_params['method'] = 'taperedslidingwindow'
-            dfc_params['dimord'] = 'node,time'
-            dfc_params['postpro'] = 'fisher'
-            dfc_params['report'] = 'no'
-
-            if mi_parameters[0]:
-                # Do this if there are multiple mi parameters
-                for sim_it, mi_params in enumerate(mi_parameters):
-                    ts1 = data['timeseries_1'][mi_params]
-                    ts2 = data['timeseries_2'][mi_params]
-                    connectivity = teneto.derive.derive(np.array([ts1,ts2]),dfc_params)[0,1,:]
-                    dfc['TSW'].append(np.lib.pad(connectivity,int((sw_window-1)/2),mode='constant',constant_values=np.nan))
-            # Otherwise do this
-            else:
-                ts1 = data['timeseries_1']
-                ts2 = data['timeseries_2']
-                connectivity = teneto.derive.derive(np.array([ts1,ts2]),dfc_params)[0,1,:]
-                dfc['TSW'].append(np.lib.pad(connectivity,int((sw_window-1)/2),mode='constant',constant_values=np.nan))
-            # Line up all appened arrays
-            dfc['TSW'] = np.concatenate(dfc['TSW'])
-
-        #Spatial distance
-        if 'SD' in methods:
-
-            dfc['SD'] = []
-
-            dfc_params={}
-            dfc_params['distance']='euclidean'
-            dfc_params['method'] = 'spatialdistance'
-            dfc_params['dimord'] = 'node,time'
-            dfc_params['postpro'] = 'fisher'
-            dfc_params['report'] = 'no'
-
-            if mi_parameters[0]:
-                # Do this if there are multiple mi parameters
-                for sim_it, mi_params in enumerate(mi_parameters):
-                    ts1 = data['timeseries_1'][mi_params]
-                    ts2 = data['timeseries_2'][mi_params]
-                    connectivity = teneto.derive.derive(np.array([ts1,ts2]),dfc_params)[0,1,:]
-                    dfc['SD'].append(connectivity)
-            # Otherwise do this
-            else:
-                ts1 = data['timeseries_1']
-                ts2 = data['timeseries_2']
-                connectivity = teneto.derive.derive(np.array([ts1,ts2]),dfc_params)[0,1,:]
-                dfc['SD'].append(connectivity)
-            # Line up all appened arrays
-            dfc['SD'] = np.concatenate(dfc['SD'])
-
-
-        #Jackknife
-        if 'JC' in methods:
-
-            dfc['JC'] = []
-
-            dfc_params={}
-            dfc_params['method'] = 'jackknife'
-            dfc_params['dimord'] = 'node,time'
-            dfc_params['postpro'] = 'fisher'
-            dfc_params['report'] = 'no'
-
-            if mi_parameters[0]:
-                # Do this if there are multiple mi parameters
-                for sim_it, mi_params in enumerate(mi_parameters):
-                    ts1 = data['timeseries_1'][mi_params]
-                    ts2 = data['timeseries_2'][mi_params]
-                    connectivity = teneto.derive.derive(np.array([ts1,ts2]),dfc_params)[0,1,:]
-                    dfc['JC'].append(connectivity)
-            # Otherwise do this
-            else:
-                ts1 = data['timeseries_1']
-                ts2 = data['timeseries_2']
-                connectivity = teneto.derive.derive(np.array([ts1,ts2]),dfc_params)[0,1,:]
-                dfc['JC'].append(connectivity)
-            # Line up all appened arrays
-            dfc['JC'] = np.concatenate(dfc['JC'])
-
-
-        #Temporal derivative
-        if 'MTD' in methods:
-
-            dfc['TD'] = []
-
-            dfc_params={}
-            dfc_params['method'] = 'mtd'
-            dfc_params['dimord'] = 'node,time'
-            dfc_params['postpro'] = 'no'
-            dfc_params['windowsize'] = mtd_window
-            dfc_params['report'] = 'no'
-
-            if mi_parameters[0]:
-                # Do this if there are multiple mi parameters
-                for sim_it, mi_params in enumerate(mi_parameters):
-                    ts1 = data['timeseries_1'][mi_params]
-                    ts2 = data['timeseries_2'][mi_params]
-                    connectivity = teneto.derive.derive(np.array([ts1,ts2]),dfc_params)[0,1,:]
-                    dfc['TD'].append(np.lib.pad(np.hstack([np.nan,connectivity]),int((mtd_window-1)/2),mode='constant',constant_values=np.nan))
-            # Otherwise do this
-            else:
-                ts1 = data['timeseries_1']
-                ts2 = data['timeseries_2']
-                connectivity = teneto.derive.derive(np.array([ts1,ts2]),dfc_params)[0,1,:]
-                dfc['TD'].append(np.lib.pad(np.hstack([np.nan,connectivity]),int((mtd_window-1)/2),mode='constant',constant_values=np.nan))
-            # Line up all appened arrays
-            dfc['TD'] = np.concatenate(dfc['TD'])
-
-
-
-
-        df = pd.DataFrame(data=dfc, index=data.index)
+        method_params = {'sw_window': sw_window, 'taper_name': taper_name, 'taper_properties': taper_properties, 'sd_distance': sd_distance, 'mtd_window': mtd_window}
+        dfc_params = {}
+        for method in dfc_methods:
+            if method in methods:
+                params = dict([(key,method_params[key]) for key in dfc_methods[method]['params']])
+                dfc_params[len(dfc_params)] = {'name': method, 'method': method, 'params': params}
+
+        if out_dir:
+            return dfc_calc_edges(data,dfc_params,out_dir,mi=mi,config_index=config_index,edge_block=edge_block)
+        df = dfc_calc_batch(data,dfc_params,mi=mi,config_index=config_index,jobs=jobs)
     return df
+
+
+
+def fisher(r):
+    """
+    Fisher transform of correlation values. As in teneto, values within 1e-14 of +/-1 (rounding errors) are set to +/-1.
+    """
+    r = np.where(r>0.99999999999999,1,np.where(r<-0.99999999999999,-1,r))
+    with np.errstate(divide='ignore'):
+        return np.arctanh(r)
+
+
+def variants(value,depth=0):
+    """
+    Returns value as a list of variants. value is a single variant if it has depth levels of nesting (0: scalar, 1: list), otherwise it is a list of variants.
+    """
+    if np.ndim(value) == depth:
+        return [value]
+    return list(value)
+
+
+def cumulative_sums(x):
+    """
+    Cumulative sums along the last axis of x, starting with 0. Window sums are differences of these. Accumulated in float64, also for float32 x.
+    """
+    c = np.zeros(x.shape[:-1] + (x.shape[-1]+1,))
+    np.cumsum(x,axis=-1,dtype=c.dtype,out=c[...,1:])
+    return c
+
+
+def window_sums(x,window):
+    """
+    Sum of every window of length window along the last axis of x (via cumulative sums, so the cost does not depend on window).
+
+    Returns an array with x.shape[-1]-window+1 values on the last axis.
+    """
+    c = cumulative_sums(x)
+    return c[...,window:] - c[...,:-window]
+
+
+def sliding_window_corr(x,y,window):
+    """
+    Pearson correlation between x and y in every window of length window along the last axis.
+
+    Uses running sums, so the cost is O(T) regardless of window. Returns an array with x.shape[-1]-window+1 values on the last axis.
+    """
+    return sliding_window_corrs(x,y,[window])[0]
+
+
+def sliding_window_corrs(x,y,windows):
+    """
+    Sliding window correlation (see sliding_window_corr) for several window lengths. The cumulative sums of x, y and their products are computed once and shared by all windows.
+
+    Returns a list with one array per window.
+    """
+    # Demean to keep the running sums small
+    x = x - x.mean(axis=-1,keepdims=True)
+    y = y - y.mean(axis=-1,keepdims=True)
+    c = cumulative_sums(np.stack([x,y,x*y,x*x,y*y]))
+    out = []
+    for window in windows:
+        if x.shape[-1]<window:
+            out.append(np.zeros(x.shape[:-1] + (0,)))
+            continue
+        sx, sy, sxy, sxx, syy = c[...,window:] - c[...,:-window]
+        cov = sxy - sx*sy/window
+        varx = sxx - sx*sx/window
+        vary = syy - sy*sy/window
+        out.append(cov/np.sqrt(varx*vary))
+    return out
+
+
+def taper_weights(window,taper_name,taper_properties):
+    """
+    Weights of the tapered sliding window (same as teneto): the pdf of scipy.stats.[taper_name] with taper_properties, evaluated on a window centered at 0. Normalised to sum to 1.
+    """
+    x = np.arange(-(window-1)/2,window/2)
+    taper = getattr(sps,taper_name).pdf(x,*taper_properties)
+    return taper/taper.sum()
+
+
+def tapered_window_corr(x,y,taper):
+    """
+    Weighted Pearson correlation between x and y in every window of length len(taper) along the last axis.
+
+    Returns an array with x.shape[-1]-len(taper)+1 values on the last axis.
+    """
+    window = len(taper)
+    if x.shape[-1]<window:
+        return np.zeros(x.shape[:-1] + (0,))
+    xw = np.lib.stride_tricks.sliding_window_view(x,window,axis=-1)
+    yw = np.lib.stride_tricks.sliding_window_view(y,window,axis=-1)
+    mx = xw @ taper
+    my = yw @ taper
+    cov = (xw*yw) @ taper - mx*my
+    varx = (xw*xw) @ taper - mx*mx
+    vary = (yw*yw) @ taper - my*my
+    return cov/np.sqrt(varx*vary)
+
+
+def tapered_window_corrs(x,y,tapers):
+    """
+    Tapered sliding window correlation (see tapered_window_corr) for several tapers.
+
+    The weighted window sums of x, y and their products are cross-correlations with the taper. These are calculated with one FFT of the (demeaned) series and products, shared by all tapers, and one inverse FFT per taper. The FFTs are calculated in float64, also for float32 x and y.
+
+    Returns a list with one array per taper.
+    """
+    n_time = x.shape[-1]
+    n_fft = scipy.fft.next_fast_len(n_time + max([len(taper) for taper in tapers]) - 1,real=True)
+    x = x - x.mean(axis=-1,keepdims=True)
+    y = y - y.mean(axis=-1,keepdims=True)
+    spectra = scipy.fft.rfft(np.stack([x,y,x*y,x*x,y*y]).astype(float,copy=False),n=n_fft,axis=-1)
+    out = []
+    for taper in tapers:
+        window = len(taper)
+        if n_time<window:
+            out.append(np.zeros(x.shape[:-1] + (0,)))
+            continue
+        sums = scipy.fft.irfft(spectra * scipy.fft.rfft(taper[::-1],n=n_fft),n=n_fft,axis=-1)[...,window-1:n_time]
+        mx, my, mxy, mxx, myy = sums
+        cov = mxy - mx*my
+        varx = mxx - mx*mx
+        vary = myy - my*my
+        out.append(cov/np.sqrt(varx*vary))
+    return out
+
+
+def jackknife_corr(x,y,n,sx,sy,sxx,syy,sxy):
+    """
+    Leave-one-out Pearson correlation. For each (x[t], y[t]), the correlation of all n samples except t, computed from the sums over all n samples (sx = sum(x), sxy = sum(x*y), ...).
+    """
+    m = n-1
+    mx = (sx-x)/m
+    my = (sy-y)/m
+    cov = (sxy-x*y)/m - mx*my
+    varx = (sxx-x*x)/m - mx*mx
+    vary = (syy-y*y)/m - my*my
+    return cov/np.sqrt(varx*vary)
+
+
+def jackknife_corrs(x,y):
+    """
+    Leave-one-out Pearson correlation (see jackknife_corr) at every time point of x and y (last axis). Leading axes (e.g. configurations or node pairs) are calculated at once.
+
+    The sums over time are computed once, and each time point's contribution is subtracted from them, so the cost is O(T). The sums are accumulated in float64, also for float32 x and y.
+    """
+    # Demean to keep the sums small
+    x = x - x.mean(axis=-1,keepdims=True)
+    y = y - y.mean(axis=-1,keepdims=True)
+    n = x.shape[-1]
+    sums = [np.sum(v,axis=-1,keepdims=True,dtype=float) for v in [x,y,x*x,y*y,x*y]]
+    return jackknife_corr(x,y,n,*sums)
+
+
+def mtd(x,y,window,sd_x,sd_y):
+    """
+    Multiplication of temporal derivatives. The derivatives of x and y are scaled by sd_x and sd_y, multiplied and averaged over every window of length window.
+
+    Returns an array with x.shape[-1]-window values on the last axis. Value i is the mean of the products of the derivatives i to i+window-1 (derivative j is x[j+1]-x[j]).
+    """
+    coupling = (np.diff(x,axis=-1)/np.asarray(sd_x,dtype=x.dtype)) * (np.diff(y,axis=-1)/np.asarray(sd_y,dtype=y.dtype))
+    if coupling.shape[-1]<window:
+        return np.zeros(x.shape[:-1] + (0,))
+    return window_sums(coupling,window)/window
+
+
+def mtds(x,y,windows):
+    """
+    Multiplication of temporal derivatives (see mtd) for several window lengths. Leading axes are calculated at once.
+
+    The derivatives are scaled by their (population) standard deviation, as in teneto. The cumulative sums of the products are computed once and shared by all windows.
+
+    Returns a list with one array per window, with x.shape[-1]-window values on the last axis. Value i is the mean of the products of the derivatives i to i+window-1 (derivative j is x[j+1]-x[j]).
+    """
+    dx = np.diff(x,axis=-1)
+    dy = np.diff(y,axis=-1)
+    coupling = (dx/dx.std(axis=-1,keepdims=True)) * (dy/dy.std(axis=-1,keepdims=True))
+    c = cumulative_sums(coupling)
+    out = []
+    for window in windows:
+        if coupling.shape[-1]<window:
+            r = np.zeros(x.shape[:-1] + (0,))
+        else:
+            r = (c[...,window:] - c[...,:-window])/window
+        out.append(r)
+    return out
+
+
+def sw_variants(ts1,ts2,variants):
+    """
+    SW for a list of parameter sets (see dfc_methods). Fisher transformed.
+    """
+    return [fisher(r) for r in sliding_window_corrs(ts1,ts2,[v['sw_window'] for v in variants])]
+
+
+def tsw_variants(ts1,ts2,variants):
+    """
+    TSW for a list of parameter sets (see dfc_methods). Fisher transformed.
+    """
+    tapers = [taper_weights(v['sw_window'],v['taper_name'],v['taper_properties']) for v in variants]
+    return [fisher(r) for r in tapered_window_corrs(ts1,ts2,tapers)]
+
+
+def sd_variants(ts1,ts2,variants):
+    """
+    SD for a list of parameter sets (see dfc_methods), through teneto (one configuration at a time).
+    """
+    out = []
+    for v in variants:
+        dfc_params={}
+        dfc_params['distance'] = v['sd_distance']
+        dfc_params['method'] = 'spatialdistance'
+        dfc_params['dimord'] = 'node,time'
+        dfc_params['postpro'] = 'fisher'
+        dfc_params['report'] = 'no'
+        out.append(np.array([teneto.derive.derive(np.array([ts1[i],ts2[i]]),dfc_params)[0,1,:] for i in range(ts1.shape[0])]))
+    return out
+
+
+def jc_variants(ts1,ts2,variants):
+    """
+    JC for a list of parameter sets (see dfc_methods). Fisher transformed.
+    """
+    jc = fisher(-jackknife_corrs(ts1,ts2))
+    return [jc for v in variants]
+
+
+def mtd_variants(ts1,ts2,variants):
+    """
+    MTD for a list of parameter sets (see dfc_methods).
+    """
+    return mtds(ts1,ts2,[v['mtd_window'] for v in variants])
+
+
+# Registry of the DFC methods. For each method:
+#   function: function(ts1,ts2,variants) returning one array per parameter set in variants. ts1 and ts2 are (configurations x time).
+#   params: parameters and their default values.
+#   sweep: parameters that can be given as a list of values (one column per value), with the nesting depth of a single value.
+#   alignment: function(params) giving the time point of the first output value. Outputs that are shorter than the time series are padded with NaN.
+dfc_methods = {
+    'SW': {'function': sw_variants, 'params': {'sw_window': 63}, 'sweep': {'sw_window': 0},
+           # Value i is the window of time points i to i+sw_window-1, placed at its centre
+           'alignment': lambda p: int((p['sw_window']-1)/2)},
+    'TSW': {'function': tsw_variants, 'params': {'sw_window': 63, 'taper_name': 'norm', 'taper_properties': [0,10]}, 'sweep': {'sw_window': 0, 'taper_properties': 1},
+            'alignment': lambda p: int((p['sw_window']-1)/2)},
+    'SD': {'function': sd_variants, 'params': {'sd_distance': 'euclidean'}, 'sweep': {},
+           'alignment': lambda p: 0},
+    'JC': {'function': jc_variants, 'params': {}, 'sweep': {},
+           'alignment': lambda p: 0},
+    'MTD': {'function': mtd_variants, 'params': {'mtd_window': 7}, 'sweep': {'mtd_window': 0},
+            # Value i is the window of derivatives i to i+mtd_window-1, and derivative 0 is at time point 1
+            'alignment': lambda p: 1+int((p['mtd_window']-1)/2)},
+}
+
+
+def method_variants(method,params):
+    """
+    Expands the parameters of a DFC method into its parameter sets (variants): one for every combination of the values of list-valued sweep parameters (see dfc_methods).
+
+    Returns a list of (suffix, params) where params contains all parameters of the method (defaults filled in) and suffix is appended to the column name: -value for each list-valued sweep parameter (lists joined by _).
+    """
+    if method not in dfc_methods:
+        raise ValueError('unknown method: ' + method + '. Must be one of ' + ', '.join(dfc_methods))
+    for key in params:
+        if key not in dfc_methods[method]['params']:
+            raise ValueError('unknown parameter ' + key + ' for method ' + method)
+    p = dict(dfc_methods[method]['params'])
+    p.update(params)
+    sweep = dfc_methods[method]['sweep']
+    swept = [key for key in sweep if np.ndim(p[key]) > sweep[key]]
+    out = []
+    for values in itertools.product(*[variants(p[key],sweep[key]) for key in sweep]):
+        v = dict(p)
+        v.update(zip(sweep,values))
+        suffix = ''.join(['-' + '_'.join([str(e) for e in np.ravel(v[key])]) for key in swept])
+        out.append((suffix,v))
+    return out
+
+
+def calc_variants(ts1,ts2,block,method,variants,col):
+    """
+    Calculates the parameter sets (variants) of one DFC method and writes them, aligned as declared in dfc_methods, into block[:,:,col], block[:,:,col+1], ...
+
+    ts1 and ts2 are (configurations x time) and block is (configurations x time x columns). The methods run in the dtype of ts1 and ts2 (e.g. float32), except for the window sums, FFTs and jackknife sums, which are accumulated in float64. Values are rounded to the dtype of block when written.
+    """
+    method = dfc_methods[method]
+    for p, connectivity in zip(variants,method['function'](ts1,ts2,variants)):
+        start = method['alignment'](p)
+        stop = min(start+connectivity.shape[-1],ts1.shape[-1])
+        block[:,start:stop,col] = connectivity[:,:stop-start]
+        col += 1
+
+
+def dfc_unit(task):
+    """
+    Worker of dfc_calc_batch with jobs>1: one method for one block of configurations. The time series and the output are in shared memory (see shared_array).
+    """
+    ts_spec, out_spec, method, variants, col, rows = task
+    ts_shm, ts = tvc_benchmarker.attach_shared(ts_spec)
+    out_shm, out = tvc_benchmarker.attach_shared(out_spec)
+    try:
+        calc_variants(ts[0,rows],ts[1,rows],out[rows],method,variants,col)
+    finally:
+        del ts, out
+        ts_shm.close()
+        out_shm.close()
+
+
+def batch_units(dfc_params):
+    """
+    Expands DFC methods (in the format of params['dfc']) into output columns and units.
+
+    **Returns**
+
+    :columns: one name per method and parameter set (name + suffix, see method_variants).
+    :units: one (name, method, parameter sets, first column) per method, for calc_variants.
+    """
+    dfc_params = tvc_benchmarker.check_params(dfc_params,'dfc')['dfc']
+    entries = [dfc_params[i] for i in sorted(dfc_params)]
+    expanded = [method_variants(entry['method'],entry['params']) for entry in entries]
+    columns = [entry['name'] + suffix for entry, v in zip(entries,expanded) for suffix, p in v]
+    if len(set(columns)) < len(columns):
+        raise ValueError('DFC method names must be unique')
+    units = []
+    col = 0
+    for entry, v in zip(entries,expanded):
+        units.append((entry['name'],entry['method'],[p for suffix, p in v],col))
+        col += len(v)
+    return columns, units
+
+
+def dfc_calc_batch(data,dfc_params,mi='alpha',config_index=None,jobs=1,dtype=None,profile=None):
+    """
+    Calculates several DFC methods and parameter sets in one pass.
+
+    **Input**
+
+    :data: dataframe from gen_data.
+    :dfc_params: DFC methods, in the same format as params['dfc'] (or a single method dictionary with 'name', 'method' and 'params'). Methods and their parameters are listed in dfc_methods. Parameters in the sweep of a method can be lists (one column per value).
+    :mi: multi index names.
+    :config_index: (optional) tvc_benchmarker.ConfigIndex of data. Built from data.index and mi if not given.
+    :jobs: number of processes. With jobs>1, every method is calculated for jobs blocks of configurations, and these units run in a process pool (see process_map).
+    :dtype: dtype of the DFC estimates. Default: float32 if the time series are float32 (see tvc_benchmarker.precision_dtype), otherwise float64. The methods run in the dtype of the time series, with the window sums, FFTs and jackknife sums accumulated in float64 (see calc_variants).
+    :profile: (optional) list. If given, each method is calculated one configuration at a time (serially), and the cost of each call is appended to profile as a dictionary with the multi index values, 'method' (name in dfc_params), 'n_samples', 'configurations' (1), 'wall_time', 'cpu_time' and 'peak_memory' (see tvc_benchmarker.measure). The estimates are the same.
+
+    **Returns**
+
+    :dfc: dataframe with the index of data and one column per method and parameter set, named name + suffix (see method_variants).
+
+    The time series are extracted once as (configurations x time) views. Each method is called once with all its parameter sets, and the results are written into one preallocated array, aligned with the time points as declared in dfc_methods.
+    With jobs>1, the time series and the output array are placed in shared memory, so the workers neither receive nor return dataframes. Configurations are calculated independently of each other, so the result is identical to jobs=1.
+    """
+    columns, units = batch_units(dfc_params)
+    if config_index is None:
+        config_index = tvc_benchmarker.ConfigIndex(data.index,mi)
+
+    # Views of the time series, shape (configurations, time)
+    ts1 = config_index.array(data,'timeseries_1')
+    ts2 = config_index.array(data,'timeseries_2')
+
+    # Pre allocate output, one column per variant
+    if dtype is None:
+        dtype = np.float32 if ts1.dtype == np.float32 and ts2.dtype == np.float32 else np.float64
+    dfc = np.full([len(data),len(columns)],np.nan,dtype=dtype)
+    block = dfc.reshape(ts1.shape + (len(columns),))
+    if profile is not None:
+        if jobs > 1:
+            print('TVC BENCHMARKER WARNING: methods are profiled serially, jobs is ignored.')
+        for name, method, v, col in units:
+            for i, mi_params in enumerate(config_index.mi_parameters):
+                cost = tvc_benchmarker.measure(calc_variants,ts1[i:i+1],ts2[i:i+1],block[i:i+1],method,v,col)[1]
+                record = dict(zip(config_index.mi,mi_params))
+                record.update({'method': name, 'n_samples': ts1.shape[-1], 'configurations': 1})
+                record.update(cost)
+                profile.append(record)
+    elif jobs <= 1:
+        for name, method, v, col in units:
+            calc_variants(ts1,ts2,block,method,v,col)
+    else:
+        ts_shm, ts, ts_spec = tvc_benchmarker.shared_array((2,) + ts1.shape,np.result_type(ts1,ts2))
+        out_shm, out, out_spec = tvc_benchmarker.shared_array(block.shape,dtype)
+        try:
+            ts[0] = ts1
+            ts[1] = ts2
+            out[:] = np.nan
+            rows = [slice(b[0],b[-1]+1) for b in np.array_split(np.arange(ts1.shape[0]),min(jobs,ts1.shape[0]))]
+            tasks = [(ts_spec,out_spec,method,v,col,r) for name, method, v, col in units for r in rows]
+            for _ in tvc_benchmarker.process_map(dfc_unit,tasks,jobs):
+                pass
+            block[:] = out
+        finally:
+            del ts, out
+            ts_shm.close()
+            ts_shm.unlink()
+            out_shm.close()
+            out_shm.unlink()
+
+    return pd.DataFrame(dfc,index=data.index,columns=columns)
+
+
+def dfc_calc_edges(data,dfc_params,out_dir,mi='alpha',config_index=None,edge_block=None,dtype=None):
+    """
+    Calculates DFC methods for every pair of nodes (edge) of N-node data, and writes them to memory-mapped files.
+
+    **Input**
+
+    :data: dataframe from gen_data with timeseries_1 ... timeseries_N.
+    :dfc_params: DFC methods, as in dfc_calc_batch.
+    :out_dir: directory of the output files. One file per method and parameter set: out_dir/[column].npy.
+    :mi: multi index names.
+    :config_index: (optional) tvc_benchmarker.ConfigIndex of data. Built from data.index and mi if not given.
+    :edge_block: number of edges calculated at once. Default: as many as fit in about 2**22 values per time series array.
+    :dtype: dtype of the output. Default as dfc_calc_batch.
+
+    **Returns**
+
+    :edges: array of shape (edges, 2) with the node numbers (0 = timeseries_1) of each edge. Only the N(N-1)/2 edges of the upper triangle (i < j) are calculated, in row-major order.
+    :dfc: dictionary with one read-only np.memmap of shape (edges, len(data)) per column (named as in dfc_calc_batch). Row k holds the estimates of edge k, in the row order of data. Edge 0 (timeseries_1 and timeseries_2) equals the output of dfc_calc_batch.
+
+    Edges are processed in blocks of edge_block, so memory depends on edge_block rather than on the number of edges. The files are standard .npy files, and can be opened later with np.load(path,mmap_mode='r').
+    """
+    columns, units = batch_units(dfc_params)
+    if config_index is None:
+        config_index = tvc_benchmarker.ConfigIndex(data.index,mi)
+
+    n_nodes = len([c for c in data.columns if c.startswith('timeseries_')])
+    if n_nodes < 2:
+        raise ValueError('data must have at least two time series')
+    # Views of the time series, shape (configurations, time)
+    ts = [config_index.array(data,'timeseries_' + str(n+1)) for n in range(n_nodes)]
+    n_configs, n_time = ts[0].shape
+    if dtype is None:
+        dtype = np.float32 if all([x.dtype == np.float32 for x in ts]) else np.float64
+
+    edges = np.array(np.triu_indices(n_nodes,k=1)).transpose()
+    if edge_block is None:
+        edge_block = max(1,2**22 // len(data))
+
+    # Create the .npy files. The blocks are then written with file writes, so the written pages are not kept mapped in memory
+    os.makedirs(out_dir,exist_ok=True)
+    paths = [os.path.join(out_dir,column + '.npy') for column in columns]
+    files = []
+    for path in paths:
+        header = np.lib.format.open_memmap(path,mode='w+',dtype=dtype,shape=(len(edges),len(data)))
+        offset = header.offset
+        del header
+        files.append((open(path,'r+b'),offset))
+
+    for first in range(0,len(edges),edge_block):
+        pairs = edges[first:first+edge_block]
+        # Shape (configurations x edges, time)
+        ts1 = np.stack([ts[i] for i in pairs[:,0]],axis=1).reshape(-1,n_time)
+        ts2 = np.stack([ts[j] for j in pairs[:,1]],axis=1).reshape(-1,n_time)
+        block = np.full(ts1.shape + (len(columns),),np.nan,dtype=dtype)
+        for name, method, v, col in units:
+            calc_variants(ts1,ts2,block,method,v,col)
+        # (configurations, edges, time) to (edges, configurations x time)
+        block = block.reshape(n_configs,len(pairs),n_time,len(columns))
+        for col, (f, offset) in enumerate(files):
+            f.seek(offset + first*len(data)*np.dtype(dtype).itemsize)
+            np.ascontiguousarray(block[...,col].transpose(1,0,2)).tofile(f)
+
+    for f, offset in files:
+        f.close()
+    dfc = dict([(column,np.load(path,mmap_mode='r')) for column, path in zip(columns,paths)])
+    return edges, dfc
+
+
+def chunk_moments(chunks):
+    """
+    First pass over the chunks for the methods that need statistics of the entire time series (JC and MTD).
+
+    Returns a dictionary (one entry per configuration) with the sums of timeseries_1 and timeseries_2 (shifted by the mean of the first chunk) and of their temporal derivatives.
+    """
+    moments = {}
+    for mi_params, chunk in chunks:
+        # Sums are accumulated in float64 (the chunks can be float32)
+        x = np.asarray(chunk['timeseries'][:2],dtype=float)
+        if mi_params not in moments:
+            m = {'shift': x.mean(axis=-1), 'n': 0, 'sx': 0, 'sy': 0, 'sxx': 0, 'syy': 0, 'sxy': 0, 'nd': 0, 'sd': 0, 'sdd': 0, 'last': None}
+            moments[mi_params] = m
+        m = moments[mi_params]
+        xs = x - m['shift'][:,None]
+        m['n'] += xs.shape[-1]
+        m['sx'] += xs[0].sum()
+        m['sy'] += xs[1].sum()
+        m['sxx'] += (xs[0]*xs[0]).sum()
+        m['syy'] += (xs[1]*xs[1]).sum()
+        m['sxy'] += (xs[0]*xs[1]).sum()
+        if m['last'] is not None:
+            xs = np.hstack([m['last'][:,None],xs])
+        dx = np.diff(xs,axis=-1)
+        m['nd'] += dx.shape[-1]
+        m['sd'] += dx.sum(axis=-1)
+        m['sdd'] += (dx*dx).sum(axis=-1)
+        m['last'] = xs[:,-1]
+    for m in moments.values():
+        # Population standard deviation of the derivatives (as np.std)
+        m['sd_derivative'] = np.sqrt(m['sdd']/m['nd'] - (m['sd']/m['nd'])**2)
+    return moments
+
+
+def chunk_context(chunks,back,fwd):
+    """
+    Attaches the neighbouring samples needed by windowed methods to each chunk.
+
+    Yields (mi_params, chunk, x, nb) where x is timeseries_1 and timeseries_2 of the chunk with up to back previous and fwd following samples of the same configuration attached. nb is the number of previous samples attached.
+    Every chunk, except the last of each configuration, must be at least fwd samples long.
+    """
+    current = None
+    for item in chunks:
+        if current is None:
+            # Empty, in the dtype of the chunks
+            history = item[1]['timeseries'][:2,:0]
+        else:
+            same = item[0] == current[0]
+            if same and current[1]['timeseries'].shape[-1]<fwd and current[1]['time'][0]>0:
+                raise ValueError('chunk_size must be at least half the largest window')
+            x = current[1]['timeseries'][:2]
+            ahead = item[1]['timeseries'][:2,:fwd] if same else x[:,:0]
+            yield current[0], current[1], np.hstack([history,x,ahead]), history.shape[1]
+            history = np.hstack([history,x])[:,-back:] if same and back>0 else x[:,:0]
+        current = item
+    if current is not None:
+        yield current[0], current[1], np.hstack([history,current[1]['timeseries'][:2]]), history.shape[1]
+
+
+def dfc_calc_chunks(chunks,dfc_params):
+    """
+    Calculates DFC one chunk at a time, so memory is bounded by the chunk size rather than the length of the time series.
+
+    **Input**
+
+    :chunks: output of tvc_benchmarker.gen_data_chunks. JC and MTD need statistics of the entire time series, so they need two passes over the data. For these, chunks must be a function that returns a new chunk generator each time it is called (e.g. lambda: gen_data_chunks(simparams)).
+    :dfc_params: DFC methods, in the same format as params['dfc'] (or a single method dictionary with 'name', 'method' and 'params'). Supported methods are 'SW', 'TSW', 'JC' and 'MTD'. 'SD' compares every pair of time points, so it cannot be calculated in chunks.
+
+    The method parameters are the same as for dfc_calc_batch: a list of windows (or taper properties) gives one output per value, named after the method as in dfc_calc_batch (e.g. SW-15 and SW-29). The context attached to each chunk is sized for the largest window.
+
+    **Yields**
+
+    :mi_params: the multi index values of the configuration.
+    :chunk: dictionary with 'time', one array per method name (and parameter set), and any of 'covariance_parameter', 'covariance_mean' and 'state_switch' in the input chunk. Values are aligned with time in the same way as dfc_calc.
+
+    The output of each chunk is yielded once the first samples of the following chunk are available. Every chunk, except the last of each configuration, must be at least half the largest window long.
+    """
+    dfc_params = tvc_benchmarker.check_params(dfc_params,'dfc')['dfc']
+    # One entry per method and parameter set, named as the columns of dfc_calc_batch (see method_variants)
+    methods = []
+    for i in sorted(dfc_params):
+        if dfc_params[i]['method'] not in ['SW','TSW','JC','MTD']:
+            raise ValueError('method ' + dfc_params[i]['method'] + ' cannot be calculated in chunks')
+        for suffix, p in method_variants(dfc_params[i]['method'],dfc_params[i]['params']):
+            methods.append({'name': dfc_params[i]['name'] + suffix, 'method': dfc_params[i]['method'], 'params': p})
+    if len(set([m['name'] for m in methods])) < len(methods):
+        raise ValueError('DFC method names must be unique')
+
+    back = 0
+    fwd = 0
+    for m in methods:
+        p = m['params']
+        # The value at time point t uses the samples t-alignment to t-alignment+span-1
+        if m['method'] == 'MTD':
+            # Derivative j uses the samples j and j+1
+            span = p['mtd_window']+1
+        elif m['method'] == 'JC':
+            span = 1
+        else:
+            span = p['sw_window']
+        alignment = dfc_methods[m['method']]['alignment'](p)
+        back = max(back,alignment)
+        fwd = max(fwd,span-1-alignment)
+
+    if any([m['method'] == 'JC' or m['method'] == 'MTD' for m in methods]):
+        if not callable(chunks):
+            raise ValueError('JC and MTD need two passes over the data. chunks must be a function that returns the chunk generator')
+        moments = chunk_moments(chunks())
+    if callable(chunks):
+        chunks = chunks()
+
+    for mi_params, chunk, x, nb in chunk_context(chunks,back,fwd):
+        # Calculated in the dtype of the chunk (sums in float64, see calc_variants) and stored in it
+        dtype = chunk['timeseries'].dtype
+        n_time = len(chunk['time'])
+        k = np.arange(nb,nb+n_time)
+        out = {'time': chunk['time']}
+        for key in chunk:
+            if key != 'time' and key != 'timeseries':
+                out[key] = chunk[key]
+
+        for m in methods:
+            values = np.zeros(n_time) * np.nan
+            if m['method'] == 'SW' or m['method'] == 'TSW':
+                window = m['params']['sw_window']
+                if m['method'] == 'SW':
+                    r = sliding_window_corr(x[0],x[1],window)
+                else:
+                    r = tapered_window_corr(x[0],x[1],taper_weights(window,m['params']['taper_name'],m['params']['taper_properties']))
+                start = k - dfc_methods[m['method']]['alignment'](m['params'])
+                valid = (start>=0) & (start<len(r))
+                values[valid] = fisher(r[start[valid]])
+            elif m['method'] == 'JC':
+                mo = moments[mi_params]
+                xs = x[:,nb:nb+n_time] - mo['shift'][:,None]
+                values = fisher(-jackknife_corr(xs[0],xs[1],mo['n'],mo['sx'],mo['sy'],mo['sxx'],mo['syy'],mo['sxy']))
+            elif m['method'] == 'MTD':
+                window = m['params']['mtd_window']
+                sd = moments[mi_params]['sd_derivative']
+                r = mtd(x[0],x[1],window,sd[0],sd[1])
+                start = k - dfc_methods['MTD']['alignment'](m['params'])
+                valid = (start>=0) & (start<len(r))
+                values[valid] = r[start[valid]]
+            out[m['name']] = values.astype(dtype,copy=False)
+
+        yield mi_params, out
@@ -1,11 +1,16 @@
 import pymc3 as pm
 import pickle
+import copy
+import os
 import tvc_benchmarker
 import numpy as np
+import pandas as pd
+import scipy.special
+import scipy.optimize
 import tabulate
 import matplotlib.pyplot as plt
 
-def model_dfc(x,dfc,dat_dir,model_prefix,bayes_model='bayes_model',mi='alpha',model_params={}):
+def model_dfc(x,dfc,dat_dir,model_prefix,bayes_model='bayes_model',mi='alpha',model_params={},config_index=None,jobs=1,cache_dir=None,cache_size=2**30):
     """
     General stats functions that calls the bayes_model, saves the output.
 
@@ -15,41 +20,84 @@ def model_dfc(x,dfc,dat_dir,model_prefix,bayes_model='bayes_model',mi='alpha',mo
     :dfc: dynamic connectivity estimates (DF)
     :dat_dir: Place to save the stats data.
     :model_predix: Prefix name for saved file
+    :bayes_model: name of the model function: 'bayes_model' (pymc3 sampling, default), 'conjugate_model' (analytic posterior) or 'fast_model' (Laplace approximation or ADVI with a fallback to bayes_model)
     :model_params: string of parameters for bayes_model function
+    :config_index: (optional) tvc_benchmarker.ConfigIndex of x. Built from x.index if not given.
+    :jobs: number of processes. With jobs>1, the models (one per method and configuration) are fitted in a process pool (see process_map), each worker using one BLAS thread and pymc3 sampling with cores=1.
+
+    Each model is saved as a trace (posterior samples and pointwise log likelihood, see save_model_trace), written to a temporary directory and then renamed. If model_params contains randomseed, each model is fitted with its own seed derived from it and the file name (see unit_seed), so the saved output does not depend on jobs or on the order in which the models finish.
+
+    :cache_dir: (optional) directory of the model cache. Each fit is keyed on a hash of X, Y, bayes_model, the model parameters and the package version (see model_key). A model found in the cache is copied instead of fitted, so e.g. adding a method only fits the models of that method.
+    :cache_size: maximum size of the cache in bytes. The least recently used models are deleted beyond it (see cache_evict).
     """
     if model_params == None:
-        model_params = ''
+        model_params = {}
 
     if isinstance(mi,str):
         mi = [mi]
 
-    params = {}
-    for m in mi:
-        params[m] = np.unique(dfc.index.get_level_values(m))
-    mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
+    dfc_index = tvc_benchmarker.ConfigIndex(dfc.index,mi)
+    if config_index is None:
+        config_index = tvc_benchmarker.ConfigIndex(x.index,mi)
+    mi = dfc_index.mi
 
-    for sim_it, mi_params in enumerate(mi_parameters):
+    if jobs > 1 and bayes_model in ['bayes_model','fast_model'] and 'cores' not in model_params:
+        # No nested process pools
+        model_params = dict(model_params,cores=1)
+
+    tasks = []
+    for sim_it, mi_params in enumerate(dfc_index.mi_parameters):
+        # Time points of this configuration in dfc (rows with NaN may have been dropped)
+        time = dfc_index.time[dfc_index.slice(mi_params)]
+        Y = config_index.view(x,'covariance_parameter',mi_params,time)
         for method in dfc.columns:
-            plt.close('all')
-            X=dfc[method][mi_params]
-            Y=x['covariance_parameter'][mi_params][X.index]
-            trace_and_model = tvc_benchmarker.bayes_model(X,Y,**model_params)
-            #Save data
+            X = dfc_index.view(dfc,method,mi_params)
             param_sname = [p[0] + '-' + str(p[1]) for p in list(zip(mi,mi_params))]
             param_sname = '_'.join(param_sname)
             param_sname = '_' + param_sname.replace(' ','')
             file_name = model_prefix + '_' + 'method-' + method + param_sname
-            tvc_benchmarker.trace_plot(dat_dir,file_name,trace_and_model[0])
-            tvc_benchmarker.save_bayes_model(dat_dir,file_name,trace_and_model)
+            params = dict(model_params)
+            if 'randomseed' in params:
+                params['randomseed'] = tvc_benchmarker.unit_seed(params['randomseed'],file_name)
+            tasks.append((X,Y,bayes_model,params,dat_dir,file_name,cache_dir,cache_size))
+
+    for _ in tvc_benchmarker.process_map(fit_model,tasks,jobs):
+        pass
+
+
+def fit_model(task):
+    """
+    Worker of model_dfc: fits one method and configuration, and saves its trace plot and model. With a cache_dir, the model is copied from the cache if it was fitted before, and added to it otherwise.
+    """
+    X, Y, bayes_model, model_params, dat_dir, file_name, cache_dir, cache_size = task
+    if cache_dir:
+        key = tvc_benchmarker.model_key(X,Y,bayes_model,model_params)
+        if tvc_benchmarker.cache_get(cache_dir,key,dat_dir,file_name):
+            return
+    plt.close('all')
+    trace_and_model = getattr(tvc_benchmarker,bayes_model)(X,Y,**model_params)
+    #Save data
+    tvc_benchmarker.trace_plot(dat_dir,file_name,trace_and_model[0])
+    tvc_benchmarker.save_model_trace(dat_dir,file_name,trace_and_model,X,Y)
+    plt.close('all')
+    if cache_dir:
+        tvc_benchmarker.cache_put(cache_dir,key,dat_dir,file_name,cache_size)
 
 
 def trace_plot(dat_dir,file_name,trace):
 
     fig,ax = plt.subplots(3,2)
-    pm.traceplot(trace,ax=ax)
-    fig.savefig(dat_dir + '/' +  file_name + '_traceplot.png',r=300)
-
-def bayes_model(x,y,samples=6000,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma_sd=1,n_init=200000):
+    if isinstance(trace,dict):
+        # Draws of conjugate_model or fast_model
+        for i,name in enumerate(['alpha','beta','sigma']):
+            ax[i,0].hist(trace[name],100,histtype='step')
+            ax[i,0].set_title(name)
+            ax[i,1].plot(trace[name],linewidth=0.5)
+    else:
+        pm.traceplot(trace,ax=ax)
+    tvc_benchmarker.atomic_write(dat_dir + '/' +  file_name + '_traceplot.png',lambda path: fig.savefig(path,format='png'))
+
+def bayes_model(x,y,samples=6000,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma_sd=1,n_init=200000,cores=None,randomseed=None):
     """
     Simple linear Bayes regression through pymc3.
 
@@ -64,16 +112,35 @@ def bayes_model(x,y,samples=6000,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma
     :beta_sd: prior: sd of beta
     :sigma_sd: prior: sd of likelihood.
     :n_init: ADVI iterations at initizaliation
+    :cores: (optional) number of chains run in parallel by pm.sample. Default: pymc3's default.
+    :randomseed: (optional) random seed of pm.sample.
 
 
     **Output**
 
     :model,trace: model object and trace object of pyMC3
 
+    """
+    model = regression_model(x,y,alpha_mu=alpha_mu,beta_mu=beta_mu,alpha_sd=alpha_sd,beta_sd=beta_sd,sigma_sd=sigma_sd)
+    with model:
+        sample_params = {}
+        if cores is not None:
+            sample_params['cores'] = cores
+        if randomseed is not None:
+            sample_params['random_seed'] = randomseed
+        trace = pm.sample(samples,n_init=n_init,**sample_params)
+
+    return trace,model
+
+
+def regression_model(x,y,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma_sd=1):
+    """
+    pymc3 model of the standardized regression y = alpha + beta*x of bayes_model and fast_model (see bayes_model for the priors).
     """
     model = pm.Model()
-    x = tvc_benchmarker.standerdize(x)
-    y = tvc_benchmarker.standerdize(y)
+    # Standardized in float64 (x and y can be float32)
+    x = tvc_benchmarker.standerdize(np.asarray(x,dtype=float))
+    y = tvc_benchmarker.standerdize(np.asarray(y,dtype=float))
     with model:
 
         # Priors for unknown model parameters
@@ -84,11 +151,446 @@ def bayes_model(x,y,samples=6000,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma
         mu = alpha + beta*x
         # Likelihood (sampling distribution) of observations
         Y_obs = pm.Normal('Y_obs', mu=mu, sd=sigma, observed=y)
-        trace = pm.sample(samples,n_init=n_init)
+    return model
+
+
+def fast_model(x,y,samples=6000,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma_sd=1,n_init=200000,cores=None,randomseed=None,method='laplace',k_threshold=0.7,fallback=True):
+    """
+    Fast approximation of bayes_model (the same model and priors): the Laplace approximation or mean-field ADVI, with convergence diagnostics and a fallback to NUTS (bayes_model).
+
+    **Input**
+
+    The same as bayes_model, and
+
+    :method: 'laplace' (Gaussian at the posterior mode of alpha, beta and log(sigma)) or 'advi' (pymc3 mean-field ADVI of at most n_init iterations).
+    :k_threshold: largest accepted Pareto k of the importance ratios posterior/approximation (see approximation_diagnostics). 0.7 is the usual limit.
+    :fallback: if True, bayes_model is run when the diagnostics fail.
+
+    **Output**
+
+    :trace,model: trace is a dictionary with samples independent draws of alpha, beta and sigma from the approximation. model is a dictionary with 'engine' (method), 'mean' and 'cov' (of alpha, beta and log(sigma)), 'diagnostics' (see approximation_diagnostics) and 'waic' (see waic_samples).
+    If the diagnostics fail and fallback is True, the output of bayes_model. With fallback=False, a failed approximation is returned with its diagnostics, unless it has no finite covariance to draw from (ValueError).
 
+    The approximation is accepted if the optimization converged and the Pareto k is below k_threshold.
+    """
+    if method not in ['laplace','advi']:
+        raise ValueError('unknown method. Must be "laplace" or "advi"')
+    priors = {'alpha_mu': alpha_mu, 'beta_mu': beta_mu, 'alpha_sd': alpha_sd, 'beta_sd': beta_sd, 'sigma_sd': sigma_sd}
+    xs = tvc_benchmarker.standerdize(np.asarray(x,dtype=float))
+    ys = tvc_benchmarker.standerdize(np.asarray(y,dtype=float))
+    stats = np.array([len(xs),xs.sum(),ys.sum(),(xs*ys).sum(),(xs*xs).sum(),(ys*ys).sum()])
+    if method == 'laplace':
+        mean, cov, converged = laplace_fit(stats,**priors)
+    else:
+        with regression_model(x,y,**priors):
+            fit_params = {}
+            if randomseed is not None:
+                fit_params['random_seed'] = randomseed
+            approx = pm.fit(n=n_init,method='advi',callbacks=[pm.callbacks.CheckParametersConvergence(diff='relative')],**fit_params)
+        # Stopped by the convergence check before n_init iterations
+        converged = len(approx.hist) < n_init and np.all(np.isfinite(approx.hist))
+        mu = approx.bij.rmap(approx.mean.eval())
+        sd = approx.bij.rmap(approx.std.eval())
+        mean = np.array([mu['alpha'],mu['beta'],mu['sigma_log__']],dtype=float).flatten()
+        cov = np.diag(np.array([sd['alpha'],sd['beta'],sd['sigma_log__']],dtype=float).flatten()**2)
+    diagnostics = approximation_diagnostics(mean,cov,stats,samples=samples,randomseed=randomseed,**priors)
+    diagnostics['converged'] = bool(converged)
+    diagnostics['accepted'] = bool(converged) and diagnostics['pareto_k'] < k_threshold
+    if not diagnostics['accepted'] and fallback:
+        print('TVC BENCHMARKER WARNING: ' + method + ' approximation failed its diagnostics (converged: ' + str(converged) + ', Pareto k: ' + str(round(diagnostics['pareto_k'],2)) + '). Running NUTS (bayes_model) instead.')
+        return bayes_model(x,y,samples=samples,n_init=n_init,cores=cores,randomseed=randomseed,**priors)
+    if diagnostics['trace'] is None:
+        raise ValueError(method + ' approximation failed: its covariance is not finite (converged: ' + str(converged) + '), so there are no draws. Use fallback=True to run NUTS instead')
+    trace = diagnostics.pop('trace')
+    waic = waic_samples(xs,ys,trace)
+    model = {'engine': method, 'mean': mean, 'cov': cov, 'diagnostics': diagnostics, 'waic': waic}
     return trace,model
 
 
+def log_posterior(theta,stats,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma_sd=1):
+    """
+    Unnormalized log posterior of the model of bayes_model, of theta (... x 3: alpha, beta and log(sigma), including the Jacobian of log(sigma)), from the sufficient statistics of the standardized x and y ([n, sum(x), sum(y), sum(xy), sum(xx), sum(yy)]).
+
+    **Returns**
+
+    :lp: log posterior (...).
+    :grad: gradient (... x 3).
+    """
+    n, sx, sy, sxy, sxx, syy = stats
+    alpha, beta, log_sigma = theta[...,0], theta[...,1], theta[...,2]
+    rss = syy - 2*alpha*sy - 2*beta*sxy + n*alpha**2 + 2*alpha*beta*sx + beta**2*sxx
+    inv_var = np.exp(-2*log_sigma)
+    var = np.exp(2*log_sigma)
+    lp = -(n-1)*log_sigma - 0.5*rss*inv_var - 0.5*((alpha-alpha_mu)/alpha_sd)**2 - 0.5*((beta-beta_mu)/beta_sd)**2 - 0.5*var/sigma_sd**2
+    grad = np.stack([(sy - n*alpha - beta*sx)*inv_var - (alpha-alpha_mu)/alpha_sd**2,
+                     (sxy - alpha*sx - beta*sxx)*inv_var - (beta-beta_mu)/beta_sd**2,
+                     -(n-1) + rss*inv_var - var/sigma_sd**2],axis=-1)
+    return lp, grad
+
+
+def laplace_fit(stats,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma_sd=1):
+    """
+    Laplace approximation of the posterior of alpha, beta and log(sigma) (see log_posterior): the mode, found by BFGS from the least squares estimate, and the inverse of the Hessian at the mode.
+
+    **Returns**
+
+    :mean, cov: mode and covariance of the approximation.
+    :converged: True if the optimizer converged and the Hessian is positive definite.
+    """
+    priors = {'alpha_mu': alpha_mu, 'beta_mu': beta_mu, 'alpha_sd': alpha_sd, 'beta_sd': beta_sd, 'sigma_sd': sigma_sd}
+    n, sx, sy, sxy, sxx, syy = stats
+    beta0 = (n*sxy - sx*sy)/(n*sxx - sx**2)
+    alpha0 = (sy - beta0*sx)/n
+    rss0 = syy - 2*alpha0*sy - 2*beta0*sxy + n*alpha0**2 + 2*alpha0*beta0*sx + beta0**2*sxx
+    start = np.array([alpha0,beta0,0.5*np.log(max(rss0,1e-12)/n)])
+
+    def objective(theta):
+        lp, grad = log_posterior(theta,stats,**priors)
+        return -lp, -grad
+
+    res = scipy.optimize.minimize(objective,start,jac=True,method='BFGS')
+    alpha, beta, log_sigma = res.x
+    inv_var = np.exp(-2*log_sigma)
+    rss = syy - 2*alpha*sy - 2*beta*sxy + n*alpha**2 + 2*alpha*beta*sx + beta**2*sxx
+    d_alpha = -2*(sy - n*alpha - beta*sx)
+    d_beta = -2*(sxy - alpha*sx - beta*sxx)
+    # Hessian of the negative log posterior
+    hessian = np.array([[n*inv_var + 1/alpha_sd**2, sx*inv_var, -d_alpha*inv_var],
+                        [sx*inv_var, sxx*inv_var + 1/beta_sd**2, -d_beta*inv_var],
+                        [-d_alpha*inv_var, -d_beta*inv_var, 2*rss*inv_var + 2*np.exp(2*log_sigma)/sigma_sd**2]])
+    try:
+        np.linalg.cholesky(hessian)
+        cov = np.linalg.inv(hessian)
+        converged = res.success
+    except np.linalg.LinAlgError:
+        cov = np.diag(np.full(3,np.nan))
+        converged = False
+    return res.x, cov, converged
+
+
+def approximation_diagnostics(mean,cov,stats,samples=6000,randomseed=None,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma_sd=1):
+    """
+    Draws from a Gaussian approximation (mean and cov of alpha, beta and log(sigma)) of the posterior of log_posterior, and its Pareto k diagnostic (Yao et al. 2018): the shape of the tail of the importance ratios posterior/approximation (see psis_weights). Below 0.5 the approximation is good, above 0.7 it is unreliable.
+
+    **Returns**
+
+    :diagnostics: dictionary with pareto_k, ess (relative effective sample size of the PSIS weights) and trace (dictionary with the draws of alpha, beta and sigma).
+    """
+    if not np.all(np.isfinite(cov)):
+        return {'pareto_k': np.inf, 'ess': 0.0, 'trace': None}
+    rng = np.random.default_rng(randomseed)
+    chol = np.linalg.cholesky(cov)
+    z = rng.standard_normal([samples,3])
+    theta = mean + z @ chol.transpose()
+    log_q = -0.5*(z**2).sum(axis=1) - np.log(np.diag(chol)).sum()
+    lp, _ = log_posterior(theta,stats,alpha_mu=alpha_mu,beta_mu=beta_mu,alpha_sd=alpha_sd,beta_sd=beta_sd,sigma_sd=sigma_sd)
+    log_weights, pareto_k = psis_weights((lp-log_q)[:,None])
+    ess = 1/np.sum(np.exp(2*log_weights[:,0]))/samples
+    trace = {'alpha': theta[:,0], 'beta': theta[:,1], 'sigma': np.exp(theta[:,2])}
+    return {'pareto_k': float(pareto_k[0]), 'ess': float(ess), 'trace': trace}
+
+
+
+def conjugate_posterior(stats,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma_sd=1):
+    """
+    Posterior of the standardized regression y = alpha + beta*x (as in bayes_model) under a Normal-Inverse-Gamma prior, from sufficient statistics.
+
+    **Input**
+
+    :stats: [n, sum(x), sum(y), sum(xy), sum(xx), sum(yy)] of the unstandardized x and y (see sufficient_stats).
+    :alpha_mu, beta_mu, alpha_sd, beta_sd: prior of the intercept and beta given sigma: Normal with these means and sigma times these standard deviations.
+    :sigma_sd: prior of sigma**2: Inverse-Gamma with shape 2 and scale sigma_sd**2 (the same mean of sigma**2 as the HalfNormal(sigma_sd) prior of bayes_model).
+
+    **Returns**
+
+    :posterior: dictionary with mean (of alpha and beta), cov (covariance of alpha and beta divided by sigma**2), and shape and scale (of the Inverse-Gamma posterior of sigma**2).
+
+    After standardization, sum(x) = sum(y) = 0, sum(xx) = sum(yy) = n-1 and sum(xy) = (n-1)*r, where r is the correlation of x and y.
+    """
+    n = stats[0]
+    r = tvc_benchmarker.suffstats_regression(stats)['beta']
+    prior_mean = np.array([alpha_mu,beta_mu],dtype=float)
+    prior_precision = np.diag(1/np.array([alpha_sd,beta_sd],dtype=float)**2)
+    xtx = np.diag([n,n-1])
+    xty = np.array([0,(n-1)*r])
+    precision = prior_precision + xtx
+    cov = np.linalg.inv(precision)
+    mean = cov @ (prior_precision @ prior_mean + xty)
+    shape = 2 + n/2
+    scale = sigma_sd**2 + 0.5*((n-1) + prior_mean @ prior_precision @ prior_mean - mean @ precision @ mean)
+    return {'mean': mean, 'cov': cov, 'shape': shape, 'scale': scale}
+
+
+def conjugate_samples(posterior,samples=6000,randomseed=None):
+    """
+    Independent draws from a posterior of conjugate_posterior. Returns a dictionary with the arrays alpha, beta and sigma.
+    """
+    rng = np.random.default_rng(randomseed)
+    sigma2 = posterior['scale']/rng.gamma(posterior['shape'],size=samples)
+    coef = posterior['mean'] + np.sqrt(sigma2)[:,None] * (rng.standard_normal([samples,2]) @ np.linalg.cholesky(posterior['cov']).transpose())
+    return {'alpha': coef[:,0], 'beta': coef[:,1], 'sigma': np.sqrt(sigma2)}
+
+
+def loglik_blocks(x,y,trace):
+    """
+    Pointwise log likelihood of the regression y = alpha + beta*x for the posterior samples in trace (dictionary with arrays alpha, beta and sigma).
+
+    Yields arrays of shape (samples x time points) for consecutive blocks of time points, so memory does not depend on the number of time points.
+    """
+    alpha, beta, sigma = [np.asarray(trace[key],dtype=float)[:,None] for key in ['alpha','beta','sigma']]
+    step = max(1,2**22 // len(alpha))
+    for start in range(0,len(x),step):
+        xb = x[None,start:start+step]
+        yb = y[None,start:start+step]
+        yield -0.5*np.log(2*np.pi*sigma**2) - (yb-alpha-beta*xb)**2/(2*sigma**2)
+
+
+def waic_loglik(blocks):
+    """
+    WAIC from the pointwise log likelihood, given as blocks of shape (samples x time points) (e.g. loglik_blocks or Trace.chunks('loglik')), on the same (deviance) scale as pm.stats.waic.
+
+    **Returns**
+
+    :waic: array with WAIC, WAIC standard error and the effective number of parameters (p_WAIC).
+    """
+    pointwise = [pointwise_ic(loglik,loo=False) for loglik in blocks]
+    waic_i = np.concatenate([p['waic'] for p in pointwise])
+    p_waic = np.sum([p['p_waic'].sum() for p in pointwise])
+    return np.array([waic_i.sum(),np.sqrt(len(waic_i)*np.var(waic_i)),p_waic])
+
+
+def pointwise_ic(loglik,loo=True):
+    """
+    Pointwise WAIC and PSIS-LOO (Pareto smoothed importance sampling leave-one-out, Vehtari et al. 2017) on the deviance scale.
+
+    **Input**
+
+    :loglik: pointwise log likelihood, array of shape (... x samples x time points), e.g. (methods x samples x time points). All leading dimensions are computed in one pass.
+    :loo: if False, only WAIC is calculated.
+
+    **Returns**
+
+    :pointwise: dictionary of arrays of shape (... x time points): waic, p_waic and, with loo, loo and pareto_k (the shape of the fitted tail of the importance weights. Above 0.7 the LOO estimate of that time point is unreliable).
+    """
+    loglik = np.asarray(loglik,dtype=float)
+    shape = loglik.shape[:-2] + loglik.shape[-1:]
+    n_samples = loglik.shape[-2]
+    # samples x (all time points of all models)
+    loglik = np.moveaxis(loglik,-2,0).reshape(n_samples,-1)
+    lppd = scipy.special.logsumexp(loglik,axis=0) - np.log(n_samples)
+    p_waic = np.var(loglik,axis=0)
+    pointwise = {'waic': (-2*(lppd-p_waic)).reshape(shape), 'p_waic': p_waic.reshape(shape)}
+    if loo:
+        log_weights, pareto_k = psis_weights(-loglik)
+        pointwise['loo'] = (-2*scipy.special.logsumexp(log_weights+loglik,axis=0)).reshape(shape)
+        pointwise['pareto_k'] = pareto_k.reshape(shape)
+    return pointwise
+
+
+def psis_weights(log_ratios):
+    """
+    Pareto smoothed importance sampling. The largest importance ratios of each column of log_ratios (samples x N) are replaced by the expected order statistics of a generalized Pareto distribution fitted to them (see pareto_tail_fit).
+
+    **Returns**
+
+    :log_weights: normalized log weights (samples x N).
+    :pareto_k: shape of the fitted tail (N).
+    """
+    n_samples = log_ratios.shape[0]
+    log_weights = log_ratios - log_ratios.max(axis=0)
+    tail_len = int(np.ceil(min(0.2*n_samples,3*np.sqrt(n_samples))))
+    if tail_len <= 4:
+        return log_weights - scipy.special.logsumexp(log_weights,axis=0), np.full(log_ratios.shape[1],np.inf)
+    order = np.argsort(log_weights,axis=0)
+    columns = np.arange(log_weights.shape[1])
+    cutoff = np.maximum(log_weights[order[-tail_len-1],columns],np.log(np.finfo(float).tiny))
+    tail_ind = order[-tail_len:]
+    tail = np.exp(log_weights[tail_ind,columns]) - np.exp(cutoff)
+    pareto_k, sigma = pareto_tail_fit(tail)
+    # Expected order statistics of the fitted tail
+    probs = (np.arange(tail_len)[:,None] + 0.5)/tail_len
+    with np.errstate(divide='ignore',invalid='ignore'):
+        smoothed = np.where(np.abs(pareto_k) < np.finfo(float).eps,-np.log1p(-probs),np.expm1(-pareto_k*np.log1p(-probs))/pareto_k)*sigma
+        smoothed = np.log(smoothed + np.exp(cutoff))
+    fit = np.isfinite(pareto_k) & (sigma > 0)
+    log_weights[tail_ind[:,fit],columns[fit]] = np.minimum(smoothed[:,fit],0)
+    return log_weights - scipy.special.logsumexp(log_weights,axis=0), pareto_k
+
+
+def pareto_tail_fit(tail):
+    """
+    Fits a generalized Pareto distribution to each column of tail (sorted ascending, exceedances over a threshold) with the empirical Bayes estimate of Zhang and Stephens (2009), with the weakly informative prior on the shape used for PSIS.
+
+    **Returns**
+
+    :k, sigma: shape and scale of each column.
+    """
+    n = tail.shape[0]
+    m = 30 + int(np.sqrt(n))
+    b = 1 - np.sqrt(m/(np.arange(1,m+1) - 0.5))
+    b = b[:,None]/(3*tail[int(n/4 + 0.5) - 1]) + 1/tail[-1]
+    k = np.log1p(-b[:,None,:]*tail[None]).mean(axis=1)
+    profile = n*(np.log(-(b/k)) - k - 1)
+    weights = 1/np.exp(profile[None,:,:] - profile[:,None,:]).sum(axis=1)
+    weights[weights < 10*np.finfo(float).eps] = 0
+    weights /= weights.sum(axis=0)
+    b = (b*weights).sum(axis=0)
+    k = np.log1p(-b[None]*tail).mean(axis=0)
+    sigma = -k/b
+    # Prior on k (weight 10, centred on 0.5)
+    k = (n*k + 10*0.5)/(n + 10)
+    return k, sigma
+
+
+def compare_ic(pointwise):
+    """
+    Compares models from their pointwise information criteria (output of pointwise_ic with leading dimension models, time points concatenated).
+
+    **Returns**
+
+    :ic: dictionary with, per model, waic, waic_se, p_waic, delta_waic (difference from the lowest WAIC), delta_waic_se (standard error of that difference, from the pointwise differences), loo, loo_se and pareto_k_max, and pairwise_se: the standard error of the WAIC difference of every pair of models (models x models).
+    """
+    waic_i = pointwise['waic']
+    n = waic_i.shape[-1]
+    ic = {'waic': waic_i.sum(axis=-1), 'waic_se': np.sqrt(n*np.var(waic_i,axis=-1)), 'p_waic': pointwise['p_waic'].sum(axis=-1)}
+    ic['pairwise_se'] = np.sqrt(n*np.var(waic_i[:,None,:]-waic_i[None,:,:],axis=-1))
+    best = np.argmin(ic['waic'])
+    ic['delta_waic'] = ic['waic'] - ic['waic'][best]
+    ic['delta_waic_se'] = ic['pairwise_se'][:,best]
+    if 'loo' in pointwise:
+        ic['loo'] = pointwise['loo'].sum(axis=-1)
+        ic['loo_se'] = np.sqrt(n*np.var(pointwise['loo'],axis=-1))
+        ic['pareto_k_max'] = pointwise['pareto_k'].max(axis=-1)
+    return ic
+
+
+def waic_compare(blocks,loo=True):
+    """
+    Vectorized WAIC (and PSIS-LOO) of several models fitted to the same data.
+
+    **Input**
+
+    :blocks: pointwise log likelihood of all models, as an array (models x samples x time points) or an iterable of such blocks over consecutive time points (e.g. the zipped Trace.chunks('loglik') of each model).
+    :loo: if False, PSIS-LOO is not calculated.
+
+    **Returns**
+
+    :ic: see compare_ic.
+    """
+    if isinstance(blocks,np.ndarray):
+        blocks = [blocks]
+    pointwise = [pointwise_ic(loglik,loo) for loglik in blocks]
+    return compare_ic(dict([(key,np.concatenate([p[key] for p in pointwise],axis=-1)) for key in pointwise[0]]))
+
+
+def waic_samples(x,y,trace):
+    """
+    WAIC of the regression y = alpha + beta*x from posterior samples (trace: dictionary with arrays alpha, beta and sigma). See waic_loglik.
+    """
+    return waic_loglik(loglik_blocks(x,y,trace))
+
+
+def conjugate_model(x,y,samples=6000,alpha_mu=0,beta_mu=0,alpha_sd=1,beta_sd=1,sigma_sd=1,n_init=None,randomseed=None):
+    """
+    Linear Bayes regression with a conjugate Normal-Inverse-Gamma prior (an analytic alternative to bayes_model, see conjugate_posterior).
+
+    **Input**
+
+    The same as bayes_model. n_init is not used. randomseed seeds the posterior draws.
+
+    **Output**
+
+    :trace,model: trace is a dictionary with samples independent draws of alpha, beta and sigma. model is a dictionary with 'engine' ('conjugate'), 'stats' (sufficient statistics), 'posterior' (see conjugate_posterior) and 'waic' (see waic_samples).
+
+    The posterior is calculated from the sufficient statistics of x and y, so no sampler is run. Use with model_dfc(bayes_model='conjugate_model'); calc_waic and plot_betadfc_distribution read either model.
+    """
+    x = np.asarray(x,dtype=float)
+    y = np.asarray(y,dtype=float)
+    stats = np.array([len(x),x.sum(),y.sum(),(x*y).sum(),(x*x).sum(),(y*y).sum()])
+    posterior = conjugate_posterior(stats,alpha_mu=alpha_mu,beta_mu=beta_mu,alpha_sd=alpha_sd,beta_sd=beta_sd,sigma_sd=sigma_sd)
+    trace = conjugate_samples(posterior,samples=samples,randomseed=randomseed)
+    waic = waic_samples(tvc_benchmarker.standerdize(x),tvc_benchmarker.standerdize(y),trace)
+    model = {'engine': 'conjugate', 'stats': stats, 'posterior': posterior, 'waic': waic}
+    return trace,model
+
+
+def model_waic(tm):
+    """
+    WAIC of a saved model (a tvc_benchmarker.Trace, or the output of bayes_model, conjugate_model or fast_model). Returns an array starting with WAIC and its standard error.
+
+    For a Trace, WAIC is calculated from the saved pointwise log likelihood, one chunk at a time.
+    """
+    if isinstance(tm,tvc_benchmarker.Trace):
+        return waic_loglik(tm.chunks('loglik'))
+    if isinstance(tm[1],dict) and 'waic' in tm[1]:
+        return np.array(tm[1]['waic'])
+    return np.array(pm.stats.waic(tm[0],tm[1]))
+
+
+def posterior_values(tm,name,burn=0):
+    """
+    Posterior samples of parameter name (alpha, beta or sigma) of a model: a tvc_benchmarker.Trace (see save_model_trace) or the output of bayes_model, conjugate_model or fast_model.
+
+    burn samples are discarded from the start of each chain of a pymc3 trace. The draws of conjugate_model and fast_model are independent, so none are discarded.
+    """
+    if isinstance(tm,tvc_benchmarker.Trace):
+        values = tm[name]
+        if tm.attrs['engine'] != 'pymc3':
+            return values
+        return values.reshape(tm.attrs['chains'],-1)[:,burn:].flatten()
+    if isinstance(tm[0],dict):
+        return tm[0][name]
+    return tm[0][burn:].get_values(name)
+
+
+def trace_samples(tm):
+    """
+    Posterior samples of alpha, beta and sigma of the output of bayes_model, conjugate_model or fast_model, as a dictionary of arrays (chains concatenated), and the number of chains.
+    """
+    if isinstance(tm[0],dict):
+        return dict([(name,np.asarray(tm[0][name])) for name in ['alpha','beta','sigma']]), 1
+    chains = list(tm[0].chains)
+    return dict([(name,np.concatenate([tm[0].get_values(name,chains=[c]) for c in chains])) for name in ['alpha','beta','sigma']]), len(chains)
+
+
+def save_model_trace(path,file_name,tm,x,y,loglik_draws=1000,compression='zlib'):
+    """
+    Saves the output of bayes_model, conjugate_model or fast_model in the trace format (see tvc_benchmarker.save_trace), instead of pickling it.
+
+    **Input**
+
+    :path: path to save.
+    :file_name: file name (.trace is appended).
+    :tm: trace and model (output of bayes_model, conjugate_model or fast_model).
+    :x, y: the data the model was fitted to.
+    :loglik_draws: number of draws (evenly spaced) for which the pointwise log likelihood is saved. WAIC is calculated from these.
+    :compression: see save_trace.
+
+    Saves the samples of alpha, beta and sigma (float64) and the pointwise log likelihood of the standardized data (float32, draws x time points).
+    """
+    if file_name.endswith('.trace') == False:
+        file_name += '.trace'
+    samples, chains = trace_samples(tm)
+    engine = tm[1]['engine'] if isinstance(tm[0],dict) else 'pymc3'
+    draws = np.unique(np.linspace(0,len(samples['beta'])-1,min(loglik_draws,len(samples['beta']))).astype(int))
+    x = tvc_benchmarker.standerdize(np.asarray(x,dtype=float))
+    y = tvc_benchmarker.standerdize(np.asarray(y,dtype=float))
+    loglik = np.concatenate([block.astype(np.float32) for block in loglik_blocks(x,y,dict([(name,v[draws]) for name,v in samples.items()]))],axis=1)
+    variables = dict(samples)
+    variables['loglik'] = loglik
+    tvc_benchmarker.save_trace(path + '/' + file_name,variables,attrs={'engine': engine, 'chains': chains, 'n': len(x)},compression=compression)
+
+
+def load_model(path,file_name):
+    """
+    Opens a saved model: the trace (see save_model_trace) if it exists, which is read lazily, otherwise the pickle of earlier versions (see load_bayes_model).
+    """
+    if file_name.endswith('.trace'):
+        file_name = file_name[:-len('.trace')]
+    if os.path.isdir(path + '/' + file_name + '.trace'):
+        return tvc_benchmarker.load_trace(path + '/' + file_name + '.trace')
+    return load_bayes_model(path,file_name)
+
 
 
 def calc_waic(dfc,model_dir,save_dir,file_prefix=None,mi='alpha',burn=1000):
@@ -107,7 +609,12 @@ def calc_waic(dfc,model_dir,save_dir,file_prefix=None,mi='alpha',burn=1000):
 
     **Returns**
 
-    :waic: (numpy array)
+    :waic: (numpy array) WAIC, WAIC SE and p_WAIC of each method (of the last configuration)
+
+    WAIC and PSIS-LOO of all methods of a configuration are calculated in one pass from the pointwise log likelihood of their traces (see waic_compare), one chunk of time points at a time.
+    The table (waictable) has, per method, WAIC, its SE, the difference from the best method (ΔWAIC) and its SE, LOO, its SE and the largest Pareto k (LOO is unreliable above 0.7).
+    The SE of the WAIC difference of every pair of methods is saved as waicdiffse.
+    Models saved as pickles by earlier versions have no pointwise log likelihood: their WAIC is calculated one model at a time (see model_waic), and the difference SEs and LOO are NaN.
     """
     if file_prefix:
         file_prefix += '_'
@@ -120,37 +627,61 @@ def calc_waic(dfc,model_dir,save_dir,file_prefix=None,mi='alpha',burn=1000):
         params[m] = np.unique(dfc.index.get_level_values(m))
     mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
 
+    methods = list(dfc.columns)
     for sim_it, mi_params in enumerate(mi_parameters):
 
         param_sname = [p[0] + '-' + str(p[1]) for p in list(zip(mi,mi_params))]
         param_sname = '_'.join(param_sname)
         param_sname = '_' + param_sname.replace(' ','')
 
-        for i,method in enumerate(dfc.columns):
-            file_name = file_prefix + 'method-' + method + param_sname
-            tm=tvc_benchmarker.load_bayes_model(model_dir,file_name)
-            wtmp = np.array(pm.stats.waic(tm[0],tm[1]))
-            if i == 0: 
-                waic = np.zeros([len(dfc.columns),len(wtmp)])
-            waic[i,:] = wtmp
-
-        odr=np.argsort(waic[:,0])
-        delta_waic = waic[:,0]-waic[odr[0],0]
+        tms = [tvc_benchmarker.load_model(model_dir,file_prefix + 'method-' + method + param_sname) for method in methods]
+        if all([isinstance(tm,tvc_benchmarker.Trace) for tm in tms]):
+            ic = waic_compare(loglik_chunks(tms))
+        else:
+            waic = np.array([model_waic(tm)[:3] for tm in tms])
+            ic = {'waic': waic[:,0], 'waic_se': waic[:,1], 'p_waic': waic[:,2], 'pairwise_se': np.full([len(methods),len(methods)],np.nan),
+                  'loo': np.full(len(methods),np.nan), 'loo_se': np.full(len(methods),np.nan), 'pareto_k_max': np.full(len(methods),np.nan)}
+            ic['delta_waic'] = ic['waic'] - ic['waic'].min()
+            ic['delta_waic_se'] = np.full(len(methods),np.nan)
+        waic = np.stack([ic['waic'],ic['waic_se'],ic['p_waic']],axis=1)
+        if np.any(ic['pareto_k_max'] > 0.7):
+            print('TVC BENCHMARKER WARNING: Pareto k above 0.7 (' + ', '.join([m for m,k in zip(methods,ic['pareto_k_max']) if k > 0.7]) + param_sname + '). LOO is unreliable for these models.')
+
+        odr=np.argsort(ic['waic'])
 
         #Create table for tabulate
-        tablelst=[["Model","WAIC","WAIC SE","$\Delta$ WAIC"]]
+        tablelst=[["Model","WAIC","WAIC SE",r"$\Delta$ WAIC",r"$\Delta$ WAIC SE","LOO","LOO SE","Pareto k max"]]
         for i in odr:
-            tablelst.append([dfc.columns[i],waic[i,0],waic[i,1],delta_waic[i]])
+            tablelst.append([methods[i],ic['waic'][i],ic['waic_se'][i],ic['delta_waic'][i],ic['delta_waic_se'][i],ic['loo'][i],ic['loo_se'][i],ic['pareto_k_max'][i]])
         #Make markdown table and save
         mdtable = tabulate.tabulate(tablelst,headers="firstrow",tablefmt='simple')
         with open(save_dir + '/' + file_prefix + 'waictable' + param_sname + '.md','w') as f:
             f.write(mdtable)
         f.close()
         print(mdtable)
+        # SE of the pairwise WAIC differences
+        setable = tabulate.tabulate([[methods[i]] + list(ic['pairwise_se'][i,odr]) for i in odr],headers=['Model'] + [methods[i] for i in odr],tablefmt='simple')
+        with open(save_dir + '/' + file_prefix + 'waicdiffse' + param_sname + '.md','w') as f:
+            f.write(setable)
 
     return waic
 
 
+def loglik_chunks(traces):
+    """
+    Yields blocks of the pointwise log likelihood of several traces (models fitted to the same data), of shape (models x samples x time points), one chunk at a time.
+    """
+    shapes = [[c['shape'] for c in tm.meta['loglik']['chunks']] for tm in traces]
+    if all([s == shapes[0] for s in shapes]):
+        for chunks in zip(*[tm.chunks('loglik') for tm in traces]):
+            yield np.stack(chunks)
+    else:
+        # Differently chunked traces (e.g. a different number of saved draws): whole variables
+        loglik = [tm['loglik'] for tm in traces]
+        draws = min([l.shape[0] for l in loglik])
+        yield np.stack([l[np.unique(np.linspace(0,l.shape[0]-1,draws).astype(int))] for l in loglik])
+
+
 def save_bayes_model(path,file_name,tm):
 
     """
@@ -169,9 +700,10 @@ def save_bayes_model(path,file_name,tm):
 
     if file_name.endswith('.pkl') == False:
         file_name += '.pkl'
-    with open(path + '/' + file_name, 'wb') as h:
-        pickle.dump(tm,h)
-    h.close()
+    def write(tmp):
+        with open(tmp, 'wb') as h:
+            pickle.dump(tm,h)
+    tvc_benchmarker.atomic_write(path + '/' + file_name,write)
 
 def load_bayes_model(path,file_name):
 
@@ -196,3 +728,112 @@ def load_bayes_model(path,file_name):
     h.close()
 
     return tm
+
+
+def sufficient_stats(dfc_chunks,y='covariance_parameter'):
+    """
+    Accumulates the sufficient statistics of the regression y = a + b*dfc, one chunk at a time.
+
+    **Input**
+
+    :dfc_chunks: output of tvc_benchmarker.dfc_calc_chunks.
+    :y: name of the dependent variable in the chunks.
+
+    Only time points where all methods have a value are used (as dfc.dropna() in run_simulations).
+
+    **Returns**
+
+    :stats: dictionary (configurations) of dictionaries (methods) with the array [n, sum(x), sum(y), sum(xy), sum(xx), sum(yy)]. x is the dfc estimate.
+    """
+    stats = {}
+    for mi_params, chunk in dfc_chunks:
+        methods = [key for key in chunk if key not in ['time','covariance_parameter','covariance_mean','state_switch']]
+        if mi_params not in stats:
+            stats[mi_params] = {method: np.zeros(6) for method in methods}
+        valid = np.all(np.isfinite(np.array([chunk[method] for method in methods])),axis=0)
+        # Accumulated in float64 (the chunks can be float32)
+        yv = chunk[y][valid].astype(float)
+        for method in methods:
+            xv = chunk[method][valid].astype(float)
+            stats[mi_params][method] += [len(xv),xv.sum(),yv.sum(),(xv*yv).sum(),(xv*xv).sum(),(yv*yv).sum()]
+    return stats
+
+
+def suffstats_regression(stats):
+    """
+    Least squares fit of the standardized regression (as in bayes_model) from sufficient statistics (see sufficient_stats).
+
+    **Returns**
+
+    :fit: dictionary with n, beta (equals the correlation of x and y) and sigma (residual standard deviation). The intercept of the standardized regression is 0.
+    """
+    n,sx,sy,sxy,sxx,syy = stats
+    beta = (sxy-sx*sy/n)/np.sqrt((sxx-sx*sx/n)*(syy-sy*sy/n))
+    # standerdize uses the sample (n-1) standard deviation
+    sigma = np.sqrt((1-beta**2)*(n-1)/n)
+    return {'n': n, 'beta': beta, 'sigma': sigma}
+
+
+def precision_report(simparams,dfc_params,save_dir=None,file_prefix=None,jobs=1):
+    """
+    Quantifies how much the regression results change when a simulation and its DFC estimates are calculated in float32 instead of float64 (see tvc_benchmarker.precision_dtype).
+
+    **Input**
+
+    :simparams: simulation dictionary (as params['simulation'][i]). Simulated in both precisions with the same random seed.
+    :dfc_params: DFC methods (as params['dfc']). See dfc_calc_batch.
+    :save_dir: (optional) where to save the markdown table.
+    :file_prefix: (optional) prefix of the saved table.
+    :jobs: number of processes for the DFC estimates.
+
+    For every configuration and method, the standardized regression of covariance_parameter on the DFC estimate (time points with NaN in any method dropped as in run_simulations) is fitted with conjugate_model. beta is the posterior mean. WAIC and its standard error are calculated from the pointwise log likelihood of the posterior draws (see waic_loglik), not from a point estimate. The draws use the same random seed in both precisions, so the differences only reflect the precision.
+
+    **Returns**
+
+    :report: dataframe with one row per configuration and method: beta, WAIC, the WAIC standard error and the rank of the method by WAIC (within the configuration) in each precision, their differences, and the largest absolute difference between the DFC estimates.
+    """
+    if file_prefix:
+        file_prefix += '_'
+    else:
+        file_prefix = ''
+
+    results = {}
+    for precision in ['float64','float32']:
+        sim = copy.deepcopy(simparams)
+        sim['params']['precision'] = precision
+        mi = sorted(sim['multi_index'])
+        data = tvc_benchmarker.gen_data(sim)
+        config_index = tvc_benchmarker.ConfigIndex(data.index,mi)
+        dfc = tvc_benchmarker.dfc_calc_batch(data,dfc_params,mi=mi,config_index=config_index,jobs=jobs).dropna()
+        dfc_index = tvc_benchmarker.ConfigIndex(dfc.index,mi)
+        results[precision] = {}
+        for mi_params in dfc_index.mi_parameters:
+            time = dfc_index.time[dfc_index.slice(mi_params)]
+            y = config_index.view(data,'covariance_parameter',mi_params,time)
+            for method in dfc.columns:
+                estimates = np.asarray(dfc_index.view(dfc,method,mi_params),dtype=float)
+                trace, model = conjugate_model(estimates,y,randomseed=0)
+                # WAIC from the pointwise log likelihood of the posterior draws
+                waic = waic_loglik(loglik_blocks(tvc_benchmarker.standerdize(estimates),tvc_benchmarker.standerdize(np.asarray(y,dtype=float)),trace))
+                results[precision][mi_params,method] = {'beta': model['posterior']['mean'][1], 'waic': waic[0], 'waic_se': waic[1], 'estimates': estimates}
+
+    rows = []
+    for (mi_params,method), r64 in results['float64'].items():
+        r32 = results['float32'][mi_params,method]
+        row = dict(zip(mi,mi_params))
+        row.update({'method': method,
+                    'beta_float64': r64['beta'], 'beta_float32': r32['beta'], 'beta_difference': r32['beta']-r64['beta'],
+                    'waic_float64': r64['waic'], 'waic_float32': r32['waic'], 'waic_difference': r32['waic']-r64['waic'], 'waic_se_float64': r64['waic_se'], 'waic_se_float32': r32['waic_se'],
+                    'dfc_max_difference': np.max(np.abs(r32['estimates']-r64['estimates']))})
+        rows.append(row)
+    report = pd.DataFrame(rows)
+    for precision in ['float64','float32']:
+        report['rank_' + precision] = report.groupby(mi)['waic_' + precision].rank(method='min').astype(int)
+
+    if save_dir:
+        mdtable = tabulate.tabulate(report,headers='keys',tablefmt='simple',showindex=False)
+        with open(save_dir + '/' + file_prefix + 'precision_report.md','w') as f:
+            f.write(mdtable)
+        print(mdtable)
+
+    return report
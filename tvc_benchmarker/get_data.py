@@ -2,6 +2,11 @@ import numpy as np
 import tvc_benchmarker
 import os
 import pandas as pd
+import functools
+import numbers
+import scipy.fft
+import scipy.stats as sps
+from scipy.signal import lfilter
 
 def load_data(data,colind = None):
     """
@@ -25,7 +30,408 @@ def load_data(data,colind = None):
     return pd.read_csv(tvc_benchmarker.__path__[0] + '/data/data/' + data + '_data.csv',index_col=np.arange(0,colind))
 
 
-def gen_data_sim1(params,mi=None):
+def ar1_filter(w,alpha,x0=None):
+    """
+    Runs the autoregressive recursion x[t] = alpha*x[t-1] + w[t] (with x[0] = w[0]) along the last axis of w.
+
+    *INPUT*
+
+    :w: innovations. Array of shape (configurations, nodes, time).
+    :alpha: auto-correlation. Scalar or array that broadcasts to (configurations, nodes).
+    :x0: (optional) the value of x before w[0]. Continues a recursion from a previous chunk, so that x[0] = alpha*x0 + w[0].
+
+    *RETURNS*
+
+    :x: array with same shape as w.
+
+    All rows that share an alpha value are filtered with a single lfilter call. float32 innovations are filtered in float32, anything else in float64.
+
+    """
+    w = np.asarray(w)
+    dtype = np.float32 if w.dtype == np.float32 else np.float64
+    w = w.astype(dtype,copy=False)
+    alpha = np.broadcast_to(np.asarray(alpha,dtype=float),w.shape[:-1])
+    if x0 is not None:
+        x0 = np.broadcast_to(np.asarray(x0,dtype=dtype),w.shape[:-1])
+    x = np.empty_like(w)
+    for a in np.unique(alpha):
+        rows = alpha == a
+        b_coef = np.array([1.],dtype=dtype)
+        a_coef = np.array([1.,-a],dtype=dtype)
+        if x0 is None:
+            x[rows] = lfilter(b_coef,a_coef,w[rows],axis=-1)
+        else:
+            x[rows] = lfilter(b_coef,a_coef,w[rows],axis=-1,zi=dtype(a)*x0[rows][...,None])[0]
+    return x
+
+
+def coupling_matrix(n_nodes,coupling=None):
+    """
+    Returns which node pairs share the fluctuating covariance.
+
+    *INPUT*
+
+    :n_nodes: number of nodes
+    :coupling: (optional) n_nodes x n_nodes symmetric array. Default couples all pairs (ones off the diagonal).
+
+    *RETURNS*
+
+    :coupling: n_nodes x n_nodes array with zero diagonal.
+
+    """
+    if coupling is None:
+        coupling = np.ones([n_nodes,n_nodes])
+    coupling = np.array(coupling,dtype=float)
+    if coupling.shape != (n_nodes,n_nodes):
+        raise ValueError('coupling must have shape (n_nodes, n_nodes)')
+    np.fill_diagonal(coupling,0)
+    return coupling
+
+
+_coupling_factors = {}
+
+def coupling_eigh(coupling):
+    """
+    Eigendecomposition of a coupling matrix. Cached, as every covariance matrix var*I + covar_t*coupling shares these eigenvectors.
+    """
+    key = (coupling.shape,coupling.tobytes())
+    if key not in _coupling_factors:
+        _coupling_factors[key] = np.linalg.eigh(coupling)
+    return _coupling_factors[key]
+
+
+def node_means(mu,n_nodes,n_samples):
+    """
+    Extends mu (scalar, list of length n_nodes or n_nodes x n_samples) to an n_nodes x n_samples array.
+    """
+    mu = np.array(mu,dtype=float,ndmin=1)
+    if mu.ndim == 1:
+        mu = mu[:,None]
+    try:
+        return np.broadcast_to(mu,(n_nodes,n_samples))
+    except ValueError:
+        raise ValueError('mu must be a scalar, of length n_nodes or of shape (n_nodes, n_samples)')
+
+
+def multivariate_normal_sample(mu,var,covar,z,coupling,sampling='exact'):
+    """
+    Draws from N(mu_t, var*I + covar_t*coupling) for every time point at once.
+
+    *INPUT*
+
+    :mu: mean. Array of shape (configurations, nodes, time).
+    :var: variance. Array of length configurations.
+    :covar: covariance. Array of shape (configurations, time).
+    :z: standard normal draws. Array of shape (configurations, time, nodes). The output has the dtype of z (e.g. float32, see tvc_benchmarker.precision_dtype).
+    :coupling: nodes x nodes array (see coupling_matrix).
+    :sampling: 'exact' or 'fast'.
+
+    With 'exact', every covariance matrix is factorised with a (batched) SVD, the same way np.random.multivariate_normal does it. So the output equals drawing one time point at a time. This costs one SVD per time point.
+    With 'fast', the cached eigendecomposition of the coupling matrix is used. The eigenvalues of each covariance matrix are then var + covar_t*eigenvalues(coupling), so sampling is a single batched matrix product. The output has the same distribution but different values.
+
+    *RETURNS*
+
+    :x: array of shape (configurations, nodes, time).
+
+    """
+    dtype = z.dtype
+    var = np.asarray(var,dtype=dtype).reshape(-1,1)
+    covar = np.asarray(covar,dtype=dtype)
+    coupling = coupling.astype(dtype,copy=False)
+    n_nodes = coupling.shape[0]
+    if sampling == 'exact':
+        x = np.empty(mu.shape,dtype=dtype)
+        # Blocks of time points keep the stacked covariance matrices small
+        block = max(1,2**20 // n_nodes**2)
+        for t in range(0,covar.shape[-1],block):
+            cov = var[...,None,None]*np.eye(n_nodes,dtype=dtype) + covar[:,t:t+block,None,None]*coupling
+            (u,s,vh) = np.linalg.svd(cov)
+            x[...,t:t+block] = np.einsum('cti,ctij->cjt',z[:,t:t+block],np.sqrt(s)[...,None]*vh)
+    elif sampling == 'fast':
+        eigval,eigvec = [v.astype(dtype,copy=False) for v in coupling_eigh(coupling)]
+        scale = np.sqrt(np.abs(var[...,None] + covar[...,None]*eigval))
+        x = np.matmul(scale*z,eigvec.transpose()).transpose([0,2,1])
+    else:
+        raise ValueError('unknown sampling. Must be "exact" or "fast"')
+    return x + np.asarray(mu,dtype=dtype)
+
+
+def sim_output(data,mi,mi_param_list,n_samples,output='dataframe'):
+    """
+    Formats the output of the simulations.
+
+    *INPUT*
+
+    :data: dictionary with 'timeseries' (array of shape configurations x nodes x time) and any other arrays of shape configurations x time.
+    :mi: multi index names
+    :mi_param_list: multi index values
+    :n_samples: length of time series
+    :output: 'dataframe' or 'array'
+
+    *RETURNS*
+
+    If output is 'dataframe', pandas dataframe with one column per node (timeseries_1, timeseries_2, ...) followed by the other arrays.
+    If output is 'array', data with the keys 'multi_index' (mi) and 'index' (the pandas MultiIndex of the flattened configurations and time) added.
+
+    """
+    multi_ind = pd.MultiIndex.from_product((mi_param_list) + [np.arange(0,n_samples)], names=mi + ['time'])
+    if output == 'array':
+        data['multi_index'] = mi
+        data['index'] = multi_ind
+        return data
+    elif output == 'dataframe':
+        columns = {}
+        for n in range(0,data['timeseries'].shape[1]):
+            columns['timeseries_' + str(n+1)] = data['timeseries'][:,n,:].flatten()
+        for key in data:
+            if key != 'timeseries':
+                columns[key] = data[key].flatten()
+        return pd.DataFrame(data=columns, index=multi_ind)
+    else:
+        raise ValueError('unknown output. Must be "dataframe" or "array"')
+
+
+def draw_states(covar_range,state_length,n_samples,sampling='exact',rng=np.random):
+    """
+    Draws the states of simulation 4.
+
+    *INPUT*
+
+    :covar_range: list of possible covariances
+    :state_length: list of possible state durations
+    :n_samples: length of the sequence
+    :sampling: 'exact' draws each state with permutation (as in the 1.0 routine). 'fast' draws all states in bulk.
+    :rng: random number generator (see tvc_benchmarker.config_rng). Default is the global numpy random state.
+
+    *RETURNS*
+
+    :states: covariance mean of each state
+    :durations: duration of each state. The durations sum to at least n_samples.
+
+    """
+    if sampling == 'exact':
+        states = []
+        durations = []
+        total = 0
+        while total<n_samples:
+            states.append(rng.permutation(covar_range)[0])
+            durations.append(rng.permutation(state_length)[0])
+            total += durations[-1]
+    elif sampling == 'fast':
+        # Enough states to cover n_samples even if every state has the shortest duration
+        n_states = int(np.ceil(n_samples/np.min(state_length)))
+        states = rng.choice(covar_range,n_states)
+        durations = rng.choice(state_length,n_states)
+    else:
+        raise ValueError('unknown sampling. Must be "exact" or "fast"')
+    return np.array(states,dtype=float),np.array(durations,dtype=int)
+
+
+def state_sequence(covar_range,state_length,n_samples,sampling='exact',rng=np.random):
+    """
+    Makes the covariance mean of each time point for simulation 4 (see draw_states).
+
+    *RETURNS*
+
+    :covar_mu: array of length n_samples.
+
+    """
+    states,durations = draw_states(covar_range,state_length,n_samples,sampling=sampling,rng=rng)
+    return np.repeat(states,durations)[:n_samples]
+
+
+_hrf_kernels = {}
+_hrf_kernel_ffts = {}
+
+def hrf_kernel(shape='hrf_TR2',TR=2):
+    """
+    Haemodynamic response function sampled every TR. Cached, so each kernel is only built once.
+
+    *INPUT*
+
+    :shape: 'hrf_TR2' (the kernel in data/hrf, sampled at TR=2), 'canonical' (SPM double gamma: peak at 6s, undershoot at 16s, ratio 1/6, 32s long, summing to 1) or a 1D array with the kernel.
+    :TR: repetition time in seconds.
+
+    *RETURNS*
+
+    :key: cache key of the kernel.
+    :kernel: 1D array.
+
+    """
+    if isinstance(shape,str):
+        key = (shape,float(TR))
+    else:
+        shape = np.asarray(shape,dtype=float)
+        key = ('array',shape.tobytes())
+    if key not in _hrf_kernels:
+        if isinstance(shape,np.ndarray):
+            kernel = shape
+        elif shape == 'hrf_TR2':
+            if TR != 2:
+                raise ValueError('hrf_TR2 is sampled at TR=2. Use hrf_kernel="canonical" for other TRs')
+            kernel = np.load(tvc_benchmarker.__path__[0] + '/data/hrf/hrf_TR2.npy')
+        elif shape == 'canonical':
+            t = np.arange(0,32,TR)
+            kernel = sps.gamma.pdf(t,6) - sps.gamma.pdf(t,16)/6
+            kernel /= kernel.sum()
+        else:
+            raise ValueError('unknown hrf_kernel. Must be "hrf_TR2", "canonical" or an array')
+        if kernel.ndim != 1:
+            raise ValueError('hrf_kernel must be one dimensional')
+        _hrf_kernels[key] = kernel
+    return key, _hrf_kernels[key]
+
+
+def hrf_kernel_fft(shape,TR,n_fft):
+    """
+    Real FFT of hrf_kernel(shape,TR) zero padded to n_fft. Cached.
+    """
+    key, kernel = hrf_kernel(shape,TR)
+    if (key,n_fft) not in _hrf_kernel_ffts:
+        _hrf_kernel_ffts[(key,n_fft)] = scipy.fft.rfft(kernel,n=n_fft)
+    return _hrf_kernel_ffts[(key,n_fft)]
+
+
+def event_design(onsets,durations,start,stop):
+    """
+    Stimulus time series for time points start to stop-1.
+
+    *INPUT*
+
+    :onsets: onset of each event/block, in samples.
+    :durations: duration of each event/block in samples. Integer or list with one value per onset. 1 gives an event design.
+    :start, stop: time window.
+
+    *RETURNS*
+
+    :design: 1D array of length stop-start. Overlapping blocks add up.
+
+    """
+    onsets = np.asarray(onsets,dtype=int)
+    ends = onsets + np.broadcast_to(np.asarray(durations,dtype=int),onsets.shape)
+    steps = np.bincount(np.clip(onsets-start,0,stop-start),minlength=stop-start+1) - np.bincount(np.clip(ends-start,0,stop-start),minlength=stop-start+1)
+    return np.cumsum(steps[:-1],dtype=float)
+
+
+def per_node(value,n_nodes,is_shared,name):
+    """
+    Returns a list with one value per node. value is shared by all nodes if is_shared(value), otherwise it must have one entry per node.
+    """
+    if is_shared(value):
+        return [value] * n_nodes
+    if len(value) != n_nodes:
+        raise ValueError(name + ' must be shared by all nodes or have one entry per node')
+    return list(value)
+
+
+def hrf_convolve(params,n_nodes,time=None):
+    """
+    Event/block designs convolved with the HRF (simulation 3 with hrf_onsets).
+
+    *INPUT*
+
+    :params: simulation 3 parameters (see gen_data_sim3).
+    :n_nodes: number of nodes
+    :time: (optional) time points to return. Default returns the entire series.
+
+    *RETURNS*
+
+    :mu: array of shape n_nodes x time.
+
+    Nodes with the same design and kernel are only convolved once. The designs are convolved in batches with overlap-save FFT convolution (short FFT segments, as the kernel is short), using cached kernel FFTs.
+
+    """
+    if time is None:
+        time = np.arange(params['n_samples'])
+    time = np.asarray(time)
+
+    # One design, kernel and TR per node
+    shared_onsets = all(np.isscalar(o) for o in params['hrf_onsets'])
+    onsets = per_node(params['hrf_onsets'],n_nodes,lambda v: shared_onsets,'hrf_onsets')
+    # With shared onsets, a list of durations has one value per onset
+    durations = per_node(params.get('hrf_durations',1),n_nodes,lambda v: np.isscalar(v) or shared_onsets and all(np.isscalar(d) for d in v),'hrf_durations')
+    shapes = per_node(params.get('hrf_kernel','hrf_TR2'),n_nodes,lambda v: isinstance(v,str) or all(isinstance(k,numbers.Number) for k in v),'hrf_kernel')
+    TRs = per_node(params.get('TR',2),n_nodes,np.isscalar,'TR')
+
+    kernel_keys = [hrf_kernel(shapes[n],TRs[n])[0] for n in range(n_nodes)]
+    kernel_length = max(len(hrf_kernel(shapes[n],TRs[n])[1]) for n in range(n_nodes))
+    first = int(time.min())
+    n_out = int(time.max()) + 1 - first
+
+    # Overlap-save: segments of n_fft samples, each giving step new output samples
+    n_fft = scipy.fft.next_fast_len(max(16*kernel_length,1024),real=True)
+    step = n_fft - kernel_length + 1
+    n_segments = -(-n_out // step)
+    start = first - kernel_length + 1
+    stop = start + (n_segments-1)*step + n_fft
+
+    # Unique (design, kernel) combinations
+    node_keys = [(tuple(np.ravel(onsets[n])),tuple(np.ravel(durations[n])),kernel_keys[n]) for n in range(n_nodes)]
+    unique_keys = list(dict.fromkeys(node_keys))
+    first_node = [node_keys.index(k) for k in unique_keys]
+    group = np.array([unique_keys.index(k) for k in node_keys])
+
+    # Convolve blocks of designs, so that the spectra use at most ~256MB
+    conv = np.zeros([len(unique_keys),n_segments,step])
+    block = max(1,2**24//(stop-start))
+    for b in range(0,len(unique_keys),block):
+        nodes = first_node[b:b+block]
+        design = np.zeros([len(nodes),stop-start])
+        for i,n in enumerate(nodes):
+            design[i] = event_design(onsets[n],durations[n],start,stop)
+        segments = np.lib.stride_tricks.sliding_window_view(design,n_fft,axis=-1)[:,::step]
+        spectra = scipy.fft.rfft(segments,axis=-1,workers=-1)
+        spectra *= np.array([hrf_kernel_fft(shapes[n],TRs[n],n_fft) for n in nodes])[:,None]
+        conv[b:b+block] = scipy.fft.irfft(spectra,n=n_fft,axis=-1,workers=-1)[:,:,kernel_length-1:]
+    conv = conv.reshape(len(unique_keys),-1)
+    if len(time) == n_out and np.all(np.diff(time) == 1):
+        conv = conv[:,:n_out]
+    else:
+        conv = conv[:,time-first]
+
+    if len(unique_keys) < n_nodes:
+        conv = conv[group]
+    conv *= params.get('hrf_scale',1)
+    return conv
+
+
+def hrf_mean(params,n_nodes,time=None):
+    """
+    Mean of the time series in simulation 3.
+
+    *INPUT*
+
+    :params: simulation 3 parameters (see gen_data_sim3).
+    :n_nodes: number of nodes
+    :time: (optional) time points to return. Default returns the entire series.
+
+    *RETURNS*
+
+    :mu: array of shape n_nodes x time.
+
+    If params has hrf_onsets, the designs are convolved with the HRF (see hrf_convolve). Otherwise hrf_path is used.
+
+    """
+    if 'hrf_onsets' in params:
+        return hrf_convolve(params,n_nodes,time)
+    if params['hrf_path'] == 'hrf_TR2':
+        hrf_saved = np.load(tvc_benchmarker.__path__[0] + '/data/hrf/hrf_TR2.npy')
+        hrf = np.zeros([n_nodes,len(hrf_saved)+params['hrf_zeropad']])
+        hrf[:,0:len(hrf_saved)]=np.tile(hrf_saved,[n_nodes,1])
+        if time is None:
+            #hrf_ts = [np.tile(hrf, int(params['n_samples'] / hrf.shape[-1])) for n in params['hrf_scale']]
+            return np.tile(hrf, int(params['n_samples'] / hrf.shape[-1])) * params['hrf_scale']
+        return hrf[:,np.asarray(time) % hrf.shape[-1]] * params['hrf_scale']
+    elif os.path.isfile(params['hrf_path']):
+        hrf_ts=np.load(params['hrf_path'],mmap_mode='r')
+    else:
+        hrf_ts=params['hrf_path']
+    if time is None:
+        return np.array(hrf_ts)
+    return np.array(np.asarray(hrf_ts)[...,time])
+
+
+def gen_data_sim1(params,mi=None,output='dataframe',jobs=1):
 
     """
     *INPUT*
@@ -34,9 +440,15 @@ def gen_data_sim1(params,mi=None):
 
     :n_samples: length of time series. Default=10,000
     :alpha: auto-correlation of time series. Can be single integer or np.array with length of mu
-    :mu: Mean of auto-correlated time-series sampled from a multivariate Gaussian distribution. Must be of length 2 or greater.
+    :mu: Mean of auto-correlated time-series sampled from a multivariate Gaussian distribution. Must be of length 2 or greater. The number of nodes is len(mu).
     :sigma: Covariance matrix for multivariate Gaussian distribution. Array or list with shape of (len(mu),len(mu)).
     :randomseed: set random seed
+    :sampling: (optional) 'exact' (default) or 'fast'. 'fast' uses a Cholesky factor of sigma instead of multivariate_normal.
+    :rng: (optional) 'legacy' (default) or 'independent'. See gen_data_sim2.
+    :precision: (optional) 'float64' (default) or 'float32'. See gen_data_sim2.
+
+    output: 'dataframe' (default) or 'array'. See sim_output.
+    jobs: number of processes. See gen_data_sim2.
 
     *LIMITATIONS*
 
@@ -45,38 +457,60 @@ def gen_data_sim1(params,mi=None):
 
     *RETURNS*
 
-    :df: pandas dataframe with timeseries_1, timeseries_2.
+    :df: pandas dataframe with timeseries_1, timeseries_2 (, ... timeseries_N).
 
     """
 
-    np.random.seed(params['randomseed'])
+    if params.get('rng','legacy') == 'legacy':
+        np.random.seed(params['randomseed'])
     # generate data
 
     # Check multiindex and get number of each multiindex
     mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
 
-    x=np.zeros([2, params['n_samples']] + mi_num)
-    x = x.reshape([2,int(np.prod(x.shape)/2)])
+    n_samples = params['n_samples']
+    n_nodes = len(params['mu'])
+
+    dtype = tvc_benchmarker.precision_dtype(params)
+    data = {'timeseries': np.zeros([len(mi_parameters),n_nodes,n_samples],dtype=dtype)}
+    blocks = tvc_benchmarker.config_blocks(len(mi_parameters),params,jobs)
+    block_data = tvc_benchmarker.process_map(functools.partial(sim1_block,params,mi),[[mi_parameters[i] for i in b] for b in blocks],jobs=len(blocks))
+    for b, bd in zip(blocks,block_data):
+        data['timeseries'][b[0]:b[-1]+1] = bd['timeseries']
+
+    return sim_output(data,mi,mi_param_list,n_samples,output=output)
+
 
+def sim1_block(params,mi,mi_parameters):
+    """
+    Generates a block of configurations of simulation 1 (see gen_data_sim1). Returns a dictionary with 'timeseries' (configurations x nodes x time).
+    """
+    sampling = params.get('sampling','exact')
+    n_nodes = len(params['mu'])
+    dtype = tvc_benchmarker.precision_dtype(params)
+
+    # Draw the innovations of every configuration, then run the AR(1) recursion over all of them at once
+    w = np.zeros([len(mi_parameters), n_nodes, params['n_samples']],dtype=dtype)
+    alpha = np.zeros([len(mi_parameters), n_nodes])
     for sim_it, mi_params in enumerate(mi_parameters):
 
         d = dict(params)
         for i in range(0,len(mi)):
             d[mi[i]] = mi_params[i]
 
-        x_start = d['n_samples'] * sim_it
-        x_end = d['n_samples'] * (sim_it + 1)
-        w=np.random.multivariate_normal(d['mu'],d['sigma'],d['n_samples']).transpose()
-        x[:,x_start:x_end] = np.array(w)
-        for t in range(1,d['n_samples']):
-            x[:,(d['n_samples']*sim_it)+t]=d['alpha']*x[:,(d['n_samples']*sim_it)+t-1]+w[:,t]
+        rng = tvc_benchmarker.config_rng(params,'sim-1',mi,mi_params)
+        if sampling == 'exact':
+            w[sim_it] = rng.multivariate_normal(d['mu'],d['sigma'],d['n_samples']).transpose()
+        elif sampling == 'fast':
+            w[sim_it] = (rng.standard_normal([d['n_samples'],n_nodes]) @ np.linalg.cholesky(d['sigma']).transpose() + d['mu']).transpose()
+        else:
+            raise ValueError('unknown sampling. Must be "exact" or "fast"')
+        alpha[sim_it] = d['alpha']
 
-    multi_ind = pd.MultiIndex.from_product((mi_param_list) + [np.arange(0,d['n_samples'])], names=mi + ['time'])
-    df = pd.DataFrame(data={'timeseries_1': x[0,:],'timeseries_2':x[1,:]}, index=multi_ind)
-    return df
+    return {'timeseries': ar1_filter(w,alpha)}
 
 
-def gen_data_sim2(params,mi='alpha'):
+def gen_data_sim2(params,mi='alpha',output='dataframe',sim_name='sim-2',jobs=1):
 
     """
     *INPUT*
@@ -85,38 +519,77 @@ def gen_data_sim2(params,mi='alpha'):
 
     :n_samples: length of time series. Default=10,000
     :alpha: auto-correlation of time series. Can be single integer or np.array with length of mu
-    :mu: Mean of auto-correlated time-series sampled from a multivariate Gaussian distribution. Must be a array/list of length 2 or 2xn_samples.
+    :mu: Mean of auto-correlated time-series sampled from a multivariate Gaussian distribution. Must be a scalar, array/list of length n_nodes or n_nodes x n_samples.
     :var: Variance of the time series. Integer or np.array with length of mu
     :covar_mu: Mean of the covariance of the time series.
     :covar_sigma: Variance of the covariance of the time series.
     :randomseed: set random seed
+    :n_nodes: (optional) number of time series. Default=2
+    :coupling: (optional) n_nodes x n_nodes array of which node pairs share the fluctuating covariance. Default is all pairs.
+    :sampling: (optional) 'exact' (default) or 'fast'. 'exact' reproduces the values of the 1.0 routine. 'fast' uses a cached factor of the covariance matrix and is statistically equivalent. Use 'fast' for many nodes.
+    :rng: (optional) 'legacy' (default) or 'independent'. 'legacy' draws all configurations one after another from np.random seeded with randomseed (as in the 1.0 routine). 'independent' gives each configuration its own random stream (see tvc_benchmarker.config_rng), so any subset of configurations can be generated in any order with identical results.
+    :precision: (optional) 'float64' (default) or 'float32'. dtype of the generation and the output (see tvc_benchmarker.precision_dtype). The random draws are made in float64 (the same stream for both precisions) and rounded to float32, and the AR filters and sampling then run in float32.
 
     Additionally, if there is a multi_index variable, this should be specified differently
 
     :mi: multi_index. list of variable names which have multiple parameters. These parameters should be in a list. E.g. if mi='mu', then mu becomes a list surrounding its contents. e.g. mu=[[0,0],[1,1]]
 
+    output: 'dataframe' (default) or 'array'. See sim_output.
+    sim_name: name of the simulation, used to derive the random streams when rng is 'independent'.
+    jobs: number of processes. The configurations are split into jobs blocks that are generated in parallel. Requires rng='independent' (with 'legacy' the configurations are generated serially). The output is identical for any number of jobs.
+
     *LIMITATIONS*
 
-    As the parameters stand, only 2 time series can be generated (some minor modifications are needed to generate more).
+    All coupled node pairs share the same covariance at each time point.
     Input `var` must be integer and cannot vary between the time series.
 
     *RETURNS*
 
-    :df: pandas dataframe with timeseries_1, timeseries_2, covariance_parameter. Table is multiindexed with alpha and time as the two indexes.
+    :df: pandas dataframe with timeseries_1, timeseries_2 (, ... timeseries_N), covariance_parameter. Table is multiindexed with alpha and time as the two indexes.
 
     """
     # Random seed
-    np.random.seed(params['randomseed'])
+    if params.get('rng','legacy') == 'legacy':
+        np.random.seed(params['randomseed'])
 
     # Check multiindex and get number of each multiindex
     mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
 
+    n_samples = params['n_samples']
+    n_nodes = params.get('n_nodes',2)
+
     # Pre allocate output
-    x=np.zeros([2,params['n_samples']] + mi_num)
-    fluct_cv = np.zeros([params['n_samples']] + mi_num)
+    dtype = tvc_benchmarker.precision_dtype(params)
+    data = {'timeseries': np.zeros([len(mi_parameters),n_nodes,n_samples],dtype=dtype),'covariance_parameter': np.zeros([len(mi_parameters),n_samples],dtype=dtype)}
+    blocks = tvc_benchmarker.config_blocks(len(mi_parameters),params,jobs)
+    block_data = tvc_benchmarker.process_map(functools.partial(sim2_block,params,mi,sim_name=sim_name),[[mi_parameters[i] for i in b] for b in blocks],jobs=len(blocks))
+    for b, bd in zip(blocks,block_data):
+        for key in bd:
+            data[key][b[0]:b[-1]+1] = bd[key]
+
+    if np.any(np.abs(data['covariance_parameter'])>1):
+        print('TVC BENCHMARKER WARNING: some value(s) of r_t>1 or r_t<-1. Consider changing parameters.')
+
+    return sim_output(data,mi,mi_param_list,n_samples,output=output)
+
 
-    x = x.reshape([2,int(np.prod(x.shape)/2)])
-    fluct_cv = fluct_cv.flatten()
+def sim2_block(params,mi,mi_parameters,sim_name='sim-2'):
+    """
+    Generates a block of configurations of simulation 2 or 3 (see gen_data_sim2). Returns a dictionary with 'timeseries' (configurations x nodes x time) and 'covariance_parameter' (configurations x time).
+    """
+    sampling = params.get('sampling','exact')
+    n_samples = params['n_samples']
+    n_nodes = params.get('n_nodes',2)
+    coupling = coupling_matrix(n_nodes,params.get('coupling'))
+    dtype = tvc_benchmarker.precision_dtype(params)
+
+    # Pre allocate the per-configuration parameters
+    mu = np.zeros([len(mi_parameters),n_nodes,n_samples],dtype=dtype)
+    covar_mu = np.zeros([len(mi_parameters),n_samples],dtype=dtype)
+    covar_sigma = np.zeros([len(mi_parameters),1],dtype=dtype)
+    alpha = np.zeros(len(mi_parameters))
+    var = np.zeros(len(mi_parameters))
+    g = np.zeros([len(mi_parameters),n_samples,n_nodes+1],dtype=dtype)
 
     # Set preliminary arguments
     for sim_it, mi_params in enumerate(mi_parameters):
@@ -125,39 +598,26 @@ def gen_data_sim2(params,mi='alpha'):
         for i in range(0,len(mi)):
             d[mi[i]] = mi_params[i]
 
-        # extend mu through timeseries if it is (list of) integers
-        d['mu']=np.array(d['mu'],ndmin=2)
-        if d['mu'].shape[-1]!=d['n_samples']:
-            d['mu']=np.tile(d['mu'].transpose(),d['n_samples'])
+        mu[sim_it] = node_means(d['mu'],n_nodes,n_samples)
+        covar_mu[sim_it] = d['covar_mu']
+        covar_sigma[sim_it] = d['covar_sigma']
+        alpha[sim_it] = d['alpha']
+        var[sim_it] = d['var']
 
-        # extend covar_mu through timeseries if is integer
-        d['covar_mu']=np.array(d['covar_mu'],ndmin=1)
-        if d['covar_mu'].shape[-1]!=d['n_samples']:
-            d['covar_mu']=np.tile(d['covar_mu'].transpose(),d['n_samples'])
+        # Each time point draws one value for the covariance followed by one per node for the observations.
+        # Drawing them all at once gives the same stream as drawing them one time point at a time.
+        g[sim_it] = tvc_benchmarker.config_rng(params,sim_name,mi,mi_params).standard_normal([n_samples,n_nodes+1])
 
-        for t in range(0,d['n_samples']):
-            # At first time point, no autocorrelation of covariance
-            if t==0:
-                covar = np.random.normal(d['covar_mu'][t],d['covar_sigma'])
-            else:
-                covar = np.random.normal(d['covar_mu'][t],d['covar_sigma'])+d['alpha']*fluct_cv[(d['n_samples']*sim_it)+t-1]
-            x[:,(d['n_samples']*sim_it)+t]=np.random.multivariate_normal(d['mu'][:,t], [[d['var'], covar], [covar, d['var']]], 1)
-            fluct_cv[(d['n_samples']*sim_it)+t]=covar
+    # At first time point, no autocorrelation of covariance
+    fluct_cv = ar1_filter(covar_mu + covar_sigma * g[:,:,0],alpha)
+    x = multivariate_normal_sample(mu,var,fluct_cv,g[:,:,1:],coupling,sampling=sampling)
 
-    #x=np.reshape(x,[x.shape[0],np.prod(x.shape[1:])],order='F')
-    #fluct_cv=np.reshape(fluct_cv,[np.prod(fluct_cv.shape)],order='F')
-
-    if any(np.abs(fluct_cv)>1): 
-        print('TVC BENCHMARKER WARNING: some value(s) of r_t>1 or r_t<-1. Consider changing parameters.')
-
-    multi_ind = pd.MultiIndex.from_product((mi_param_list) + [np.arange(0,d['n_samples'])], names=mi + ['time'])
-    df = pd.DataFrame(data={'timeseries_1': x[0,:],'timeseries_2':x[1,:],'covariance_parameter':fluct_cv}, index=multi_ind)
-    return df
+    return {'timeseries': x,'covariance_parameter': fluct_cv}
 
 
 
 
-def gen_data_sim3(params,mi='alpha'):
+def gen_data_sim3(params,mi='alpha',output='dataframe',jobs=1):
 
     """
     *INPUT*
@@ -166,22 +626,34 @@ def gen_data_sim3(params,mi='alpha'):
 
     :n_samples: length of time series. Default=10,000
     :alpha: auto-correlation of time series. Can be single integer or np.array with length of mu
-    :hrf_path: Path to a 2xn_samples numpy array with specified HRF. Or "default" to use one ready-made.
+    :hrf_path: Path to a n_nodes x n_samples numpy array with specified HRF. Or "default" to use one ready-made.
     :hrf_zeropad: add additional zeros to HRF function (periods of rest)
     :hrf_scale: make the hrf bigger/smaller compared to the rest of the signal.
+    :hrf_onsets: (optional) onsets (in samples) of the events or blocks. List shared by all nodes, or list with one list per node. Replaces hrf_path and hrf_zeropad: the mean becomes the design convolved with the HRF.
+    :hrf_durations: (optional) duration (in samples) of each event/block. Integer, list per onset, or one of these per node. Default=1 (event design).
+    :hrf_kernel: (optional) 'hrf_TR2' (default), 'canonical' or an array. Shared or one per node. See hrf_kernel.
+    :TR: (optional) repetition time in seconds for 'canonical'. Shared or one per node. Default=2
     :var: Variance of the time series. Integer or np.array with length of mu
     :covar_mu: Mean of the covariance of the time series.
     :covar_sigma: Variance of the covariance of the time series.
     :randomseed: set random seed
+    :n_nodes: (optional) number of time series. Default=2
+    :coupling: (optional) see gen_data_sim2.
+    :sampling: (optional) 'exact' (default) or 'fast'. See gen_data_sim2.
+    :rng: (optional) 'legacy' (default) or 'independent'. See gen_data_sim2.
+    :precision: (optional) 'float64' (default) or 'float32'. See gen_data_sim2.
+
+    output: 'dataframe' (default) or 'array'. See sim_output.
+    jobs: number of processes. See gen_data_sim2.
 
     *LIMITATIONS*
 
-    As the parameters stand, only 2 time series can be generated (some minor modifications are needed to generate more).
+    All coupled node pairs share the same covariance at each time point.
     Input `var` must be integer and cannot vary between the time series.
 
     *RETURNS*
 
-    :df: pandas dataframe with timeseries_1, timeseries_2, covariance_parameter. Table is multiindexed with alpha and time as the two indexes.
+    :df: pandas dataframe with timeseries_1, timeseries_2 (, ... timeseries_N), covariance_parameter. Table is multiindexed with alpha and time as the two indexes.
 
     """
 
@@ -189,21 +661,13 @@ def gen_data_sim3(params,mi='alpha'):
     #if isinstance(params['hrf_scale'],int):
     #    params['hrf_scale'] = [params['hrf_scale']]
 
-    if params['hrf_path'] == 'hrf_TR2':
-        hrf_saved = np.load(tvc_benchmarker.__path__[0] + '/data/hrf/hrf_TR2.npy')
-        hrf = np.zeros([2,len(hrf_saved)+params['hrf_zeropad']])
-        hrf[:,0:len(hrf_saved)]=np.vstack([hrf_saved,hrf_saved])
-        #hrf_ts = [np.tile(hrf, int(params['n_samples'] / hrf.shape[-1])) for n in params['hrf_scale']]
-        hrf_ts = np.tile(hrf, int(params['n_samples'] / hrf.shape[-1])) * params['hrf_scale']
-    elif os.path.isfile(params['hrf_path']):
-        hrf_ts=np.load(params['hrf_path'])
-    else:
-        hrf_ts=params['hrf_path']
+    n_nodes = params.get('n_nodes',2)
+    hrf_ts = hrf_mean(params,n_nodes)
 
     params['mu'] = hrf_ts
 
 
-    df=gen_data_sim2(params,mi=mi)
+    df=gen_data_sim2(params,mi=mi,output=output,sim_name='sim-3',jobs=jobs)
 
     return df
 
@@ -211,7 +675,7 @@ def gen_data_sim3(params,mi='alpha'):
 
 
 
-def gen_data_sim4(params,mi=None):
+def gen_data_sim4(params,mi=None,output='dataframe',jobs=1):
 
     """
     *INPUT*
@@ -219,36 +683,68 @@ def gen_data_sim4(params,mi=None):
     No input runs the default simulation.
 
     :n_samples: length of time series. Default=10,000
-    :mu: Mean of auto-correlated time-series sampled from a multivariate Gaussian distribution. Must be a array/list of length 2 or 2xn_samples.
+    :mu: Mean of auto-correlated time-series sampled from a multivariate Gaussian distribution. Must be a scalar, array/list of length n_nodes or n_nodes x n_samples.
     :var: Variance of the time series. Integer or np.array with length of mu
     :covar_range: list of possible covariance
     :state_length: List of lists of possible times before covariance changes.
     :state_length_name: Name of each stat
     :randomseed: set random seed
+    :n_nodes: (optional) number of time series. Default=2
+    :coupling: (optional) see gen_data_sim2.
+    :sampling: (optional) 'exact' (default) or 'fast'. 'exact' reproduces the values of the 1.0 routine. 'fast' draws the state sequence in bulk and uses a cached factor of the covariance matrix.
+    :rng: (optional) 'legacy' (default) or 'independent'. See gen_data_sim2.
+    :precision: (optional) 'float64' (default) or 'float32'. See gen_data_sim2.
+
+    output: 'dataframe' (default) or 'array'. See sim_output.
+    jobs: number of processes. See gen_data_sim2.
 
     *LIMITATIONS*
 
-    As the parameters stand, only 2 time series can be generated (some minor modifications are needed to generate more).
+    All coupled node pairs share the same covariance at each time point.
     Input `var` must be integer and cannot vary between the time series.
 
     *RETURNS*
 
-    :df: pandas dataframe with timeseries_1, timeseries_2, covariance_parameter. Table is multiindexed with alpha and time as the two indexes.
+    :df: pandas dataframe with timeseries_1, timeseries_2 (, ... timeseries_N), covariance_parameter, covariance_mean, state_switch. state_switch is 1 at the time points where covariance_mean changes. Table is multiindexed with state_length and time as the two indexes.
 
     """
 
     # Random seed
-    np.random.seed(params['randomseed'])
+    if params.get('rng','legacy') == 'legacy':
+        np.random.seed(params['randomseed'])
 
     # Check multiindex and get number of each multiindex
     mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
 
+    n_samples = params['n_samples']
+    n_nodes = params.get('n_nodes',2)
+
     # Pre allocate output
-    x=np.zeros([2,params['n_samples']] + mi_num)
-    x = x.reshape([2,int(np.prod(x.shape)/2)])
+    dtype = tvc_benchmarker.precision_dtype(params)
+    data = {'timeseries': np.zeros([len(mi_parameters),n_nodes,n_samples],dtype=dtype),'covariance_parameter': np.zeros([len(mi_parameters),n_samples],dtype=dtype),'covariance_mean': np.zeros([len(mi_parameters),n_samples],dtype=dtype),'state_switch': np.zeros([len(mi_parameters),n_samples],dtype=int)}
+    blocks = tvc_benchmarker.config_blocks(len(mi_parameters),params,jobs)
+    block_data = tvc_benchmarker.process_map(functools.partial(sim4_block,params,mi),[[mi_parameters[i] for i in b] for b in blocks],jobs=len(blocks))
+    for b, bd in zip(blocks,block_data):
+        for key in bd:
+            data[key][b[0]:b[-1]+1] = bd[key]
+
+    return sim_output(data,mi,mi_param_list,n_samples,output=output)
 
-    fluct_cv = np.zeros([params['n_samples']*len(mi_parameters)])
-    fluct_cv_state= np.zeros([params['n_samples']*len(mi_parameters)])
+
+def sim4_block(params,mi,mi_parameters):
+    """
+    Generates a block of configurations of simulation 4 (see gen_data_sim4). Returns a dictionary with 'timeseries' (configurations x nodes x time), 'covariance_parameter', 'covariance_mean' and 'state_switch' (configurations x time).
+    """
+    sampling = params.get('sampling','exact')
+    n_samples = params['n_samples']
+    n_nodes = params.get('n_nodes',2)
+    coupling = coupling_matrix(n_nodes,params.get('coupling'))
+    dtype = tvc_benchmarker.precision_dtype(params)
+
+    # Pre allocate output
+    x = np.zeros([len(mi_parameters),n_nodes,n_samples],dtype=dtype)
+    fluct_cv = np.zeros([len(mi_parameters),n_samples],dtype=dtype)
+    fluct_cv_state = np.zeros([len(mi_parameters),n_samples],dtype=dtype)
 
     # Set preliminary arguments
     for sim_it, mi_params in enumerate(mi_parameters):
@@ -257,43 +753,139 @@ def gen_data_sim4(params,mi=None):
         for i in range(0,len(mi)):
             d[mi[i]] = mi_params[i]
 
+        rng = tvc_benchmarker.config_rng(params,'sim-4',mi,mi_params)
+        fluct_cv_state[sim_it] = state_sequence(d['covar_range'],d['state_length'],d['n_samples'],sampling=sampling,rng=rng)
 
+        # One value for the covariance and one per node for the observations at each time point
+        g = rng.standard_normal([1,d['n_samples'],n_nodes+1]).astype(dtype,copy=False)
+        fluct_cv[sim_it] = fluct_cv_state[sim_it] + dtype.type(d['covar_sigma']) * g[0,:,0]
+        x[sim_it] = multivariate_normal_sample(node_means(d['mu'],n_nodes,n_samples)[None],d['var'],fluct_cv[[sim_it]],g[:,:,1:],coupling,sampling=sampling)[0]
 
-        # extend mu through timeseries if it is (list of) integers
-        d['mu']=np.array(d['mu'],ndmin=2)
-        if d['mu'].shape[-1]!=d['n_samples']:
-            d['mu']=np.tile(d['mu'].transpose(),d['n_samples'])
-
-        covar_mu=np.array([])
-        while len(covar_mu)<d['n_samples']:
-            new_covariance = np.random.permutation(d['covar_range'])[0]
-            covariance_length = np.random.permutation(d['state_length'])[0]
-            covar_mu = np.hstack([covar_mu,np.tile(new_covariance,covariance_length)])
+    # Time points where the covariance mean changes
+    state_switch = np.zeros(fluct_cv_state.shape,dtype=int)
+    state_switch[:,1:] = np.diff(fluct_cv_state,axis=-1) != 0
 
-        covar_mu=covar_mu[:d['n_samples']]
-        fluct_cv_state[(d['n_samples']*sim_it):(d['n_samples']*(sim_it+1))]=covar_mu
-        for t in range(0,d['n_samples']):
-            covar = np.random.normal(covar_mu[t],d['covar_sigma'])
-            x[:,(d['n_samples']*sim_it)+t]=np.random.multivariate_normal(d['mu'][:,t],[[d['var'],covar],[covar,d['var']]],1)
-            fluct_cv[(d['n_samples']*sim_it)+t]=covar
+    return {'timeseries': x,'covariance_parameter': fluct_cv,'covariance_mean': fluct_cv_state,'state_switch': state_switch}
 
-    # Reshape for pandas dataframe
-    x=np.reshape(x,[x.shape[0],np.prod(x.shape[1:])],order='F')
-    fluct_cv=np.reshape(fluct_cv,[np.prod(fluct_cv.shape)],order='F')
-    fluct_cv_state=np.reshape(fluct_cv_state,[np.prod(fluct_cv_state.shape)],order='F')
-    multi_ind = pd.MultiIndex.from_product((mi_param_list + [np.arange(0,d['n_samples'])]), names=mi + ['time'])
-    df = pd.DataFrame(data={'timeseries_1': x[0,:],'timeseries_2':x[1,:],'covariance_parameter':fluct_cv,'covariance_mean':fluct_cv_state}, index=multi_ind)
 
-    return df
-
-
-def gen_data(simparams):
+def gen_data(simparams,output='dataframe',jobs=1):
     """
     gen_data calls gen_data_sim1, gen_data_sim2, gen_data_sim3, or gen_data_sim4 given a dictionary of parameter inputs.
     See documentation add ...add link here... to get the documentation of correct dicitonary structure.
+
+    output: 'dataframe' (default) or 'array'. See sim_output.
+    jobs: number of processes. See gen_data_sim2.
     """
 
 
     simulations={'sim-1':tvc_benchmarker.gen_data_sim1,'sim-2':tvc_benchmarker.gen_data_sim2,'sim-3':tvc_benchmarker.gen_data_sim3,'sim-4':tvc_benchmarker.gen_data_sim4}
-    df = simulations[simparams['name']](simparams['params'],mi=simparams['multi_index'])
+    df = simulations[simparams['name']](simparams['params'],mi=simparams['multi_index'],output=output,jobs=jobs)
     return df
+
+
+def time_slice(value,n_samples,start,stop):
+    """
+    Returns value[...,start:stop] if the last axis of value is time (length n_samples). Otherwise value.
+    """
+    value = np.asarray(value)
+    if value.ndim>0 and value.shape[-1] == n_samples:
+        return value[...,start:stop]
+    return value
+
+
+def gen_data_chunks(simparams,chunk_size=10000):
+    """
+    Generator version of gen_data. Yields the simulation one configuration and chunk_size time points at a time, so memory is bounded by chunk_size rather than n_samples.
+
+    *INPUT*
+
+    :simparams: dictionary of parameter inputs (same as gen_data).
+    :chunk_size: number of time points per chunk.
+
+    *YIELDS*
+
+    :mi_params: the multi index values of the configuration (tuple). List values (e.g. state_length of sim-4) are given as tuples.
+    :chunk: dictionary with 'time' (time points of the chunk), 'timeseries' (nodes x time) and, depending on the simulation, 'covariance_parameter', 'covariance_mean' and 'state_switch'.
+
+    The AR and covariance processes continue across chunk boundaries and the random draws are made in the same order as gen_data. So concatenating the chunks gives the same values as gen_data(simparams,output='array').
+
+    """
+    params = dict(simparams['params'])
+    name = simparams['name']
+    if name not in ['sim-1','sim-2','sim-3','sim-4']:
+        raise ValueError('unknown simulation. Input must be  "sim-1", "sim-2", "sim-3" or "sim-4"')
+
+    if params.get('rng','legacy') == 'legacy':
+        np.random.seed(params['randomseed'])
+
+    # Check multiindex and get number of each multiindex
+    mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,simparams['multi_index'])
+
+    sampling = params.get('sampling','exact')
+    dtype = tvc_benchmarker.precision_dtype(params)
+    n_samples = params['n_samples']
+    if name == 'sim-1':
+        n_nodes = len(params['mu'])
+    else:
+        n_nodes = params.get('n_nodes',2)
+        coupling = coupling_matrix(n_nodes,params.get('coupling'))
+
+    for sim_it, mi_params in enumerate(mi_parameters):
+
+        d = dict(params)
+        for i in range(0,len(mi)):
+            d[mi[i]] = mi_params[i]
+
+        rng = tvc_benchmarker.config_rng(params,name,mi,mi_params)
+        # Hashable (list values, e.g. state_length of sim-4, as tuples), so it can key dictionaries of the chunk consumers
+        config = tuple([tuple(v) if isinstance(v,list) else v for v in mi_params])
+        if name == 'sim-1' and sampling == 'fast':
+            factor = np.linalg.cholesky(d['sigma'])
+        if name == 'sim-4':
+            states,durations = draw_states(d['covar_range'],d['state_length'],n_samples,sampling=sampling,rng=rng)
+            state_end = np.cumsum(durations)
+            last_state = None
+
+        x_last = None
+        cv_last = None
+        for start in range(0,n_samples,chunk_size):
+            stop = min(start+chunk_size,n_samples)
+            time = np.arange(start,stop)
+            chunk = {'time': time}
+
+            if name == 'sim-1':
+                if sampling == 'exact':
+                    w = rng.multivariate_normal(d['mu'],d['sigma'],stop-start).transpose()
+                elif sampling == 'fast':
+                    w = (rng.standard_normal([stop-start,n_nodes]) @ factor.transpose() + d['mu']).transpose()
+                else:
+                    raise ValueError('unknown sampling. Must be "exact" or "fast"')
+                chunk['timeseries'] = ar1_filter(w.astype(dtype,copy=False),d['alpha'],x0=x_last)
+                x_last = chunk['timeseries'][:,-1]
+
+            else:
+                if name == 'sim-3':
+                    mu = hrf_mean(d,n_nodes,time)
+                else:
+                    mu = node_means(time_slice(d['mu'],n_samples,start,stop),n_nodes,stop-start)
+                g = rng.standard_normal([1,stop-start,n_nodes+1]).astype(dtype,copy=False)
+                if name == 'sim-4':
+                    covar_mu = states[np.searchsorted(state_end,time,side='right')].astype(dtype,copy=False)
+                    fluct_cv = covar_mu + dtype.type(d['covar_sigma']) * g[0,:,0]
+                    # Time points where the covariance mean changes
+                    state_switch = np.zeros(len(time),dtype=int)
+                    state_switch[1:] = np.diff(covar_mu) != 0
+                    if last_state is not None:
+                        state_switch[0] = covar_mu[0] != last_state
+                    last_state = covar_mu[-1]
+                else:
+                    covar_mu = np.asarray(time_slice(d['covar_mu'],n_samples,start,stop),dtype=dtype)
+                    fluct_cv = ar1_filter(covar_mu + dtype.type(d['covar_sigma']) * g[0,:,0],d['alpha'],x0=cv_last)
+                    cv_last = fluct_cv[-1]
+                chunk['timeseries'] = multivariate_normal_sample(mu[None],d['var'],fluct_cv[None],g[:,:,1:],coupling,sampling=sampling)[0]
+                chunk['covariance_parameter'] = fluct_cv
+                if name == 'sim-4':
+                    chunk['covariance_mean'] = covar_mu
+                    chunk['state_switch'] = state_switch
+
+            yield config, chunk
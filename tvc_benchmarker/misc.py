@@ -1,15 +1,22 @@
 import scipy.stats as sps
 import numpy as np
+import pandas as pd
 import matplotlib.pyplot as plt
 import matplotlib.colors as mcolors
 import json
 import os
 import tvc_benchmarker
 import itertools
+import hashlib
+import concurrent.futures
+import time
+import tracemalloc
+import tempfile
+from multiprocessing import shared_memory
 
 
 def standerdize(x):
-    return (x-x.mean())/(x.std())
+    return (x-x.mean())/(x.std(ddof=1))
 
 
 def square_axis(ax):
@@ -131,6 +138,281 @@ def multiindex_preproc(params,mi):
     return mi,mi_num,mi_parameters,mi_param_list
 
 
+class ConfigIndex:
+    """
+    Row positions of every configuration in a dataframe from gen_data (or a DFC dataframe with the same index).
+
+    Built once from the index. The values of a configuration are then a slice of the column's NumPy array (a view, not a copy), instead of a label lookup.
+
+    **Input**
+
+    :index: index of the dataframe.
+    :mi: multi index names. Default: all index levels except time.
+
+    **Attributes**
+
+    :mi, mi_num, mi_parameters, mi_param_list: as returned by multiindex_preproc, with the values of each level in the order they first occur in the index. Configurations are numbered in the order of mi_parameters.
+    :start, stop: arrays with the first row and the last row + 1 of each configuration.
+    :time: time point of every row (None if the index has no time level).
+
+    The rows of each configuration must be contiguous. The parameter values can be in any order (e.g. gen_data with alpha=[0.5,0], or after sort_index()), as the configurations are numbered in the order of the index.
+    Configurations can have different lengths (e.g. after dropna) or be missing (zero rows). array() also needs the configurations in the order of mi_parameters (the order gen_data returns them).
+    """
+
+    def __init__(self,index,mi=None):
+        if mi is None:
+            mi = [n for n in index.names if n != 'time' and n is not None]
+        if isinstance(mi,str):
+            mi = [mi]
+        if isinstance(index,pd.MultiIndex):
+            # Levels can keep values that no longer occur (e.g. after dropping a configuration)
+            index = index.remove_unused_levels()
+        params = {}
+        for m in mi:
+            params[m] = np.asarray(index.get_level_values(m).unique())
+        self.mi,self.mi_num,self.mi_parameters,self.mi_param_list = multiindex_preproc(params,mi)
+
+        # Configuration number of every row
+        config = np.zeros(len(index),dtype=int)
+        for m, n in zip(self.mi,self.mi_num):
+            if isinstance(index,pd.MultiIndex):
+                level = index.names.index(m)
+                codes, levels = index.codes[level], index.levels[level]
+            else:
+                codes, levels = pd.factorize(index)
+            position = dict([(v,j) for j,v in enumerate(params[m])])
+            config = config*n + np.array([position[v] for v in levels],dtype=int)[codes]
+        # First row of each run of rows with the same configuration
+        runs = np.flatnonzero(np.diff(config,prepend=-1) != 0)
+        if len(np.unique(config[runs])) != len(runs):
+            raise ValueError('the rows of each configuration must be contiguous. Use sort_index()')
+
+        self.start = np.zeros(len(self.mi_parameters),dtype=int)
+        self.stop = np.zeros(len(self.mi_parameters),dtype=int)
+        self.start[config[runs]] = runs
+        self.stop[config[runs]] = np.append(runs[1:],len(config))
+        self.configs = dict([(p,i) for i,p in enumerate(self.mi_parameters)])
+        self.time = np.asarray(index.get_level_values('time')) if 'time' in index.names else None
+
+    def __len__(self):
+        return len(self.mi_parameters)
+
+    def slice(self,mi_params):
+        """
+        Rows of a configuration (mi_params is a tuple of mi_parameters or a configuration number).
+        """
+        i = mi_params if isinstance(mi_params,(int,np.integer)) else self.configs[mi_params]
+        return slice(self.start[i],self.stop[i])
+
+    def view(self,data,column,mi_params,time=None):
+        """
+        Values of column for one configuration, as a view of the column.
+
+        If time is given, returns the values at these time points instead (a copy). Time points must be sorted within configurations.
+        """
+        values = np.asarray(data[column])[self.slice(mi_params)]
+        if time is None:
+            return values
+        return values[np.searchsorted(self.time[self.slice(mi_params)],time)]
+
+    def array(self,data,column):
+        """
+        Values of column for all configurations, as a view of shape (configurations, time). All configurations must have the same length.
+        """
+        lengths = self.stop - self.start
+        if np.any(lengths != lengths[0]) or self.stop[-1]-self.start[0] != len(data):
+            raise ValueError('configurations have different lengths')
+        if np.any(np.diff(self.start) < 0):
+            raise ValueError('the configurations are not in the order of mi_parameters. Use sort_index()')
+        return np.asarray(data[column]).reshape(len(self),-1)
+
+
+def config_rng(params,sim_name,mi,mi_params):
+    """
+    Random number generator for one simulation configuration.
+
+    **Input**
+
+    :params: simulation parameters. params['rng'] (optional) is 'legacy' (default) or 'independent'.
+    :sim_name: name of the simulation (e.g. 'sim-2')
+    :mi: multi index names
+    :mi_params: multi index values of the configuration
+
+    **Returns**
+
+    If params['rng'] is 'legacy': np.random, i.e. the global random state (seeded once with params['randomseed']). Each configuration then depends on the draws of the configurations before it.
+    If params['rng'] is 'independent': a np.random.Generator with its own child stream. The stream is derived from params['randomseed'], sim_name and the multi index values of the configuration, so it does not depend on which other configurations are generated or in what order.
+    """
+    rng = params.get('rng','legacy')
+    if rng == 'legacy':
+        return np.random
+    elif rng == 'independent':
+        key = sim_name + '/' + '_'.join([p[0] + '-' + str(p[1]) for p in zip(mi,mi_params)])
+        spawn_key = tuple(np.frombuffer(hashlib.sha256(key.encode()).digest(),dtype=np.uint32).tolist())
+        return np.random.Generator(np.random.PCG64(np.random.SeedSequence(params['randomseed'],spawn_key=spawn_key)))
+    else:
+        raise ValueError('unknown rng. Must be "legacy" or "independent"')
+
+
+def unit_seed(randomseed,key):
+    """
+    Random seed of one unit of work (e.g. one model fit), derived from randomseed and the string key. The seed does not depend on which other units run or in what order.
+    """
+    spawn_key = tuple(np.frombuffer(hashlib.sha256(key.encode()).digest(),dtype=np.uint32).tolist())
+    return int(np.random.SeedSequence(randomseed,spawn_key=spawn_key).generate_state(1)[0])
+
+
+def atomic_write(path,write):
+    """
+    Writes a file atomically. write(tmp_path) writes a temporary file in the same directory, which is then renamed to path, so other processes never see a partially written file.
+    """
+    directory, name = os.path.split(path)
+    fd, tmp = tempfile.mkstemp(prefix='.' + name + '.',dir=directory or '.')
+    os.close(fd)
+    try:
+        write(tmp)
+        os.replace(tmp,path)
+    except BaseException:
+        if os.path.exists(tmp):
+            os.remove(tmp)
+        raise
+
+
+def precision_dtype(params):
+    """
+    Storage dtype of simulated values and DFC estimates.
+
+    **Input**
+
+    :params: simulation parameters. params['precision'] (optional) is 'float64' (default) or 'float32'.
+
+    **Returns**
+
+    :dtype: np.dtype. With 'float32', the simulations (AR filters and sampling) and DFC methods run in float32. The random draws are made in float64 and rounded, and window sums, FFTs, jackknife sums and the regression statistics are accumulated in float64.
+    """
+    precision = params.get('precision','float64')
+    if precision not in ['float64','float32']:
+        raise ValueError('unknown precision. Must be "float64" or "float32"')
+    return np.dtype(precision)
+
+
+def config_blocks(n_configs,params,jobs=1):
+    """
+    Splits the configurations of a simulation into (at most) jobs contiguous blocks.
+
+    **Input**
+
+    :n_configs: number of configurations
+    :params: simulation parameters
+    :jobs: number of processes
+
+    **Returns**
+
+    :blocks: list of arrays of configuration indexes.
+
+    With params['rng'] == 'legacy', each configuration depends on the random draws of the ones before it, so a single block is returned.
+    """
+    if jobs>1 and params.get('rng','legacy') == 'legacy':
+        print('TVC BENCHMARKER WARNING: rng is "legacy", so configurations are generated serially. Set rng to "independent" to use jobs>1.')
+        jobs = 1
+    return np.array_split(np.arange(n_configs),min(jobs,n_configs))
+
+
+def limit_blas_threads(threads=1):
+    """
+    Limits the number of threads used by BLAS/OpenMP in the current process (run in each worker of process_map, so that jobs workers do not each start one thread per core).
+
+    Uses threadpoolctl if it is installed. The environment variables are also set, for libraries that are loaded later.
+    """
+    for var in ['OMP_NUM_THREADS','OPENBLAS_NUM_THREADS','MKL_NUM_THREADS','VECLIB_MAXIMUM_THREADS','NUMEXPR_NUM_THREADS']:
+        os.environ[var] = str(threads)
+    try:
+        import threadpoolctl
+    except ImportError:
+        return
+    threadpoolctl.threadpool_limits(threads)
+
+
+def process_map(func,iterable,jobs=1,blas_threads=1):
+    """
+    Generator version of map(func,iterable). With jobs>1, func is called in a pool of jobs processes (func must be picklable), each limited to blas_threads BLAS threads (see limit_blas_threads).
+
+    Results are yielded in the order of iterable, as they become available.
+    """
+    if jobs <= 1:
+        for item in iterable:
+            yield func(item)
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=jobs,initializer=limit_blas_threads,initargs=(blas_threads,)) as pool:
+            for result in pool.map(func,iterable):
+                yield result
+
+
+def measure(func,*args,untraced_timing=False,**kwargs):
+    """
+    Calls func(*args,**kwargs) once and measures its cost.
+
+    The call is timed with tracemalloc running, so the peak memory comes from the same call. Tracing slows down code that makes many small Python allocations (NumPy code on large arrays much less), so the times include that overhead (cost['traced'] is True).
+
+    **Input**
+
+    :untraced_timing: if True, func is called a second time without tracing, and the times are taken from that call (cost['traced'] is False). Only for functions without side effects, as they run twice.
+
+    **Returns**
+
+    :result: output of func (of the timed call).
+    :cost: dictionary with wall_time and cpu_time (seconds, cpu_time of all threads of this process), peak_memory (bytes allocated at the peak of the call, above what was allocated before it, as traced by tracemalloc; includes NumPy arrays) and traced (whether the times include the tracing overhead).
+    """
+    tracing = tracemalloc.is_tracing()
+    if not tracing:
+        tracemalloc.start()
+    tracemalloc.reset_peak()
+    memory = tracemalloc.get_traced_memory()[0]
+    try:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        result = func(*args,**kwargs)
+        cost = {'wall_time': time.perf_counter()-wall, 'cpu_time': time.process_time()-cpu}
+        cost['peak_memory'] = tracemalloc.get_traced_memory()[1]-memory
+    finally:
+        if not tracing:
+            tracemalloc.stop()
+    cost['traced'] = True
+    if untraced_timing and not tracing:
+        wall = time.perf_counter()
+        cpu = time.process_time()
+        result = func(*args,**kwargs)
+        cost.update({'wall_time': time.perf_counter()-wall, 'cpu_time': time.process_time()-cpu, 'traced': False})
+    return result, cost
+
+
+def shared_array(shape,dtype='float64'):
+    """
+    Allocates an array in shared memory, so that workers of process_map can read and write it without it being pickled.
+
+    **Returns**
+
+    :shm: the multiprocessing.shared_memory.SharedMemory. The caller must call shm.close() and shm.unlink() when done.
+    :array: array of the given shape and dtype using the shared memory (uninitialised).
+    :spec: (name, shape, dtype) to pass to attach_shared in the workers.
+    """
+    dtype = np.dtype(dtype)
+    shm = shared_memory.SharedMemory(create=True,size=max(int(np.prod(shape))*dtype.itemsize,1))
+    array = np.ndarray(shape,dtype=dtype,buffer=shm.buf)
+    return shm, array, (shm.name,tuple(shape),dtype.str)
+
+
+def attach_shared(spec):
+    """
+    Attaches to an array created by shared_array (in another process). spec is (name, shape, dtype).
+
+    Returns shm and array. Call shm.close() (and not unlink) when done, after deleting array.
+    """
+    name, shape, dtype = spec
+    shm = shared_memory.SharedMemory(name=name)
+    return shm, np.ndarray(shape,dtype=dtype,buffer=shm.buf)
+
+
 def load_params(in_str):
 
     if os.path.isfile(tvc_benchmarker.__path__[0] + '/data/routine_params/' + str(in_str) + '.json'):
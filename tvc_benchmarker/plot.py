@@ -9,7 +9,7 @@ plt.style.use('seaborn-whitegrid')
 
 
 
-def plot_timeseries(x,plot_autocorr='no',fig_dir=None,fig_prefix=None,cm='Set2',limitaxis=100,mi='alpha'):
+def plot_timeseries(x,plot_autocorr='no',fig_dir=None,fig_prefix=None,cm='Set2',limitaxis=100,mi='alpha',config_index=None):
 
 
     if isinstance(mi,str):
@@ -26,14 +26,13 @@ def plot_timeseries(x,plot_autocorr='no',fig_dir=None,fig_prefix=None,cm='Set2',
     if not os.path.exists(fig_dir):
         os.makedirs(fig_dir,exist_ok=True)
 
-    params = {}
-    for m in mi:
-        params[m] = np.unique(x.index.get_level_values(m))
-    mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
+    if config_index is None:
+        config_index = tvc_benchmarker.ConfigIndex(x.index,mi)
+    mi = config_index.mi
 
     colormap=tvc_benchmarker.get_discrete_colormap(cm)
 
-    for sim_it, mi_params in enumerate(mi_parameters):
+    for sim_it, mi_params in enumerate(config_index.mi_parameters):
 
         param_sname = [p[0] + '-' + str(p[1]) for p in list(zip(mi,mi_params))]
         param_sname = '_'.join(param_sname)
@@ -44,21 +43,18 @@ def plot_timeseries(x,plot_autocorr='no',fig_dir=None,fig_prefix=None,cm='Set2',
         param_title = ','.join(param_title)
         param_title = param_title.replace(' ','').replace(',',', ')
 
-        if mi_params == ():
-            mi_params = np.arange(0,len(x))
-
         if plot_autocorr == 'no':
 
             fig,ax=plt.subplots(1)
-            ax.plot(np.arange(1,limitaxis+1),x['timeseries_1'][mi_params][:limitaxis],color=colormap(0),alpha=0.9,linewidth=2)
-            ax.plot(np.arange(1,limitaxis+1),x['timeseries_2'][mi_params][:limitaxis],color=colormap(1),alpha=0.9,linewidth=2)
+            ax.plot(np.arange(1,limitaxis+1),config_index.view(x,'timeseries_1',mi_params)[:limitaxis],color=colormap(0),alpha=0.9,linewidth=2)
+            ax.plot(np.arange(1,limitaxis+1),config_index.view(x,'timeseries_2',mi_params)[:limitaxis],color=colormap(1),alpha=0.9,linewidth=2)
             ax.set_xlim(1,limitaxis)
             ax.set_ylabel('Signal Amplitude')
             ax.set_xlabel('Time')
 
         else:
 
-            autocorrelation = np.array([tvc_benchmarker.autocorr(x[ts][mi_params]) for ts in ['timeseries_1','timeseries_2']])
+            autocorrelation = np.array([tvc_benchmarker.autocorr(config_index.view(x,ts,mi_params)) for ts in ['timeseries_1','timeseries_2']])
 
             fig=plt.figure()
             ax=[]
@@ -67,8 +63,8 @@ def plot_timeseries(x,plot_autocorr='no',fig_dir=None,fig_prefix=None,cm='Set2',
                 ax.append(plt.subplot2grid((2,3),(1,n)))
 
             # Plot 1: raw time series
-            ax[0].plot(np.arange(1,limitaxis+1),x['timeseries_1'][mi_params][:limitaxis],color=colormap(0),alpha=0.9,linewidth=2)
-            ax[0].plot(np.arange(1,limitaxis+1),x['timeseries_2'][mi_params][:limitaxis],color=colormap(1),alpha=.9,linewidth=2)
+            ax[0].plot(np.arange(1,limitaxis+1),config_index.view(x,'timeseries_1',mi_params)[:limitaxis],color=colormap(0),alpha=0.9,linewidth=2)
+            ax[0].plot(np.arange(1,limitaxis+1),config_index.view(x,'timeseries_2',mi_params)[:limitaxis],color=colormap(1),alpha=.9,linewidth=2)
             ax[0].set_xlim(1,limitaxis)
             ax[0].set_ylabel('Signal Amplitude')
             ax[0].set_xlabel('Time')
@@ -84,7 +80,7 @@ def plot_timeseries(x,plot_autocorr='no',fig_dir=None,fig_prefix=None,cm='Set2',
 
             # Plot 4: correlation of timeseries 1 and 2
             cmap = sns.cubehelix_palette(start=1/3, light=1, as_cmap=True)
-            ax[3] = sns.kdeplot(x['timeseries_1'][mi_params], x['timeseries_2'][mi_params], shade=True,cmap=cmap)
+            ax[3] = sns.kdeplot(config_index.view(x,'timeseries_1',mi_params), config_index.view(x,'timeseries_2',mi_params), shade=True,cmap=cmap)
             ax[3].set_xlabel('Signal 1 amplitude')
             ax[3].set_ylabel('Signal 2 amplitude')
 
@@ -96,7 +92,7 @@ def plot_timeseries(x,plot_autocorr='no',fig_dir=None,fig_prefix=None,cm='Set2',
 
     plt.close('all')
 
-def plot_method_correlation(dfc, cmap='RdBu_r', fig_dir=None, fig_prefix=None, mi=[]):
+def plot_method_correlation(dfc, cmap='RdBu_r', fig_dir=None, fig_prefix=None, mi=[],config_index=None):
 
 
     if isinstance(mi,str):
@@ -113,12 +109,11 @@ def plot_method_correlation(dfc, cmap='RdBu_r', fig_dir=None, fig_prefix=None, m
     if not os.path.exists(fig_dir):
         os.makedirs(fig_dir,exist_ok=True)
 
-    params = {}
-    for m in mi:
-        params[m] = np.unique(dfc.index.get_level_values(m))
-    mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
+    if config_index is None:
+        config_index = tvc_benchmarker.ConfigIndex(dfc.index,mi)
+    mi = config_index.mi
 
-    for sim_it, mi_params in enumerate(mi_parameters):
+    for sim_it, mi_params in enumerate(config_index.mi_parameters):
 
         param_sname = [p[0] + '-' + str(p[1]) for p in list(zip(mi,mi_params))]
         param_sname = '_'.join(param_sname)
@@ -129,14 +124,13 @@ def plot_method_correlation(dfc, cmap='RdBu_r', fig_dir=None, fig_prefix=None, m
         param_title = ','.join(param_title)
         param_title = param_title.replace(' ','').replace(',',', ')
 
-        if mi_params == ():
-            mi_params = np.arange(0,len(dfc))
-
         R=np.zeros([len(dfc.columns),len(dfc.columns)])
         for i,m1 in enumerate(sorted(dfc.columns)):
             for j,m2 in enumerate(sorted(dfc.columns)):
-                notnan = np.intersect1d(np.where(np.isnan(dfc[m1][mi_params])==0),np.where(np.isnan(dfc[m2][mi_params])==0))
-                R[i,j]= sps.spearmanr(dfc[m1][mi_params][notnan],dfc[m2][mi_params][notnan])[0]
+                dfc1 = config_index.view(dfc,m1,mi_params)
+                dfc2 = config_index.view(dfc,m2,mi_params)
+                notnan = (np.isnan(dfc1)==0) & (np.isnan(dfc2)==0)
+                R[i,j]= sps.spearmanr(dfc1[notnan],dfc2[notnan])[0]
 
 
         fig,ax=plt.subplots(1)
@@ -159,7 +153,7 @@ def plot_method_correlation(dfc, cmap='RdBu_r', fig_dir=None, fig_prefix=None, m
 
 
 
-def plot_dfc_timeseries(dfc, limitaxis=500, cm='Set2', fig_dir = None, fig_prefix=None,mi=[]):
+def plot_dfc_timeseries(dfc, limitaxis=500, cm='Set2', fig_dir = None, fig_prefix=None,mi=[],config_index=None):
 
     if isinstance(mi,str):
         mi = [mi]
@@ -175,14 +169,13 @@ def plot_dfc_timeseries(dfc, limitaxis=500, cm='Set2', fig_dir = None, fig_prefi
     if not os.path.exists(fig_dir):
         os.makedirs(fig_dir,exist_ok=True)
 
-    params = {}
-    for m in mi:
-        params[m] = np.unique(dfc.index.get_level_values(m))
-    mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
+    if config_index is None:
+        config_index = tvc_benchmarker.ConfigIndex(dfc.index,mi)
+    mi = config_index.mi
 
     colormap=tvc_benchmarker.get_discrete_colormap(cm)
 
-    for sim_it, mi_params in enumerate(mi_parameters):
+    for sim_it, mi_params in enumerate(config_index.mi_parameters):
 
         param_sname = [p[0] + '-' + str(p[1]) for p in list(zip(mi,mi_params))]
         param_sname = '_'.join(param_sname)
@@ -193,14 +186,11 @@ def plot_dfc_timeseries(dfc, limitaxis=500, cm='Set2', fig_dir = None, fig_prefi
         param_title = ','.join(param_title)
         param_title = param_title.replace(' ','').replace(',',', ')
 
-        if mi_params == ():
-            mi_params = np.arange(0,len(dfc))
-
         fig,ax=plt.subplots(len(dfc.columns), 1, sharex=True,figsize=(5,len(dfc.columns)*2))
 
         for i,dfc_method in enumerate(sorted(dfc.columns)):
 
-            ax[i].plot(dfc[dfc_method][mi_params][:limitaxis].values,color=colormap(i),alpha=0.5,linewidth=2)
+            ax[i].plot(config_index.view(dfc,dfc_method,mi_params)[:limitaxis],color=colormap(i),alpha=0.5,linewidth=2)
             ax[i].set_ylabel('DFC ('+ dfc_method + ')')
             ax[i].get_yaxis().set_major_locator(LinearLocator(numticks=5))
             ax[i].set_xlim(1,limitaxis)
@@ -256,7 +246,7 @@ def plot_betadfc_distribution(dfc, dat_dir, fig_dir = None, model_prefix=None, b
         beta_col = []
         lines = []
         for i,method in enumerate(sorted(dfc.columns)):
-            beta_dfc=tvc_benchmarker.load_bayes_model(dat_dir,model_prefix + 'method-' + method + param_sname)[0][burn:].get_values('beta')
+            beta_dfc=tvc_benchmarker.posterior_values(tvc_benchmarker.load_model(dat_dir,model_prefix + 'method-' + method + param_sname),'beta',burn)
             #Plot
             ltmp = ax[i].hist(beta_dfc,np.arange(-1,1,0.001),histtype='stepfilled',color=colormap(i),normed=True,alpha=0.4, linewidth=2,label=method)
             lines.append(ltmp)
@@ -283,7 +273,7 @@ def plot_betadfc_distribution(dfc, dat_dir, fig_dir = None, model_prefix=None, b
 
 
 
-def plot_fluctuating_covariance(x, fig_dir = None, lags=10,limitaxis=500,cm = 'Set2',mi='alpha', fig_prefix=None):
+def plot_fluctuating_covariance(x, fig_dir = None, lags=10,limitaxis=500,cm = 'Set2',mi='alpha', fig_prefix=None,config_index=None):
 
 #    if labels == None:
 #        labels=np.unique(x.index.get_level_values(mi))
@@ -302,14 +292,13 @@ def plot_fluctuating_covariance(x, fig_dir = None, lags=10,limitaxis=500,cm = 'S
     if not os.path.exists(fig_dir):
         os.makedirs(fig_dir,exist_ok=True)
 
-    params = {}
-    for m in mi:
-        params[m] = np.unique(x.index.get_level_values(m))
-    mi,mi_num,mi_parameters,mi_param_list = tvc_benchmarker.multiindex_preproc(params,mi)
+    if config_index is None:
+        config_index = tvc_benchmarker.ConfigIndex(x.index,mi)
+    mi = config_index.mi
 
     colormap=tvc_benchmarker.get_discrete_colormap(cm)
 
-    for sim_it, mi_params in enumerate(mi_parameters):
+    for sim_it, mi_params in enumerate(config_index.mi_parameters):
 
         param_sname = [p[0] + '-' + str(p[1]) for p in list(zip(mi,mi_params))]
         param_sname = '_'.join(param_sname)
@@ -320,10 +309,7 @@ def plot_fluctuating_covariance(x, fig_dir = None, lags=10,limitaxis=500,cm = 'S
         param_title = ','.join(param_title)
         param_title = param_title.replace(' ','').replace(',',', ')
 
-        if mi_params == ():
-            mi_params = np.arange(0,len(x))
-
-        covariance_autocorrelation = tvc_benchmarker.autocorr(x['covariance_parameter'][mi_params],lags=lags)
+        covariance_autocorrelation = tvc_benchmarker.autocorr(config_index.view(x,'covariance_parameter',mi_params),lags=lags)
 
         # Create grid
         fig = plt.figure()
@@ -332,20 +318,20 @@ def plot_fluctuating_covariance(x, fig_dir = None, lags=10,limitaxis=500,cm = 'S
         ax.append(plt.subplot2grid((2,2),(1,0)))
         ax.append(plt.subplot2grid((2,2),(1,1)))
 
-        ax[0].plot(np.arange(1,limitaxis+1),x['covariance_parameter'][mi_params][:limitaxis],color=colormap(0),alpha=0.5,linewidth=2)
+        ax[0].plot(np.arange(1,limitaxis+1),config_index.view(x,'covariance_parameter',mi_params)[:limitaxis],color=colormap(0),alpha=0.5,linewidth=2)
         ax[0].set_xlabel('Time')
         ax[0].set_ylabel(r'Covariance ($r_t$)')
 
-        ymin = x['covariance_parameter'][mi_params][:limitaxis].min()
-        ymax = x['covariance_parameter'][mi_params][:limitaxis].max()
+        ymin = config_index.view(x,'covariance_parameter',mi_params)[:limitaxis].min()
+        ymax = config_index.view(x,'covariance_parameter',mi_params)[:limitaxis].max()
         ax[0].axis([1,limitaxis+1,np.around(ymin-0.05,1),np.around(ymax+0.05,1)])
 
 
-        ax[1].hist(x['covariance_parameter'][mi_params],np.arange(-.1,1,0.02),color=colormap(1),alpha=0.9,linewidth=0,histtype='stepfilled',normed='true')
+        ax[1].hist(config_index.view(x,'covariance_parameter',mi_params),np.arange(-.1,1,0.02),color=colormap(1),alpha=0.9,linewidth=0,histtype='stepfilled',normed='true')
         ax[1].set_xlabel('Covariance')
         ax[1].set_ylabel('Frequency')
-        xmin = x['covariance_parameter'][mi_params].min()
-        xmax = x['covariance_parameter'][mi_params].max()
+        xmin = config_index.view(x,'covariance_parameter',mi_params).min()
+        xmax = config_index.view(x,'covariance_parameter',mi_params).max()
         ax[1].axis([np.around(xmin-0.05,1),np.around(xmax+0.05,1),0,np.ceil(ax[1].get_ylim()[-1])])
 
         tvc_benchmarker.square_axis(ax[1])
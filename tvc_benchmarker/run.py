@@ -6,10 +6,11 @@ import numpy as np
 
 # TODO add usesaved for stats
 
-def run_simulations(routine_version=1.0,usesaved='yes',new_method=None,params_new_method=None,output_dir=None):
+def run_simulations(routine_version=1.0,usesaved='yes',new_method=None,params_new_method=None,output_dir=None,jobs=1,precision=None,profile=None,cache_size=2**30,stats_mode='full'):
 
     """
 
+    :new_method: function or list of functions. See tvc_benchmarker.calc_new_method. Functions declared with tvc_benchmarker.batch_method are called once for all configurations of a simulation.
     :params_new_method: a dictionary parameter file or path to json file containing parameter file.
         :params['dfc'][method_index]: where method_index is a stringed integer. So the first method is always params['dfc']['0']
         e.g.
@@ -28,10 +29,19 @@ def run_simulations(routine_version=1.0,usesaved='yes',new_method=None,params_ne
 
         If only one method is used, the ['dfc']['0'] can be dropped.
 
+    :jobs: number of processes used to calculate the DFC estimates when usesaved='no' (see dfc_calc_batch) and to fit the models (see model_dfc). The DFC estimates do not depend on jobs, nor do the models if params['stats']['trace'] contains randomseed.
+    :precision: (optional) 'float64' or 'float32'. When usesaved='no', sets the precision of all simulations (see tvc_benchmarker.precision_dtype): the simulated data, DFC estimates and saved csv files are then float32. The statistics are calculated in float64. Default: the precision in the simulation parameters (float64 if not given). See tvc_benchmarker.precision_report for how much the results change.
+    The model used for the statistics is params['stats']['bayes_model'] (optional): 'bayes_model' (pymc3 sampling, default) or 'conjugate_model' (analytic Normal-Inverse-Gamma posterior). See tvc_benchmarker.model_dfc.
+    :cache_size: maximum size in bytes of the model cache ([output_dir]/cache/models/). Models whose data, parameters and package version did not change since an earlier run are copied from it instead of fitted (see model_dfc). 0 disables the cache.
+    :stats_mode: 'full' (default): the models are fitted with params['stats']['bayes_model'] (see above). 'fast': the models are fitted with tvc_benchmarker.fast_model (Laplace approximation, or ADVI if params['stats']['fast']['method'] is 'advi'), which falls back to NUTS for a model whose approximation fails its diagnostics. For screening runs; use 'full' for final results. params['stats']['fast'] (optional) holds further parameters of fast_model (e.g. k_threshold).
+    :profile: (optional) list of n_samples. If given, the cost (wall time, cpu time, peak memory) of every DFC method and new method is measured for each simulation at these time series lengths, and saved with its scaling fit next to the WAIC tables (see tvc_benchmarker.profile_methods).
 
     """
 
 
+    if stats_mode not in ['full','fast']:
+        raise ValueError('unknown stats_mode. Must be "full" or "fast"')
+
     # Load parameters for the simulation routine for specified version
     loaded = 0
     if os.path.isfile(tvc_benchmarker.__path__[0] + '/data/routine_params/' + str(routine_version) + '.json'):
@@ -78,6 +88,7 @@ def run_simulations(routine_version=1.0,usesaved='yes',new_method=None,params_ne
     table_dir = output_dir + '/tables/'
     dat_dir = output_dir + '/data/'
     stat_dir = output_dir + '/stats/'
+    cache_dir = output_dir + '/cache/models/' if cache_size else None
 
     os.makedirs(fig_dir,exist_ok=True)
     os.makedirs(table_dir,exist_ok=True)
@@ -85,6 +96,14 @@ def run_simulations(routine_version=1.0,usesaved='yes',new_method=None,params_ne
     os.makedirs(stat_dir,exist_ok=True)
 
 
+    # Model fitted to each method and configuration
+    if stats_mode == 'fast':
+        model_function = 'fast_model'
+        model_params = dict(params['stats']['trace'],**params['stats'].get('fast',{}))
+    else:
+        model_function = params['stats'].get('bayes_model','bayes_model')
+        model_params = params['stats']['trace']
+
     for sim_i in range(0,len(params['simulation'])):
 
         sim = params['simulation'][sim_i]
@@ -95,22 +114,26 @@ def run_simulations(routine_version=1.0,usesaved='yes',new_method=None,params_ne
         # Load saved data or calculate again
         if usesaved == 'yes':
             data = tvc_benchmarker.load_data(sim['name'],len(sim['multi_index'])+1)
+            # Position of each configuration in data (and in dfc, which has the same index)
+            config_index = tvc_benchmarker.ConfigIndex(data.index,sim['multi_index'])
             dfc = tvc_benchmarker.dfc_calc(sim['name'],colind=len(sim['multi_index'])+1)
         else:
             multi_index = list([sim['params'][n] for n in sim['multi_index']])
             multi_index_labels = list(sim['multi_index'])
             #ind = pd.MultiIndex.from_product((multi_index) + [np.arange(0,sim['params']['n_samples'])], names=multi_index_labels + ['time'])
+            if precision:
+                sim['params']['precision'] = precision
             data = tvc_benchmarker.gen_data(sim)
-            dfc = pd.DataFrame(index=data.index)
-            for dfc_i in range(0,len(params['dfc'])):
-                calcdfc = tvc_benchmarker.dfc_calc(data,methods=params['dfc'][dfc_i]['method'],**params['dfc'][dfc_i]['params'],mi=multi_index_labels)
-                dfc[params['dfc'][dfc_i]['name']]  = calcdfc.values
+            # Position of each configuration in data (and in dfc, which has the same index)
+            config_index = tvc_benchmarker.ConfigIndex(data.index,sim['multi_index'])
+            # All dfc methods in one pass. A list of windows/taper properties gives one column per variant (e.g. SW-15), named after the method
+            dfc = tvc_benchmarker.dfc_calc_batch(data,params['dfc'],mi=multi_index_labels,config_index=config_index,jobs=jobs)
 
 
         # Run the newly entered method(s)
         if new_method:
             for i,nm in enumerate(new_method):
-                dfc_new = tvc_benchmarker.calc_new_method(data,nm,params_new_method['dfc'][i])
+                dfc_new = tvc_benchmarker.calc_new_method(data,nm,params_new_method['dfc'][i],config_index=config_index)
                 dfc[params_new_method['dfc'][i]['name']] = dfc_new
         # Save dfc estimates
         dfc.to_csv(dat_dir + sim['name'] + '_dfc.csv')
@@ -119,17 +142,20 @@ def run_simulations(routine_version=1.0,usesaved='yes',new_method=None,params_ne
         # Stats and plotting
         if sim['name'] == 'sim-1':
 
-            tvc_benchmarker.plot_timeseries(data,plot_autocorr='yes',mi=[],fig_dir=fig_dir,fig_prefix=sim['name'])
-            tvc_benchmarker.plot_dfc_timeseries(dfc,mi=[],fig_dir=fig_dir,fig_prefix=sim['name'])
-            tvc_benchmarker.plot_method_correlation(dfc,mi=[],fig_dir=fig_dir,fig_prefix=sim['name'])
+            tvc_benchmarker.plot_timeseries(data,plot_autocorr='yes',mi=[],fig_dir=fig_dir,fig_prefix=sim['name'],config_index=config_index)
+            tvc_benchmarker.plot_dfc_timeseries(dfc,mi=[],fig_dir=fig_dir,fig_prefix=sim['name'],config_index=config_index)
+            tvc_benchmarker.plot_method_correlation(dfc,mi=[],fig_dir=fig_dir,fig_prefix=sim['name'],config_index=config_index)
 
         elif sim['name'] == 'sim-2' or sim['name'] == 'sim-3' or sim['name'] == 'sim-4':
 
 
-            tvc_benchmarker.plot_timeseries(data,plot_autocorr='no',fig_dir=fig_dir,fig_prefix=sim['name'],mi=sim['multi_index'])
-            tvc_benchmarker.plot_fluctuating_covariance(data,fig_dir=fig_dir,fig_prefix=sim['name'],mi=sim['multi_index'])
+            tvc_benchmarker.plot_timeseries(data,plot_autocorr='no',fig_dir=fig_dir,fig_prefix=sim['name'],mi=sim['multi_index'],config_index=config_index)
+            tvc_benchmarker.plot_fluctuating_covariance(data,fig_dir=fig_dir,fig_prefix=sim['name'],mi=sim['multi_index'],config_index=config_index)
             dfc=dfc.dropna()
-            tvc_benchmarker.model_dfc(data,dfc,stat_dir,sim['name'],mi=sim['multi_index'],model_params=params['stats']['trace'])
+            tvc_benchmarker.model_dfc(data,dfc,stat_dir,sim['name'],mi=sim['multi_index'],bayes_model=model_function,model_params=model_params,config_index=config_index,jobs=jobs,cache_dir=cache_dir,cache_size=cache_size)
             tvc_benchmarker.calc_waic(dfc,model_dir=stat_dir,save_dir=table_dir,file_prefix=sim['name'],burn=params['stats']['burn'],mi=sim['multi_index'])
 
             tvc_benchmarker.plot_betadfc_distribution(dfc,dat_dir=stat_dir,fig_dir=fig_dir,model_prefix=sim['name'],burn=params['stats']['burn'],mi=sim['multi_index'])
+
+        if profile:
+            tvc_benchmarker.profile_methods(sim,params['dfc'],n_samples=profile,new_method=new_method,params_new_method=params_new_method,save_dir=table_dir,file_prefix=sim['name'])
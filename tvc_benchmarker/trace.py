@@ -0,0 +1,126 @@
+import numpy as np
+import json
+import os
+import shutil
+import tempfile
+import zlib
+
+# Format of the trace directories written by save_trace. Increase TRACE_VERSION when the layout changes.
+TRACE_FORMAT = 'tvc_benchmarker.trace'
+TRACE_VERSION = 1
+
+
+def save_trace(path,variables,attrs=None,compression='zlib',chunk_size=2**20):
+    """
+    Saves arrays (e.g. posterior samples and the pointwise log likelihood) in the trace format.
+
+    **Input**
+
+    :path: directory to write (by convention ending with .trace). Replaced if it exists.
+    :variables: dictionary of arrays.
+    :attrs: (optional) dictionary of JSON serializable values (e.g. the engine of the model).
+    :compression: 'zlib' or None. Compressed chunks are byte-shuffled before compression (the bytes of each value are grouped by position, which compresses floating point values better). Uncompressed chunks are .npy files and are memory-mapped when read.
+    :chunk_size: approximate number of values per chunk. Arrays are split along their last axis (e.g. the time points of the log likelihood), so a chunk holds all samples of a range of time points.
+
+    The directory contains meta.json (format, version, attrs, and the shape, dtype and chunks of each variable) and one file per chunk. It is written to a temporary directory first and then renamed to path.
+    """
+    if compression not in ['zlib',None]:
+        raise ValueError('unknown compression. Must be "zlib" or None')
+    directory, name = os.path.split(os.path.abspath(path))
+    tmp = tempfile.mkdtemp(prefix='.' + name + '.',dir=directory)
+    try:
+        meta = {'format': TRACE_FORMAT, 'version': TRACE_VERSION, 'compression': compression, 'attrs': attrs or {}, 'variables': {}}
+        for key, value in variables.items():
+            value = np.asarray(value)
+            length = value.shape[-1] if value.ndim else 1
+            step = max(1,chunk_size // max(1,int(np.prod(value.shape[:-1]))))
+            chunks = []
+            for k, start in enumerate(range(0,max(length,1),step)):
+                chunk = np.ascontiguousarray(value[...,start:start+step] if value.ndim else value)
+                file_name = key + '.' + str(k) + ('.npy' if compression is None else '.z')
+                if compression is None:
+                    np.save(os.path.join(tmp,file_name),chunk)
+                else:
+                    shuffled = chunk.view(np.uint8).reshape(-1,chunk.dtype.itemsize).transpose().tobytes()
+                    with open(os.path.join(tmp,file_name),'wb') as f:
+                        f.write(zlib.compress(shuffled))
+                chunks.append({'file': file_name, 'shape': list(chunk.shape)})
+            meta['variables'][key] = {'shape': list(value.shape), 'dtype': value.dtype.str, 'chunks': chunks}
+        with open(os.path.join(tmp,'meta.json'),'w') as f:
+            json.dump(meta,f)
+        # Swap the new directory in
+        if os.path.exists(path):
+            old = tempfile.mkdtemp(prefix='.' + name + '.old.',dir=directory)
+            os.rename(path,os.path.join(old,name))
+            os.rename(tmp,path)
+            shutil.rmtree(old)
+        else:
+            os.rename(tmp,path)
+    except BaseException:
+        shutil.rmtree(tmp,ignore_errors=True)
+        raise
+
+
+class Trace:
+    """
+    Lazy reader of a trace saved by save_trace. Only meta.json is read when the trace is opened. A variable is read when it is accessed, one chunk at a time with chunks().
+
+    **Input**
+
+    :path: trace directory.
+
+    **Attributes**
+
+    :version: format version of the trace.
+    :attrs: dictionary of attributes saved with the trace.
+    :variables: names of the saved variables.
+
+    trace[name] returns the whole variable (a read-only memory map if it is uncompressed and has one chunk).
+    """
+
+    def __init__(self,path):
+        self.path = path
+        with open(os.path.join(path,'meta.json')) as f:
+            meta = json.load(f)
+        if meta.get('format') != TRACE_FORMAT:
+            raise ValueError(path + ' is not a tvc_benchmarker trace')
+        if meta['version'] > TRACE_VERSION:
+            raise ValueError(path + ' has trace format version ' + str(meta['version']) + '. Update tvc_benchmarker to read it')
+        self.version = meta['version']
+        self.compression = meta['compression']
+        self.attrs = meta['attrs']
+        self.meta = meta['variables']
+        self.variables = list(self.meta)
+
+    def __contains__(self,name):
+        return name in self.meta
+
+    def __getitem__(self,name):
+        chunks = list(self.chunks(name))
+        if len(chunks) == 1:
+            # Scalars are saved as one chunk of shape (1,)
+            return chunks[0].reshape(self.meta[name]['shape'])
+        return np.concatenate(chunks,axis=-1)
+
+    def chunks(self,name):
+        """
+        Yields the chunks of variable name (split along its last axis).
+        """
+        if name not in self.meta:
+            raise KeyError(name + ' is not in the trace')
+        dtype = np.dtype(self.meta[name]['dtype'])
+        for chunk in self.meta[name]['chunks']:
+            file_name = os.path.join(self.path,chunk['file'])
+            if self.compression is None:
+                yield np.load(file_name,mmap_mode='r')
+            else:
+                with open(file_name,'rb') as f:
+                    shuffled = np.frombuffer(zlib.decompress(f.read()),dtype=np.uint8)
+                yield shuffled.reshape(dtype.itemsize,-1).transpose().copy().view(dtype).reshape(chunk['shape'])
+
+
+def load_trace(path):
+    """
+    Opens a trace saved by save_trace (see Trace). Nothing but meta.json is read until a variable is accessed.
+    """
+    return Trace(path)